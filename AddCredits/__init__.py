@@ -3,16 +3,18 @@ import json
 import os
 import azure.functions as func
 from ..shared.services.credit_service import CreditService
-from ..shared.auth.middleware import AuthMiddleware
+from ..shared.auth.middleware import get_auth_middleware
+from ..shared.services.config_service import get_config
 
 async def main(req: func.HttpRequest) -> func.HttpResponse:
   try:
-      # Initialize auth middleware
-      auth_middleware = AuthMiddleware(
-          tenant=str(os.environ.get('REACT_APP_B2C_TENANT')),
-          client_id=str(os.environ.get('REACT_APP_B2C_CLIENT_ID')),
-          user_flow=str(os.environ.get('REACT_APP_B2C_USER_FLOW')),
-          tenant_id=str(os.environ.get('REACT_APP_B2C_TENANT_ID'))
+      # Worker-level auth middleware (cached JWKS keys and validated tokens)
+      config = await get_config()
+      auth_middleware = get_auth_middleware(
+          tenant=str(config.b2c_tenant),
+          client_id=str(config.b2c_client_id),
+          user_flow=str(config.b2c_user_flow),
+          tenant_id=str(config.b2c_tenant_id)
       )
 
       # Validate token
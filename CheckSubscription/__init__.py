@@ -7,7 +7,6 @@ import stripe
 from datetime import datetime
 from ..shared.services.cosmos_service import CosmosService
 from ..shared.auth.decorator import require_auth
-stripe.api_key = os.environ.get('REACT_APP_STRIPE_SECRET_KEY')
 
 @require_auth
 async def main(req: func.HttpRequest) -> func.HttpResponse:
@@ -1,11 +1,16 @@
+import asyncio
 import logging
 import json
 import azure.functions as func
 from azure.storage.blob import BlobServiceClient
 from azure.identity import DefaultAzureCredential
 import os
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError
 from ..shared.auth.decorator import require_auth
 from ..shared.services.cosmos_service import CosmosService
+from ..shared.services.blob_transfer import delete_derivatives
+from ..shared.services.client_pool import get_client_pool
+from ..shared.services.config_service import get_config
 from urllib.parse import unquote  
 
 @require_auth
@@ -46,22 +51,28 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
 
-        # Delete story from Cosmos DB
+        # Delete story from Cosmos DB, only if it is unchanged since it was read (its blobs are deleted below)
         logging.info(f"Deleting story with ID: {story_id}")
-        deleted = await cosmos_service.delete_story(story_id, user_id)
+        try:
+            deleted = await cosmos_service.delete_story(story_id, user_id, etag=story.get("_etag"))
+        except CosmosAccessConditionFailedError:
+            return func.HttpResponse(
+                json.dumps({"error": "Story was modified while deleting; please retry"}),
+                status_code=409,
+                mimetype="application/json"
+            )
         if not deleted:
             return func.HttpResponse(
-                json.dumps({"error": "Failed to delete story"}),
-                status_code=500,
+                json.dumps({"error": "Story not found or unauthorized"}),
+                status_code=404,
                 mimetype="application/json"
             )
 
         # Delete associated blobs using managed identity
         try:
-            account_name = os.environ["ACCOUNT_NAME"]
+            account_name = (await get_config()).account_name
             blob_service_url = f"https://{account_name}.blob.core.windows.net"
-            credential = DefaultAzureCredential()
-            blob_service_client = BlobServiceClient(blob_service_url, credential=credential) 
+            blob_service_client = get_client_pool().get_blob_service_client(account_url=blob_service_url)
 
             # Delete story text blobs
             story_container = blob_service_client.get_container_client("storyfairy-stories")
@@ -76,17 +87,25 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
 
             # Delete image blobs
             image_container = blob_service_client.get_container_client("storyfairy-images")
+            image_blob_names = []
             for image in story.get("images", []):
                 if image.get("imageUrl"):
                     image_blob_name = unquote(image["imageUrl"].split("/")[-1].split("?")[0])
+                    image_blob_names.append(image_blob_name)
                     image_container.delete_blob(image_blob_name)
 
             # Delete cover images
             for cover in story.get("coverImages", {}).values():
                 if cover.get("url"):
                     cover_blob_name = unquote(cover["url"].split("/")[-1].split("?")[0])
+                    image_blob_names.append(cover_blob_name)
                     image_container.delete_blob(cover_blob_name)
 
+            # Delete thumbnails and on-demand resized derivatives of those images
+            for image_blob_name in image_blob_names:
+                deleted = await asyncio.to_thread(delete_derivatives, blob_service_client, image_blob_name)
+                logging.info(f"Deleted {deleted} derivatives of {image_blob_name}")
+
         except Exception as e:
             logging.error(f"Error deleting blobs: {str(e)}")
             # Continue even if blob deletion fails
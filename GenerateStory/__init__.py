@@ -15,11 +15,19 @@ import replicate
 from dotenv import load_dotenv
 import pytz
 from concurrent.futures import ThreadPoolExecutor
-from dataclasses import dataclass
-from typing import Any, Dict
-from shared.auth.decorator import require_auth
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+from ..shared.auth.decorator import require_auth
 from ..shared.auth.middleware import AuthMiddleware
 from ..shared.services.cosmos_service import CosmosService
+from ..shared.services.client_pool import get_client_pool
+from ..shared.services.config_service import Config, get_config
+from ..shared.services.llm_providers import GeminiProvider, GrokProvider, LLMProvider, OpenAIProvider
+from ..shared.services.image_providers import IMAGE_PROVIDERS, generate_image, image_provider_stats
+from ..shared.services.blob_transfer import store_generated_image, thumbnail_urls
+from ..shared.services.pipeline import Stage, StageError, StagePipeline
+from ..shared.services.story_events import StoryEventStream
+from ..shared.services.story_jobs import JobTracker, get_job_queue, new_job
 from azure.ai.contentsafety import ContentSafetyClient
 from azure.ai.contentsafety.models import AnalyzeTextOptions, TextCategory
 from azure.core.credentials import AzureKeyCredential
@@ -39,23 +47,6 @@ STORY_CONTAINER_NAME = "storyfairy-stories"
 IMAGE_CONTAINER_NAME = "storyfairy-images" 
 #auth_middleware = None
 
-@dataclass
-class Config:
-    openai_key: str
-    gemini_key: str
-    replicate_token: str
-    storage_conn: str
-    account_key: str
-    account_name: str
-    grok_key: str
-    b2c_client_id: str
-    b2c_tenant: str
-    b2c_user_flow: str
-    b2c_tenant_id: str
-    content_moderator_key: str
-    content_moderator_endpoint: str
-
-
 # async def initialize_auth(config):
 #     """Initialize the auth middleware with configuration"""
 #     global auth_middleware
@@ -89,55 +80,36 @@ class Config:
 #         logging.error(f"Failed to initialize auth middleware: {str(e)}")
 #         raise
 
+async def generate_story_with(provider: LLMProvider, topic, story_length, story_theme, system=None, max_tokens=None):
+    """Generate and parse a story with any LLM provider; returns (title, story, sentences)"""
+    prompt = create_story_prompt(topic, story_length, story_theme)
+    response_text = await provider.complete(prompt, system=system, max_tokens=max_tokens)
+    logging.info(f"Raw response from {provider.name}: {response_text}")
+    return parse_story_json(response_text.strip())
+
 async def generate_story_openai(topic, api_key, story_length, story_theme):
     try:
-        client = openai.OpenAI(api_key=api_key)
-        prompt = create_story_prompt(topic, story_length, story_theme)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  
-            messages=[
-                {"role": "system", "content": "You are a creative storyteller for children."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1000
+        return await generate_story_with(
+            OpenAIProvider(api_key), topic, story_length, story_theme,
+            system="You are a creative storyteller for children.", max_tokens=1000
         )
-        #logging.info(f"Raw response from OpenAI: {response.choices[0].message.content}")
-        title, story, sentences = parse_story_json(response.choices[0].message.content.strip())
-        #logging.info(f"Parsed JSON story: {story}")
-        return title, story, sentences
     except Exception as e:
         logging.error(f"OpenAI error: {e}")
         return None, None, None
 
 async def generate_story_grok(topic, api_key, story_length, story_theme):
     try:
-        client = openai.OpenAI(api_key=api_key, base_url="https://api.x.ai/v1")
-        prompt = create_story_prompt(topic, story_length, story_theme)
-        response = client.chat.completions.create(
-            model="grok-beta",  
-            messages=[
-                {"role": "system", "content": "You are Grok, a creative storyteller for children."},
-                {"role": "user", "content": prompt}
-            ],
+        return await generate_story_with(
+            GrokProvider(api_key), topic, story_length, story_theme,
+            system="You are Grok, a creative storyteller for children."
         )
-        #logging.info(f"Raw response from Grok: {response.choices[0].message.content}")
-        title, story, sentences = parse_story_json(response.choices[0].message.content.strip())
-        #logging.info(f"Parsed JSON story: {story}")
-        return title, story, sentences
     except Exception as e:
         logging.error(f"Grok error: {e}")
         return None, None, None 
 
 async def generate_story_gemini(topic, api_key, story_length, story_theme):
     try:
-        genai.configure(api_key=api_key)
-        prompt = create_story_prompt(topic, story_length, story_theme)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp') 
-        response = model.generate_content(prompt)
-        logging.info(f"Raw response from Gemini: {response.text}")
-        title, story, sentences = parse_story_json(response.text.strip())
-        logging.info(f"Parsed JSON story: {story}")
-        return title, story, sentences
+        return await generate_story_with(GeminiProvider(api_key), topic, story_length, story_theme)
     except Exception as e:
         logging.error(f"Gemini error: {e}")
         return None, None, None
@@ -205,10 +177,10 @@ def create_story_prompt(topic, story_length="short", story_theme="adventure"):
 async def moderate_story(story_text, endpoint, key):
     """Moderates story text using Azure Content Safety and returns specific error messages."""
     try:
-        client = ContentSafetyClient(endpoint, AzureKeyCredential(key))
+        client = get_client_pool().get_content_safety_client(endpoint, key)
 
         request = AnalyzeTextOptions(text=story_text)
-        response = client.analyze_text(request)
+        response = await asyncio.to_thread(client.analyze_text, request)
         logging.info(f"Content Safety Response: {response}")
 
         # Use a dictionary for easier category access and error message generation
@@ -270,15 +242,13 @@ async def simplify_story_with_gemini(detailed_story, api_key, story_length = "sh
     try:
         sentence_count = { "short": 5, "medium": 7, "long": 9, "epic": 12, "saga": 15}
         num_sentences = sentence_count.get(story_length, 5)
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash') 
+        provider = GeminiProvider(api_key, model='gemini-1.5-flash')
         prompt = f"""
         Here's a children's story: {detailed_story}
         Please simplify the story into {num_sentences} sentences, removing repetitive descriptions while maintaining the same narrative. Make the sentences as long and descriptive as possible while keeping the essence and key elements of the story intact.
         """
         #logging.info(f"Simplified story prompt:\n{prompt}")
-        response = model.generate_content(prompt)
-        simplified_story = response.text.strip()
+        simplified_story = (await provider.complete(prompt)).strip()
         #logging.info(f"Simplified story:\n{simplified_story}")
         return simplified_story
 
@@ -290,17 +260,12 @@ async def simplify_story(detailed_story, api_key, story_length = "short"):
     try:
         sentence_count = { "short": 5, "medium": 7, "long": 9, "epic": 12, "saga": 15}
         num_sentences = sentence_count.get(story_length, 5)
-        client = openai.OpenAI(api_key=api_key) # Or use Gemini. Configure appropriately
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Suitable model for simplification
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that simplifies text."},
-                {"role": "user", "content": f"Please simplify the above story into {num_sentences} sentences, removing repetitive descriptions while maintaining the same narrative. Make the sentences as long and descriptive as possible while keeping the essence and key elements of the story intact.:\n\n{detailed_story}"}
-
-            ],
+        provider = OpenAIProvider(api_key) # Or use GeminiProvider. Configure appropriately
+        simplified_story = await provider.complete(
+            f"Please simplify the above story into {num_sentences} sentences, removing repetitive descriptions while maintaining the same narrative. Make the sentences as long and descriptive as possible while keeping the essence and key elements of the story intact.:\n\n{detailed_story}",
+            system="You are a helpful assistant that simplifies text.",
             max_tokens=1000 # Adjust if needed
         )
-        simplified_story = response.choices[0].message.content
         #logging.info(f"Simplified story:\n{simplified_story}")
         return simplified_story
 
@@ -337,7 +302,7 @@ def generate_reference_image(character_description):
         logging.error(f"Error generating reference image: {e}")
         return None
 
-async def generate_cover_images(title, story_text, image_style, image_model, unique_id, config):
+async def generate_cover_images(title, story_text, image_style, image_model, unique_id, config, before_store=None):
     # Generate prompts for front and back covers
     front_cover_prompt = f"Book cover illustration for children's story titled '{title}', {image_style} style, featuring the main characters of the story {story_text}, in vibrant colors, cheerful cursive typography font, and professional book cover design"
     back_cover_prompt = f"Back cover illustration for children's story '{title}', {image_style} style, subtle and elegant design with text `Storyfairy` at the bottom right corner of the image, professional book cover design, no barcode"
@@ -345,44 +310,33 @@ async def generate_cover_images(title, story_text, image_style, image_model, uni
     # Generate both covers in parallel
     async def generate_cover(prompt, is_front):
         try:
-            if image_model == 'flux_schnell':
-                image_url, prompt_used = await generate_image_flux_schnell(prompt)
-            elif image_model == 'flux_pro':
-                image_url, prompt_used = await generate_image_flux_pro(prompt)
-            elif image_model == 'stable_diffusion_3':
-                image_url, prompt_used = await generate_image_stable_diffusion(prompt)
-            elif image_model == 'imagen_3':
-                image_url, prompt_used = await generate_image_google_imagen(prompt, config.gemini_key)
-
-            if not image_url:
+            cover_type = "front" if is_front else "back"
+            image = await generate_image(image_model, prompt, config, request_key=unique_id)
+            if not image:
                 return None
+            if before_store:
+                await before_store()
+
+            # Transcode and save to blob storage; the extension follows the stored format
+            stored = await store_generated_image(
+                image,
+                IMAGE_CONTAINER_NAME,
+                f"{title}_{unique_id}_{cover_type}_cover",
+                config.storage_conn
+            )
 
-            # Save to blob storage
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url) as response:
-                    image_data = await response.read()
-                    cover_type = "front" if is_front else "back"
-                    image_filename = f"{title}_{unique_id}_{cover_type}_cover.png"
-
-                    saved_url = save_to_blob_storage(
-                        image_data, 
-                        "image/jpeg",
-                        IMAGE_CONTAINER_NAME,
-                        image_filename,
-                        config.storage_conn
-                    )
-
-                    if saved_url:
-                        sas_token = generate_sas_token(
-                            config.account_name,
-                            config.account_key,
-                            IMAGE_CONTAINER_NAME,
-                            image_filename
-                        )
-                        return {
-                            "url": f"{saved_url}?{sas_token}",
-                            "prompt": prompt_used or prompt
-                        }
+            if stored:
+                sas_token = generate_sas_token(
+                    config.account_name,
+                    config.account_key,
+                    IMAGE_CONTAINER_NAME,
+                    stored.blob_name
+                )
+                return {
+                    "url": f"{stored.url}?{sas_token}",
+                    "prompt": image.prompt or prompt,
+                    "thumbnails": thumbnail_urls(stored.thumbnails)
+                }
             return None
         except Exception as e:
             logging.error(f"Error generating {cover_type} cover: {e}")
@@ -415,7 +369,8 @@ async def save_story_to_cosmos(story_data, user_id):
                 if image and isinstance(image, dict):
                     cleaned_image = {
                         "imageUrl": remove_sas_token(image.get("imageUrl")),
-                        "prompt": image.get("prompt")
+                        "prompt": image.get("prompt"),
+                        "thumbnails": image.get("thumbnails", {})
                     }
                     cleaned_images.append(cleaned_image)
 
@@ -426,12 +381,14 @@ async def save_story_to_cosmos(story_data, user_id):
             if cover_images.get("frontCover"):
                 cleaned_cover_images["frontCover"] = {
                     "url": remove_sas_token(cover_images["frontCover"].get("url")),
-                    "prompt": cover_images["frontCover"].get("prompt")
+                    "prompt": cover_images["frontCover"].get("prompt"),
+                    "thumbnails": cover_images["frontCover"].get("thumbnails", {})
                 }
             if cover_images.get("backCover"):
                 cleaned_cover_images["backCover"] = {
                     "url": remove_sas_token(cover_images["backCover"].get("url")),
-                    "prompt": cover_images["backCover"].get("prompt")
+                    "prompt": cover_images["backCover"].get("prompt"),
+                    "thumbnails": cover_images["backCover"].get("thumbnails", {})
                 }
         #logging.info(f"Story Topic : {story_data['metadata']['topic']} ")
         story_doc = {
@@ -463,123 +420,9 @@ async def save_story_to_cosmos(story_data, user_id):
         logging.error(f"Error saving story to Cosmos DB: {e}")
         raise
 
-async def generate_image_stable_diffusion(prompt,reference_image_url=None):
-    input_params = {
-        "cfg": 7,
-        "steps": 28,
-        "prompt": prompt,
-        "aspect_ratio": "1:1",
-        "output_quality": 100,
-        "negative_prompt": "ugly, blurry, distorted, text, watermark, extra limbs, extra body parts",
-        "prompt_strength": 0.85,
-        "scheduler": "K_EULER_ANCESTRAL",
-        "width": 768, 
-        "height": 768  
-    }
-    if reference_image_url:
-        input_params["image"] = reference_image_url
-    try:
-        output = await asyncio.get_event_loop().run_in_executor(
-            None,
-            lambda: replicate.run(
-                "stability-ai/stable-diffusion-3",
-                input=input_params
-            )
-        )
-        image_url = output[0] 
-        logging.info(f"Generated image (Stable Diffusion): {image_url}")  
-        return image_url, prompt  
-    except Exception as e:
-        logging.error(f"Stable Diffusion error: {e}")
-        return None, prompt 
-
-async def generate_image_flux_schnell(prompt):
-    try:
-        output = await asyncio.get_event_loop().run_in_executor(
-            None,
-            lambda: replicate.run(
-                "black-forest-labs/flux-schnell",
-                input={
-                    "prompt": prompt,
-                    "aspect_ratio": "1:1",
-                    "go_fast": False,
-                    "megapixels": "1",
-                    "num_outputs": 1,
-                    "output_quality": 100,
-                    "num_inference_steps": 4, 
-                    "seed": 12022023
-                }
-            )
-        )
-        image_url = output[0]
-        logging.info(f"Generated image (Flux Schnell): {image_url}")  
-        return image_url, prompt  
-    except Exception as e:
-        logging.error(f"Flux Schnell error: {e}")
-        return None, prompt
-
-async def generate_image_flux_pro(prompt):
-    try:
-        output = await asyncio.get_event_loop().run_in_executor(
-            None,
-            lambda: replicate.run(
-                "black-forest-labs/flux-1.1-pro",
-                input={
-                    "prompt": prompt,
-                    "aspect_ratio": "1:1",
-                    "output_format": "webp",
-                    "output_quality": 100,
-                    "safety_tolerance": 1,
-                    "prompt_upsampling": False
-                }
-            )
-        )
-        logging.info(f"Output : {output} " )
-        image_url = output
-        logging.info(f"Generated image (Flux Pro): {image_url}")  
-        return image_url, prompt  
-    except Exception as e:
-        logging.error(f"Flux Pro error: {e}")
-        return None, prompt
-
-async def generate_image_google_imagen(prompt, api_key):
-    """
-    Generates an image using Google Imagen 3.
-
-    Args:
-        prompt: The text prompt to use for image generation.
-        api_key: The Google Generative AI API key.
-
-    Returns:
-        A tuple containing:
-            - The generated image URL (or None if an error occurred).
-            - The original prompt used for image generation.
-    """
-    try:       
-        genai.configure(api_key=api_key) 
-        model = genai.GenerativeModel("imagen-3.0-generate-002")  # Specify the model here
-        logging.info(f"Generating image with Google Imagen 3: {prompt}")
-
-        response = await model.generate_images(
-            prompt=prompt,
-            number_of_images=1,
-            safety_filter_level="block_only_high",
-            person_generation="allow_adult",
-            aspect_ratio="1:1",
-            negative_prompt="Outside, Text, Distorted",
-        )
-
-        image_url = response.image_url
-        logging.info(f"Generated image URL: {image_url} using prompt: {prompt}")
-        return image_url, prompt
-
-    except Exception as e:
-        logging.exception(f"Error generating image with Google Imagen 3 using prompt: {prompt}")
-        return None, prompt
-
 def save_to_blob_storage(data, content_type, container_name, file_name, connection_string): 
   try:
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+    blob_service_client = get_client_pool().get_blob_service_client(connection_string)
     container_client = blob_service_client.get_container_client(container_name)
 
     #if container_name == STORY_CONTAINER_NAME:
@@ -621,101 +464,249 @@ def construct_detailed_prompt(sentence, image_style="whimsical"):
     return prompt, None
 
 async def get_secrets() -> Config:
-    """Get secrets from Key Vault or environment variables"""
-    try:
-        key_vault_uri = os.environ.get("KEY_VAULT_URI")
-        if key_vault_uri:
-            credential = DefaultAzureCredential()
-            client = SecretClient(vault_url=key_vault_uri, credential=credential)
-            
-            secrets = await asyncio.gather(
-                asyncio.to_thread(client.get_secret, "openai-api-key"),
-                asyncio.to_thread(client.get_secret, "gemini-api-key"),
-                asyncio.to_thread(client.get_secret, "replicate-api-token"),
-                asyncio.to_thread(client.get_secret, "storage-connection-string"),
-                asyncio.to_thread(client.get_secret, "account-key"),
-                asyncio.to_thread(client.get_secret, "account-name"),
-                asyncio.to_thread(client.get_secret, "grok-api-key"),
-                asyncio.to_thread(client.get_secret, "b2c-client-id"),
-                asyncio.to_thread(client.get_secret, "b2c-tenant"),
-                asyncio.to_thread(client.get_secret, "b2c-user-flow"),
-                asyncio.to_thread(client.get_secret, "b2c-tenant-id"),
-                asyncio.to_thread(client.get_secret, "azure-content-moderator-key"),
-                asyncio.to_thread(client.get_secret, "azure-content-moderator-endpoint")
+    """Get secrets from the worker-level config cache (Key Vault or environment variables)"""
+    return await get_config()
+
+async def generate_images_parallel(sentences, story_title, image_style, config, image_model, unique_id, on_image=None,
+                                   before_store=None):
+    tasks = []
+    for i, sentence in enumerate(sentences):
+        detailed_prompt, _ = construct_detailed_prompt(sentence, image_style)
+        async def generate_and_save_image(prompt, index):
+            # Concurrency, rate limits and fair queueing across stories are handled by the provider limiter
+            image = await generate_image(image_model, prompt, config, request_key=unique_id)
+            if not image:
+                return None
+            if before_store:
+                await before_store()
+            try:
+                stored = await store_generated_image(
+                    image, IMAGE_CONTAINER_NAME, f"{story_title}_{unique_id}-image{index+1}", config.storage_conn
+                )
+
+                if stored:
+                    parsed_url = urlparse(stored.url)
+                    blob_name = os.path.basename(parsed_url.path)
+                    return {
+                        "imageUrl": f"/api/blob/{blob_name}?container={IMAGE_CONTAINER_NAME}",
+                        "prompt": prompt,
+                        "thumbnails": thumbnail_urls(stored.thumbnails)
+                    }
+
+            except Exception as e:
+                logging.error(f"Error processing images : {e}")
+        tasks.append(generate_and_save_image(detailed_prompt, i))   
 
+    # Report every image as soon as it is saved (used for the job progress)
+    async def report(task, index):
+        result = await task
+        if result is not None and on_image:
+            on_image(index, result)
+        return result
+
+    results = await asyncio.gather(*(report(task, i) for i, task in enumerate(tasks)))
+    logging.info(f"Image provider limiter stats: {image_provider_stats()}")
+    ordered_results = [None] * len(sentences)
+    for i, result in enumerate(results):
+        if result is not None:
+            ordered_results[i] = result
+    return [result for result in ordered_results if result is not None]
+
+STORY_MODELS = ("gemini", "openai", "grok")
+IMAGE_MODELS = tuple(IMAGE_PROVIDERS)
+
+@dataclass
+class StoryRequest:
+    topic: str
+    story_length: str = "short"
+    image_style: str = "whimsical"
+    story_model: str = "gemini"
+    image_model: str = "flux_schnell"
+    story_theme: str = "adventure"
+    voice_name: str = "en-US-AvaNeural"
+
+def build_story_pipeline(story_request: StoryRequest, user_id: str, config: Config, events: Optional[StoryEventStream] = None, on_stage=None) -> StagePipeline:
+    """
+    Builds the story generation DAG. Image generation only waits for the
+    sentences and covers for the simplified text, so both run alongside
+    moderation; a moderation failure cancels them. Nothing is written to
+    blob storage before both moderation stages have passed: generated images
+    wait for approval before they are stored, and the text upload depends on
+    it. Progress is reported on `events`, which is held until approval.
+    """
+    r = story_request
+    unique_id = str(uuid.uuid4())
+    # Set by the `approved` stage; storage writes wait for it, so a rejected story leaves no blobs
+    approval = asyncio.Event()
+
+    def emit(event, data=None):
+        if events is not None:
+            events.emit(event, data)
+
+    async def topic_moderation():
+        is_topic_safe, error_message, moderation_result = await moderate_story(r.topic, config.content_moderator_endpoint, config.content_moderator_key)
+        logging.info(f"Topic moderation: {is_topic_safe}")
+        if not is_topic_safe:
+            raise StageError(error_message)
+
+    async def story():
+        logging.info(f"Generating story with model: {r.story_model}")
+        if r.story_model == 'gemini':
+            title, story_text, sentences = await generate_story_gemini(r.topic, config.gemini_key, r.story_length, r.story_theme)
+        elif r.story_model == 'openai':
+            title, story_text, sentences = await generate_story_openai(r.topic, config.openai_key, r.story_length, r.story_theme)
+        else:
+            title, story_text, sentences = await generate_story_grok(r.topic, config.grok_key, r.story_length, r.story_theme)
+        if not story_text:
+            raise StageError("Failed to generate story")
+        emit("title", {"title": title})
+        emit("sentences", {"sentences": sentences})
+        return {"title": title, "story": story_text, "sentences": sentences}
+
+    async def moderation(story):
+        logging.info(f"Content Moderation in progress..")
+        is_safe, error_message, moderation_result = await moderate_story(story["story"], config.content_moderator_endpoint, config.content_moderator_key)
+        if not is_safe:
+            raise StageError(error_message)
+
+    async def approved(topic_moderation, moderation):
+        approval.set()
+        if events is not None:
+            events.release()
+
+    async def simplified(story):
+        logging.info(f"Simplifying story with an OpenAI call")
+        simplified_story = await simplify_story(story["story"], config.openai_key, r.story_length)
+        emit("simplified", {"storyText": simplified_story})
+        return simplified_story
+
+    async def texts(approved, story, simplified):
+        logging.info(f"Saving stories to blob storage")
+        simplified_story_url, detailed_story_url = await asyncio.gather(
+            asyncio.to_thread(
+                save_to_blob_storage,
+                simplified, "text/plain",
+                STORY_CONTAINER_NAME,
+                f"{story['title']}_{unique_id}.txt",
+                config.storage_conn
+            ),
+            asyncio.to_thread(
+                save_to_blob_storage,
+                story["story"], "text/plain",
+                STORY_CONTAINER_NAME,
+                f"{story['title']}_{unique_id}_detailed.txt",
+                config.storage_conn
             )
-            logging.info("Secrets successfully fetched from Key Vault") # Add logging for successful fetch.
-            return Config(*(s.value for s in secrets))
-        
-        # Fallback to environment variables
-        logging.warning("Key Vault URI not found. Falling back to environment variables.")
-        return Config(
-            openai_key=os.environ["OPENAI_API_KEY"],
-            gemini_key=os.environ["GEMINI_API_KEY"],
-            replicate_token=os.environ["REPLICATE_API_TOKEN"],
-            storage_conn=os.environ["STORAGE_CONNECTION_STRING"],
-            account_key=os.environ["ACCOUNT_KEY"],
-            account_name=os.environ["ACCOUNT_NAME"],
-            grok_key=os.environ["GROK_API_KEY"],
-            b2c_client_id=os.environ["REACT_APP_B2C_CLIENT_ID"],
-            b2c_tenant=os.environ["REACT_APP_B2C_TENANT"],
-            b2c_user_flow=os.environ["REACT_APP_B2C_USER_FLOW"],
-            b2c_tenant_id=os.environ["REACT_APP_B2C_TENANT_ID"],
-            content_moderator_key=os.environ["AZURE_CONTENT_MODERATOR_KEY"],
-            content_moderator_endpoint=os.environ["AZURE_CONTENT_MODERATOR_ENDPOINT"]
-
-        )   
-    except Exception as e:
-        logging.exception(f"Error getting secrets: {e}") # Log the exception
-        raise
+        )
+        if not all([simplified_story_url, detailed_story_url]):
+            raise StageError("Failed to upload stories to blob storage")
+        return {"storyUrl": simplified_story_url, "detailedStoryUrl": detailed_story_url}
+
+    async def images(story):
+        logging.info(f"Generating images with model: {r.image_model}")
+        return await generate_images_parallel(
+            story["sentences"], story["title"], r.image_style, config, r.image_model, unique_id,
+            on_image=lambda index, image: emit("image", {"index": index, **image}),
+            before_store=approval.wait
+        )
 
-async def generate_images_parallel(sentences, story_title, image_style, connection_string, account_key, account_name, image_model, unique_id, gemini_api_key=None):
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for i, sentence in enumerate(sentences):
-            detailed_prompt, _ = construct_detailed_prompt(sentence, image_style)
-            async def generate_and_save_image(prompt,index):
-                if image_model == 'flux_schnell':
-                    image_url,prompt_used = await generate_image_flux_schnell(prompt)
-                elif image_model == 'flux_pro':
-                    image_url,prompt_used = await generate_image_flux_pro(prompt)
-                elif image_model == 'stable_diffusion_3':
-                    image_url,prompt_used = await generate_image_stable_diffusion(prompt)
-                elif image_model == 'imagen_3':
-                    image_url,prompt_used = await generate_image_google_imagen(detailed_prompt, gemini_api_key)
-                    if not image_url:
-                        return None
-                try:
-                    async with session.get(image_url) as response:
-                        image_data = await response.read()
-                        image_filename = f"{story_title}_{unique_id}-image{index+1}.png"
-            
-                        # Use ThreadPoolExecutor for blob storage operations
-                        with ThreadPoolExecutor() as executor:
-                            saved_image_url = await asyncio.get_event_loop().run_in_executor(
-                                executor,
-                                save_to_blob_storage,
-                                image_data, "image/jpeg", IMAGE_CONTAINER_NAME, 
-                                image_filename, connection_string
-                            )
-                
-                            if saved_image_url:
-                                 parsed_url = urlparse(saved_image_url)
-                                 blob_name = os.path.basename(parsed_url.path)
-                                 return {"imageUrl": f"/api/blob/{blob_name}?container={IMAGE_CONTAINER_NAME}", "prompt": prompt}
-                                                
-                except Exception as e:
-                    logging.error(f"Error processing images : {e}")
-            tasks.append(generate_and_save_image(detailed_prompt, i))   
-        results = await asyncio.gather(*tasks)
-        ordered_results = [None] * len(sentences)
-        for i, result in enumerate(results):
-            if result is not None:
-                ordered_results[i] = result
-        return [result for result in ordered_results if result is not None]
+    async def covers(story, simplified):
+        cover_images = await generate_cover_images(story["title"], simplified, r.image_style, r.image_model, unique_id, config,
+                                                   before_store=approval.wait)
+        emit("covers", cover_images)
+        return cover_images
+
+    async def saved(approved, story, simplified, texts, images, covers):
+        storyLength = { "short": 5, "medium": 7, "long": 9, "epic": 12, "saga": 15}
+        creditsUsed = storyLength.get(r.story_length, 5)
+        logging.info(f"Credits used: {creditsUsed}")
+        logging.info(f"topic: {r.topic}")
+
+        response_data = {
+            "title": story["title"],
+            "storyText": simplified,
+            "detailedStoryText": story["story"],
+            "storyUrl": texts["storyUrl"],
+            "detailedStoryUrl": texts["detailedStoryUrl"],
+            "images": images,
+            "coverImages": covers,
+            "imageContainerName": IMAGE_CONTAINER_NAME,
+            "blobStorageConnectionString": config.storage_conn,
+            "voiceName": r.voice_name,
+            "metadata": {
+                "topic": r.topic,
+                "storyLength": r.story_length,
+                "imageStyle": r.image_style,
+                "storyModel": r.story_model,
+                "imageModel": r.image_model,
+                "storyTheme": r.story_theme,
+                "creditsUsed": creditsUsed
+            }
+        }
+        response_data["id"] = await save_story_to_cosmos(response_data, user_id)
+        emit("story", {"id": response_data["id"]})
+        return response_data
+
+    return StagePipeline([
+        Stage("topic_moderation", topic_moderation),
+        Stage("story", story),
+        Stage("moderation", moderation, ("story",)),
+        Stage("approved", approved, ("topic_moderation", "moderation")),
+        Stage("simplified", simplified, ("story",)),
+        Stage("texts", texts, ("approved", "story", "simplified")),
+        Stage("images", images, ("story",)),
+        Stage("covers", covers, ("story", "simplified")),
+        Stage("saved", saved, ("approved", "story", "simplified", "texts", "images", "covers")),
+    ], name="GenerateStory pipeline", on_stage=on_stage)
+
+def is_async_request(req: func.HttpRequest) -> bool:
+    if req.params.get('async', '').lower() in ('1', 'true'):
+        return True
+    if 'respond-async' in req.headers.get('Prefer', ''):
+        return True
+    try:
+        return bool((req.get_json() or {}).get('async'))
+    except ValueError:
+        return False
+
+async def run_story_job(message: Dict[str, Any]) -> None:
+    """Runs a queued story job, mirroring stage progress and partial results onto the job document"""
+    job_id, user_id = message["jobId"], message["userId"]
+    cosmos_service = CosmosService()
+    job = await cosmos_service.get_story_job(job_id, user_id)
+    if not job:
+        logging.error(f"Story job {job_id} not found")
+        return
+    if job["status"] in ("succeeded", "failed"):
+        logging.info(f"Story job {job_id} already {job['status']}")
+        return
+
+    config = await get_secrets()
+    openai.api_key = config.openai_key
+    os.environ["REPLICATE_API_TOKEN"] = config.replicate_token
+
+    tracker = JobTracker(job, cosmos_service)
+    job["status"] = "running"
+    await tracker.flush()
+
+    events = StoryEventStream(held=True)
+    events.add_listener(tracker.on_event)
+    pipeline = build_story_pipeline(StoryRequest(**job["request"]), user_id, config, events, on_stage=tracker.on_stage)
+    try:
+        await pipeline.run()
+        await tracker.finish("succeeded")
+    except StageError as e:
+        events.release(discard=True)
+        await tracker.finish("failed", e.message)
+    except Exception as e:
+        logging.exception(f"Error running story job {job_id}: {e}")
+        events.release(discard=True)
+        await tracker.finish("failed", f"Error during execution: {str(e)}")
+    finally:
+        events.close()
 
 @require_auth
-async def main(req: func.HttpRequest) -> func.HttpResponse:
+async def main(req: func.HttpRequest, jobQueue: func.Out[str]) -> func.HttpResponse:
     try:
         # Get user ID from auth claims
         claims = getattr(req, 'auth_claims')
@@ -769,11 +760,6 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=400
             )
         
-        isTopicSafe, error_message, moderation_result = await moderate_story(topic, config.content_moderator_endpoint, config.content_moderator_key)
-        logging.info(isTopicSafe, moderation_result)
-        if not isTopicSafe:
-            return func.HttpResponse(error_message, status_code=500)
-                                
         # Get other parameters with defaults
         story_length = req.params.get('storyLength', 'short')
         if not story_length:
@@ -824,133 +810,54 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
             except ValueError:
                 voice_name = 'en-US-AvaNeural'
 
-        # Generate story using the specified model
-        logging.info(f"Generating story with model: {story_model}")
-        if story_model == 'gemini':
-            title, story, sentences = await generate_story_gemini(topic, config.gemini_key, story_length, story_theme)
-        elif story_model == 'openai':
-            title, story, sentences = await generate_story_openai(topic, config.openai_key, story_length, story_theme)
-        elif story_model == 'grok':
-            title, story, sentences = await generate_story_grok(topic, config.grok_key, story_length, story_theme)
-        else:
+        if story_model not in STORY_MODELS:
             return func.HttpResponse(
                 json.dumps({"error": f"Invalid story model: {story_model}"}),
                 mimetype="application/json",
                 status_code=400
             )
-
-        if not story:
-            return func.HttpResponse("Failed to generate story", status_code=500)
-        
-        logging.info(f"Content Moderation in progress..")
-        is_safe, error_message, moderation_result = await moderate_story(story, config.content_moderator_endpoint, config.content_moderator_key) 
-
-        if not is_safe: # Check for unsafe content
-            return func.HttpResponse(error_message, status_code=500)
-                
-        # Generate story title and filenames
-        unique_id = str(uuid.uuid4())
-        simplified_story_filename = f"{title}_{unique_id}.txt"
-        detailed_story_filename = f"{title}_{unique_id}_detailed.txt"
-
-        # Simplify story
-        logging.info(f"Simplifying story with an OpenAI call")
-        simplified_story = await simplify_story(story, config.openai_key, story_length)
-        #logging.info(f"Simplifying story with an Gemini call")
-        #simplified_story = await simplify_story_with_gemini(story, config.gemini_key, story_length)
-
-        # Save stories to blob storage in parallel
-        logging.info(f"Saving stories to blob storage")
-        with ThreadPoolExecutor() as executor:
-            simplified_future = executor.submit(
-                save_to_blob_storage, 
-                simplified_story, "text/plain", 
-                STORY_CONTAINER_NAME, 
-                simplified_story_filename, 
-                config.storage_conn
-            )
-            detailed_future = executor.submit(
-                save_to_blob_storage,
-                story, "text/plain",
-                STORY_CONTAINER_NAME,
-                detailed_story_filename,
-                config.storage_conn
-            )
-            
-            simplified_story_url = simplified_future.result()
-            detailed_story_url = detailed_future.result()
-
-        if not all([simplified_story_url, detailed_story_url]):
-            return func.HttpResponse("Failed to upload stories to blob storage", status_code=500)
-
-        # Generate images using the specified model
-        logging.info(f"Generating images with model: {image_model}")
-        if image_model == 'flux_schnell':
-            image_results = await generate_images_parallel(
-                sentences, title, image_style,
-                config.storage_conn, config.account_key, config.account_name, image_model, unique_id
-            )
-        elif image_model == 'flux_pro':
-            image_results = await generate_images_parallel(
-                sentences, title, image_style,
-                config.storage_conn, config.account_key, config.account_name, image_model, unique_id
-            )
-        elif image_model == 'stable_diffusion_3':
-            image_results = await generate_images_parallel(
-                sentences, title, image_style,
-                config.storage_conn, config.account_key, config.account_name, image_model, unique_id
-            )
-        elif image_model == 'imagen_3':
-            image_results = await generate_images_parallel(
-                sentences, title, image_style,
-                config.storage_conn, config.account_key, config.account_name, image_model, unique_id, config.gemini_key
-            )
-        else:
+        if image_model not in IMAGE_MODELS:
             return func.HttpResponse(
                 json.dumps({"error": f"Invalid image model: {image_model}"}),
                 mimetype="application/json",
                 status_code=400
-            ) 
-
-        # Generate cover images
-        cover_images = await generate_cover_images(title, simplified_story, image_style, image_model, unique_id, config )
-
-        storyLength = { "short": 5, "medium": 7, "long": 9, "epic": 12, "saga": 15}
-        creditsUsed = storyLength.get(story_length, 5)
-        logging.info(f"Credits used: {creditsUsed}")
-        logging.info(f"topic: {topic}")
+            )
 
-        # Prepare response
-        response_data = {
-            "title": title,
-            "storyText": simplified_story,
-            "detailedStoryText": story,
-            "storyUrl": simplified_story_url,
-            "detailedStoryUrl": detailed_story_url,
-            "images": image_results,
-            "coverImages": cover_images,
-            "imageContainerName": IMAGE_CONTAINER_NAME,
-            "blobStorageConnectionString": config.storage_conn,
-            "voiceName":voice_name,
-            "metadata": {
-                "topic": topic,
-                "storyLength": story_length,
-                "imageStyle": image_style,
-                "storyModel": story_model,
-                "imageModel": image_model,
-                "storyTheme": story_theme,
-                "creditsUsed": creditsUsed
-            }
-        }
-        #logging.info(f"Saving Response data to Cosmos DB: {response_data}")
+        story_request = StoryRequest(
+            topic=topic,
+            story_length=story_length,
+            image_style=image_style,
+            story_model=story_model,
+            image_model=image_model,
+            story_theme=story_theme,
+            voice_name=voice_name
+        )
+        # Opt-in background job: ?async=true (or Prefer: respond-async) returns 202 with a job id.
+        # The job document carries partial results (title, text, each image) as they are produced;
+        # poll it for progressive display, since this programming model buffers response bodies.
+        if is_async_request(req):
+            job = new_job(user_id, asdict(story_request))
+            await CosmosService().create_story_job(job)
+            await get_job_queue(jobQueue, run_story_job).enqueue({"jobId": job["id"], "userId": user_id})
+            status_url = f"/api/stories/jobs/{job['id']}"
+            return func.HttpResponse(
+                json.dumps({"jobId": job["id"], "status": job["status"], "statusUrl": status_url}),
+                mimetype="application/json",
+                status_code=202,
+                headers={"Location": status_url}
+            )
 
-        story_id = await save_story_to_cosmos(response_data, user_id)
-        response_data["id"] = story_id
+        pipeline = build_story_pipeline(story_request, user_id, config)
+        try:
+            results = await pipeline.run()
+        except StageError as e:
+            return func.HttpResponse(e.message, status_code=e.status_code)
 
         return func.HttpResponse(
-            json.dumps(response_data, default=str),
+            json.dumps(results["saved"], default=str),
             mimetype="application/json",
-            status_code=200
+            status_code=200,
+            headers={"Server-Timing": pipeline.server_timing_header()}
         )
 
     except Exception as e:
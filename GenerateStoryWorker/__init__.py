@@ -0,0 +1,11 @@
+# GenerateStoryWorker/__init__.py
+import json
+import logging
+import azure.functions as func
+from ..GenerateStory import run_story_job
+
+
+async def main(msg: func.QueueMessage) -> None:
+    message = json.loads(msg.get_body().decode("utf-8"))
+    logging.info(f"Processing story job {message.get('jobId')} (dequeue count {msg.dequeue_count})")
+    await run_story_job(message)
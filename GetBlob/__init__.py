@@ -1,11 +1,52 @@
+import asyncio  
 import logging  
 import os  
 import azure.functions as func  
 from azure.storage.blob import BlobServiceClient  
 from azure.identity import DefaultAzureCredential  
-from azure.core.exceptions import ResourceNotFoundError  
+from azure.core import MatchConditions  
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError  
+from ..shared.services.client_pool import get_client_pool
+from ..shared.services.config_service import get_config
+from ..shared.services.blob_cache import CachedBlob, blob_cache_key, get_blob_cache
+from ..shared.services.blob_sas import GETBLOB_MODE, SAS_REDIRECT_CONTAINERS, get_blob_sas_signer
+from ..shared.services.blob_transfer import DERIVATIVES_CONTAINER, ensure_resized_derivative
+from ..shared.services.image_processing import RESIZE_WIDTHS, output_format, resize_formats
+from ..shared.services.blob_http import (BLOB_MAX_BODY_BYTES, BLOB_MAX_RANGE_BYTES, cache_headers, content_range,
+                                         if_none_match_tags, if_range_matches, is_not_modified, parse_http_date,
+                                         parse_range)
 
-def main(req: func.HttpRequest) -> func.HttpResponse:  
+def total_blob_size(properties, content: bytes) -> int:  
+    """Size of the whole blob behind a (possibly windowed) download"""  
+    return int(properties.content_range.rsplit("/", 1)[1]) if properties.content_range else len(content)  
+
+def not_modified_response(etag, last_modified) -> func.HttpResponse:  
+    return func.HttpResponse(status_code=304, headers=cache_headers(etag, last_modified))  
+
+def cached_response(req: func.HttpRequest, entry: CachedBlob, byte_range, cache_status: str) -> func.HttpResponse:  
+    """Serve a cached blob, slicing Range requests from memory"""  
+    if is_not_modified(req.headers, entry.etag, entry.last_modified):  
+        return not_modified_response(entry.etag, entry.last_modified)  
+
+    headers = cache_headers(entry.etag, entry.last_modified)  
+    headers["Accept-Ranges"] = "bytes"  
+    headers["X-Cache"] = cache_status  
+    if byte_range is None or not if_range_matches(req.headers, entry.etag, entry.last_modified):  
+        return func.HttpResponse(entry.data, mimetype=entry.content_type, status_code=200, headers=headers)  
+
+    start, end = byte_range  
+    if start is None:  
+        start, end = max(entry.size - end, 0), None  
+    if start >= entry.size:  
+        return func.HttpResponse(  
+            status_code=416,  
+            headers={"Content-Range": f"bytes */{entry.size}", "Accept-Ranges": "bytes"}  
+        )  
+    end = min(entry.size - 1 if end is None else end, entry.size - 1, start + BLOB_MAX_RANGE_BYTES - 1)  
+    headers["Content-Range"] = content_range(start, end, entry.size)  
+    return func.HttpResponse(entry.data[start:end + 1], mimetype=entry.content_type, status_code=206, headers=headers)  
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:  
     logging.info("GetBlob function triggered.")  
     try:  
         blob_name = req.route_params.get('blob_name')  
@@ -13,7 +54,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         container_name = req.params.get('container', 'storyfairy-images')  
 
         # Validate container name  
-        if container_name not in ['storyfairy-images', 'storyfairy-stories']:  
+        if container_name not in ['storyfairy-images', 'storyfairy-stories', 'storyfairy-derivatives']:  
             return func.HttpResponse(  
                 "Invalid container name", status_code=400  
             )  
@@ -23,7 +64,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 "Blob name is required.", status_code=400  
             )  
 
-        account_name = os.environ.get("ACCOUNT_NAME")  
+        config = await get_config()  
+        account_name = config.account_name  
         if not account_name:  
             logging.error("Storage account name not configured.")  
             return func.HttpResponse(  
@@ -32,9 +74,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         account_url = f"https://{account_name}.blob.core.windows.net"  
 
         try:  
-            credential = DefaultAzureCredential()  
             logging.info(f"Using DefaultAzureCredential for authentication.")  
-            blob_service_client = BlobServiceClient(account_url, credential=credential)  
+            blob_service_client = get_client_pool().get_blob_service_client(account_url=account_url)  
         except Exception as auth_error:  
             logging.exception("Authentication error accessing storage account")  
             return func.HttpResponse(  
@@ -42,30 +83,168 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=500  
             )  
 
+        # On-demand resizing (?w=320&fmt=webp) serves a derivative, rendering it on first use  
+        # (named after the source ETag; `v` only busts caches and never picks the stored derivative)  
+        width = req.params.get('w')  
+        fmt = req.params.get('fmt')  
+        if width or fmt:  
+            if container_name != 'storyfairy-images':  
+                return func.HttpResponse(  
+                    "Resizing is only available for story images", status_code=400  
+                )  
+            if not width or not width.isdigit() or int(width) not in RESIZE_WIDTHS:  
+                return func.HttpResponse(  
+                    f"Invalid width. Must be one of: {', '.join(map(str, RESIZE_WIDTHS))}", status_code=400  
+                )  
+            fmt = fmt or (output_format() if output_format() in resize_formats() else "webp")  
+            if fmt not in resize_formats():  
+                return func.HttpResponse(  
+                    f"Invalid format. Must be one of: {', '.join(resize_formats())}", status_code=400  
+                )  
+            derivative_name = await ensure_resized_derivative(  
+                blob_service_client, container_name, blob_name, int(width), fmt  
+            )  
+            if derivative_name is None:  
+                logging.warning(f"Blob {blob_name} not found")  
+                return func.HttpResponse("Blob not found", status_code=404)  
+            container_name, blob_name = DERIVATIVES_CONTAINER, derivative_name  
+
+        if GETBLOB_MODE == "redirect" and container_name in SAS_REDIRECT_CONTAINERS:  
+            # Storage serves the bytes; the proxy path below remains the fallback if signing fails.  
+            # Only image containers are signed: see SAS_REDIRECT_CONTAINERS for why no ownership check applies  
+            signer = get_blob_sas_signer(account_name, config.account_key, blob_service_client)  
+            signed_url = await signer.signed_url(container_name, blob_name)  
+            if signed_url:  
+                return func.HttpResponse(  
+                    status_code=302,  
+                    headers={  
+                        "Location": signed_url,  
+                        "Cache-Control": f"private, max-age={signer.seconds_valid(container_name, blob_name)}"  
+                    }  
+                )  
+            logging.warning(f"Could not sign {container_name}/{blob_name}; proxying instead")  
+
+        # The pooled client is synchronous: every storage call below runs in a worker thread  
+        # so one download never stalls the other invocations on this worker's event loop  
         try:  
             logging.info(f"Getting blob {blob_name} from container {container_name}")  
             container_client = blob_service_client.get_container_client(container_name)  
             blob_client = container_client.get_blob_client(blob_name)  
+            byte_range = parse_range(req.headers.get("Range"))  
 
-            if not blob_client.exists():  
-                logging.warning(f"Blob {blob_name} not found")  
-                return func.HttpResponse(  
-                    "Blob not found", status_code=404  
+            # Hot blobs are served from the worker cache  
+            blob_cache = get_blob_cache()  
+            cache_key = blob_cache_key(container_name, blob_name, req.params.get('v'))  
+            cached = await blob_cache.get(cache_key)  
+            if cached is not None and blob_cache.is_fresh(cached):  
+                return cached_response(req, cached, byte_range, "HIT")  
+            if cached is not None:  
+                # One conditional download: 304 keeps the entry, 200 replaces it  
+                try:  
+                    blob_data = await asyncio.to_thread(  
+                        blob_client.download_blob, offset=0, length=BLOB_MAX_RANGE_BYTES,  
+                        etag=cached.etag, match_condition=MatchConditions.IfModified  
+                    )  
+                except HttpResponseError as e:  
+                    if e.status_code != 304:  
+                        raise  
+                    blob_cache.mark_validated(cached)  
+                    return cached_response(req, cached, byte_range, "REVALIDATED")  
+                content = await asyncio.to_thread(blob_data.readall)  
+                properties = blob_data.properties  
+                # Only a whole blob may replace the entry; larger blobs fall through to the windowed path  
+                if len(content) == total_blob_size(properties, content):  
+                    cached = await blob_cache.put(cache_key, content, properties.etag, properties.last_modified,  
+                                                  properties.content_settings.content_type)  
+                    if cached is not None:  
+                        return cached_response(req, cached, byte_range, "REVALIDATED")  
+
+            # Let storage evaluate a single validator, so a 304 transfers no body from the blob either  
+            tags = if_none_match_tags(req.headers)  
+            conditions = {}  
+            if len(tags) == 1 and tags[0] != "*":  
+                conditions = {"etag": tags[0], "match_condition": MatchConditions.IfModified}  
+            elif not tags and parse_http_date(req.headers.get("If-Modified-Since")):  
+                conditions = {"if_modified_since": parse_http_date(req.headers.get("If-Modified-Since"))}  
+
+            # Every download is a bounded window; Range requests and blobs over BLOB_MAX_BODY_BYTES get 206  
+            start, end = byte_range if byte_range else (0, None)  
+            if start is None:  
+                # Suffix range (bytes=-N): the blob size decides where it starts  
+                size = (await asyncio.to_thread(blob_client.get_blob_properties)).size  
+                start, end = max(size - end, 0), None  
+            length = BLOB_MAX_RANGE_BYTES if end is None else min(end - start + 1, BLOB_MAX_RANGE_BYTES)  
+
+            try:  
+                blob_data = await asyncio.to_thread(blob_client.download_blob, offset=start, length=length, **conditions)  
+            except HttpResponseError as e:  
+                if e.status_code == 416:  
+                    size = (await asyncio.to_thread(blob_client.get_blob_properties)).size  
+                    return func.HttpResponse(  
+                        status_code=416,  
+                        headers={"Content-Range": f"bytes */{size}", "Accept-Ranges": "bytes"}  
+                    )  
+                if e.status_code != 304:  
+                    raise  
+                response_headers = e.response.headers if e.response is not None else {}  
+                return not_modified_response(  
+                    response_headers.get("ETag"),  
+                    parse_http_date(response_headers.get("Last-Modified"))  
                 )  
 
-            blob_data = blob_client.download_blob()  
-            content = blob_data.readall()  
-            content_type = blob_data.properties.content_settings.content_type  
+            properties = blob_data.properties  
+            if is_not_modified(req.headers, properties.etag, properties.last_modified):  
+                return not_modified_response(properties.etag, properties.last_modified)  
+
+            # If-Range names an older version: ignore the Range and send the representation from the start  
+            if byte_range and not if_range_matches(req.headers, properties.etag, properties.last_modified):  
+                byte_range = None  
+                start = 0  
+                blob_data = await asyncio.to_thread(blob_client.download_blob, offset=0, length=BLOB_MAX_RANGE_BYTES)  
+                properties = blob_data.properties  
+
+            content = await asyncio.to_thread(blob_data.readall)  
+            content_type = properties.content_settings.content_type  
+            total_size = total_blob_size(properties, content)  
+
+            if byte_range is None and len(content) < total_size:  
+                if total_size > BLOB_MAX_BODY_BYTES:  
+                    # Too large to buffer whole: the first window goes out as 206 and the client continues with Range  
+                    logging.warning(f"Blob {blob_name} is {total_size} bytes, over BLOB_MAX_BODY_BYTES "  
+                                    f"({BLOB_MAX_BODY_BYTES}); serving the first {len(content)} bytes")  
+                else:  
+                    # Read the rest of the same version: a blob overwritten in between fails instead of mixing versions  
+                    remainder = await asyncio.to_thread(  
+                        blob_client.download_blob, offset=len(content),  
+                        etag=properties.etag, match_condition=MatchConditions.IfNotModified  
+                    )  
+                    content += await asyncio.to_thread(remainder.readall)  
+
+            headers = cache_headers(properties.etag, properties.last_modified)  
+            headers["Accept-Ranges"] = "bytes"  
+            headers["X-Cache"] = "MISS"  
+            if byte_range is None and len(content) == total_size:  
+                if await blob_cache.put(cache_key, content, properties.etag, properties.last_modified, content_type):  
+                    logging.info(f"Blob cache: {blob_cache.stats()}")  
+                return func.HttpResponse(  
+                    content,  
+                    mimetype=content_type,  
+                    status_code=200,  
+                    headers=headers  
+                )  
 
+            headers["Content-Range"] = content_range(start, start + len(content) - 1, total_size)  
             return func.HttpResponse(  
                 content,  
                 mimetype=content_type,  
-                status_code=200  
+                status_code=206,  
+                headers=headers  
             )  
 
         except ResourceNotFoundError:  
-            logging.exception("Resource not found error")  
-            return func.HttpResponse("Resource not found", status_code=404)  
+            logging.warning(f"Blob {blob_name} not found")  
+            get_blob_cache().invalidate(blob_cache_key(container_name, blob_name, req.params.get('v')))  
+            return func.HttpResponse("Blob not found", status_code=404)  
         except Exception as blob_error:  
             logging.exception("Error accessing blob")  
             return func.HttpResponse("Error accessing blob", status_code=500)  
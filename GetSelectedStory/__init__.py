@@ -46,10 +46,13 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
             )  
 
         # Function to convert blob URL to API proxy URL  
-        def get_proxy_url(blob_url):  
+        def get_proxy_url(blob_url, version=None):  
             if not blob_url:  
                 return None  
-            blob_name = blob_url.split('/')[-1]  
+            blob_name = blob_url.split('?')[0].split('/')[-1]  
+            # Regenerated images keep their blob name; the version busts immutable caches  
+            if version:  
+                return f"/api/blob/{blob_name}?container=storyfairy-images&v={version}"  
             return f"/api/blob/{blob_name}?container=storyfairy-images"  
 
         # Process images  
@@ -57,7 +60,8 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
         for image in story.get('images', []):  
             processed_image = {  
                 'prompt': image.get('prompt', ''),  
-                'imageUrl': get_proxy_url(image.get('imageUrl'))  
+                'imageUrl': get_proxy_url(image.get('imageUrl'), image.get('version')),  
+                'thumbnails': image.get('thumbnails', {})  
             }  
             processed_images.append(processed_image)  
 
@@ -66,7 +70,8 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
         for cover_type, cover_data in story.get('coverImages', {}).items():  
             processed_cover_images[cover_type] = {  
                 'prompt': cover_data.get('prompt', ''),  
-                'url': get_proxy_url(cover_data.get('url'))  
+                'url': get_proxy_url(cover_data.get('url')),  
+                'thumbnails': cover_data.get('thumbnails', {})  
             }  
 
         # Prepare response  
@@ -0,0 +1,158 @@
+# GetStoryBlobs/__init__.py
+import asyncio
+import logging
+import json
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+import azure.functions as func
+from azure.core.exceptions import ResourceNotFoundError
+from ..shared.auth.decorator import require_auth
+from ..shared.services.blob_cache import blob_cache_key, get_blob_cache
+from ..shared.services.blob_transfer import DERIVATIVES_CONTAINER, blob_proxy_url, parse_blob_url
+from ..shared.services.client_pool import get_client_pool
+from ..shared.services.config_service import get_config
+from ..shared.services.cosmos_service import CosmosService
+
+# Concurrent blob downloads per batch request
+STORY_BLOBS_CONCURRENCY = int(os.environ.get("GETSTORYBLOBS_CONCURRENCY", "6"))
+IMAGE_SIZES = ("original", "small", "medium")
+
+BlobRef = Tuple[str, str, Optional[str]]
+
+
+def story_blob_refs(story: Dict[str, Any], size: str = "original") -> List[BlobRef]:
+    """(container, blob name, version) of every story image in viewer order: covers, then pages"""
+    entries = [(cover.get("url"), cover.get("version"), cover.get("thumbnails") or {})
+               for cover in (story.get("coverImages") or {}).values()]
+    entries += [(image.get("imageUrl"), image.get("version"), image.get("thumbnails") or {})
+                for image in story.get("images", [])]
+
+    refs = []
+    for url, version, thumbnails in entries:
+        # Fall back to the original for images saved before thumbnails existed
+        ref = parse_blob_url(thumbnails.get(size), DERIVATIVES_CONTAINER) if size != "original" else None
+        if ref is None:
+            ref = parse_blob_url(url)
+            if ref is not None:
+                ref = (ref[0], ref[1], version)
+        if ref is not None and ref not in refs:
+            refs.append(ref)
+    return refs
+
+
+async def fetch_blob(blob_service_client, ref: BlobRef, semaphore: asyncio.Semaphore
+                     ) -> Optional[Tuple[bytes, Optional[str], Optional[str]]]:
+    """(bytes, content type, etag) from the hot-blob cache or one download; None if the blob is gone"""
+    container_name, blob_name, version = ref
+    blob_cache = get_blob_cache()
+    cache_key = blob_cache_key(container_name, blob_name, version)
+    cached = await blob_cache.get(cache_key)
+    if cached is not None and blob_cache.is_fresh(cached):
+        return cached.data, cached.content_type, cached.etag
+
+    def download():
+        blob_data = blob_service_client.get_blob_client(container_name, blob_name).download_blob()
+        return blob_data.readall(), blob_data.properties
+
+    try:
+        async with semaphore:
+            content, properties = await asyncio.to_thread(download)
+    except ResourceNotFoundError:
+        logging.warning(f"Blob {container_name}/{blob_name} not found")
+        blob_cache.invalidate(cache_key)
+        return None
+    content_type = properties.content_settings.content_type
+    await blob_cache.put(cache_key, content, properties.etag, properties.last_modified, content_type)
+    return content, content_type, properties.etag
+
+
+def multipart_body(parts: List[Tuple[BlobRef, Tuple[bytes, Optional[str], Optional[str]]]], boundary: str) -> bytes:
+    chunks = []
+    for (container_name, blob_name, version), (content, content_type, etag) in parts:
+        headers = [
+            f"Content-Type: {content_type or 'application/octet-stream'}",
+            f"Content-Length: {len(content)}",
+            f"Content-Location: {blob_proxy_url(blob_name, container_name, version)}",
+        ]
+        if etag:
+            headers.append(f"ETag: {etag}")
+        chunks.append(f"--{boundary}\r\n" + "\r\n".join(headers) + "\r\n\r\n")
+        chunks.append(content)
+        chunks.append("\r\n")
+    chunks.append(f"--{boundary}--\r\n")
+    return b"".join(c.encode() if isinstance(c, str) else c for c in chunks)
+
+
+@require_auth
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        # Get user ID from auth claims
+        claims = getattr(req, 'auth_claims')
+        user_id = claims.get('sub') or claims.get('oid') or claims.get('name')
+
+        if not user_id:
+            return func.HttpResponse(
+                json.dumps({"error": "User not authenticated"}),
+                status_code=401,
+                mimetype="application/json"
+            )
+
+        story_id = req.route_params.get('storyId')
+        if not story_id:
+            return func.HttpResponse(
+                json.dumps({"error": "Story ID is required"}),
+                status_code=400,
+                mimetype="application/json"
+            )
+
+        size = req.params.get('size', 'original')
+        if size not in IMAGE_SIZES:
+            return func.HttpResponse(
+                json.dumps({"error": f"Invalid size. Must be one of: {', '.join(IMAGE_SIZES)}"}),
+                status_code=400,
+                mimetype="application/json"
+            )
+
+        # Ownership is checked once for the whole batch
+        story = await CosmosService().get_story_by_id(story_id, user_id)
+        if not story:
+            return func.HttpResponse(
+                json.dumps({"error": "Story not found or unauthorized"}),
+                status_code=404,
+                mimetype="application/json"
+            )
+
+        refs = story_blob_refs(story, size)
+        # Optional subset by blob name; names outside this story are ignored
+        names = [name.strip() for name in req.params.get('names', '').split(',') if name.strip()]
+        if names:
+            refs = [ref for ref in refs if ref[1] in names]
+
+        account_url = f"https://{(await get_config()).account_name}.blob.core.windows.net"
+        blob_service_client = get_client_pool().get_blob_service_client(account_url=account_url)
+        semaphore = asyncio.Semaphore(STORY_BLOBS_CONCURRENCY)
+        results = await asyncio.gather(*(fetch_blob(blob_service_client, ref, semaphore) for ref in refs))
+
+        parts = [(ref, result) for ref, result in zip(refs, results) if result is not None]
+        missing = [ref[1] for ref, result in zip(refs, results) if result is None]
+        boundary = uuid.uuid4().hex
+        headers = {"Content-Type": f"multipart/mixed; boundary={boundary}", "Cache-Control": "private, no-cache"}
+        if missing:
+            headers["X-Missing-Blobs"] = ",".join(missing)
+        logging.info(f"Returning {len(parts)} blobs for story {story_id} ({len(missing)} missing)")
+
+        return func.HttpResponse(
+            multipart_body(parts, boundary),
+            status_code=200,
+            mimetype="multipart/mixed",
+            headers=headers
+        )
+
+    except Exception as error:
+        logging.error(f'Error in GetStoryBlobs: {str(error)}')
+        return func.HttpResponse(
+            json.dumps({"error": str(error)}),
+            status_code=500,
+            mimetype="application/json"
+        )
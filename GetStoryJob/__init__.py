@@ -0,0 +1,52 @@
+# GetStoryJob/__init__.py
+import logging
+import json
+import azure.functions as func
+from ..shared.auth.decorator import require_auth
+from ..shared.services.cosmos_service import CosmosService
+from ..shared.services.story_jobs import job_status_response
+
+
+@require_auth
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        # Get user ID from auth claims
+        claims = getattr(req, 'auth_claims')
+        user_id = claims.get('sub') or claims.get('oid') or claims.get('name')
+
+        if not user_id:
+            return func.HttpResponse(
+                json.dumps({"error": "User not authenticated"}),
+                status_code=401,
+                mimetype="application/json"
+            )
+
+        job_id = req.route_params.get('jobId')
+        if not job_id:
+            return func.HttpResponse(
+                json.dumps({"error": "Job ID is required"}),
+                status_code=400,
+                mimetype="application/json"
+            )
+
+        job = await CosmosService().get_story_job(job_id, user_id)
+        if not job:
+            return func.HttpResponse(
+                json.dumps({"error": "Job not found or unauthorized"}),
+                status_code=404,
+                mimetype="application/json"
+            )
+
+        return func.HttpResponse(
+            json.dumps(job_status_response(job)),
+            mimetype="application/json",
+            headers={"Cache-Control": "no-store"}
+        )
+
+    except Exception as e:
+        logging.error(f"Error getting story job: {str(e)}")
+        return func.HttpResponse(
+            json.dumps({"error": str(e)}),
+            status_code=500,
+            mimetype="application/json"
+        )
@@ -1,21 +1,67 @@
 # api/GetTransactionHistory/__init__.py
 import logging
 import json
+from datetime import datetime, timezone
+from typing import Optional
 import azure.functions as func
+from azure.cosmos.exceptions import CosmosHttpResponseError
 from ..shared.auth.decorator import require_auth
 from ..shared.services.credit_service import CreditService
 
+MAX_PAGE_SIZE = 100
+
+
+def parse_history_date(value: Optional[str]) -> Optional[str]:
+  """
+  ISO date or timestamp from the query string, normalised to the naive UTC
+  format transactions are stored with (so string comparison orders by time)
+  """
+  if not value:
+      return None
+  parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+  if parsed.tzinfo is not None:
+      parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+  return parsed.isoformat()
+
+
 @require_auth
 async def main(req: func.HttpRequest) -> func.HttpResponse:
   try:
       claims = getattr(req, 'auth_claims')
       user_id = claims.get('sub') or claims.get('oid') or claims.get('name')
 
+      try:
+          page_size = min(max(int(req.params.get('pageSize', 20)), 1), MAX_PAGE_SIZE)
+          created_from = parse_history_date(req.params.get('from'))
+          created_to = parse_history_date(req.params.get('to'))
+      except ValueError:
+          return func.HttpResponse(
+              json.dumps({"error": "pageSize must be a number and from/to ISO dates"}),
+              status_code=400,
+              mimetype="application/json"
+          )
+
       credit_service = CreditService()
-      transactions = await credit_service.get_user_transactions(user_id)
+      # One page per call; the token from the previous page selects the next one
+      try:
+          result = await credit_service.get_user_transactions(
+              user_id,
+              page_size=page_size,
+              continuation_token=req.params.get('continuationToken'),
+              created_from=created_from,
+              created_to=created_to
+          )
+      except (ValueError, CosmosHttpResponseError) as e:
+          if isinstance(e, CosmosHttpResponseError) and e.status_code != 400:
+              raise
+          return func.HttpResponse(
+              json.dumps({"error": "Invalid continuation token"}),
+              status_code=400,
+              mimetype="application/json"
+          )
 
       return func.HttpResponse(
-          json.dumps({"transactions": transactions}),
+          json.dumps({"transactions": result["transactions"], "continuationToken": result["continuationToken"]}),
           status_code=200,
           mimetype="application/json"
       )
@@ -26,4 +72,4 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
           json.dumps({"error": str(error)}),
           status_code=500,
           mimetype="application/json"
-      )
\ No newline at end of file
+      )
@@ -7,6 +7,9 @@ from ..shared.services.cosmos_service import CosmosService
 from azure.identity import DefaultAzureCredential
 from azure.storage.blob import BlobServiceClient
 import os
+from azure.cosmos.exceptions import CosmosHttpResponseError
+
+MAX_PAGE_SIZE = 50
 
 @require_auth
 async def main(req: func.HttpRequest) -> func.HttpResponse:
@@ -23,10 +26,30 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
 
         # Initialize services
         cosmos_service = CosmosService()
-        page_size = int(req.params.get('pageSize', 10))
+        try:
+            page_size = min(max(int(req.params.get('pageSize', 10)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            return func.HttpResponse(
+                json.dumps({"error": "pageSize must be a number"}),
+                status_code=400,
+                mimetype="application/json"
+            )
 
-        # Get stories from Cosmos DB
-        result = await cosmos_service.get_user_stories(user_id=user_id, page_size=page_size)
+        # Get one page of stories from Cosmos DB; the token from the previous page selects the next one
+        try:
+            result = await cosmos_service.get_user_stories(
+                user_id=user_id,
+                page_size=page_size,
+                continuation_token=req.params.get('continuationToken')
+            )
+        except (ValueError, CosmosHttpResponseError) as e:
+            if isinstance(e, CosmosHttpResponseError) and e.status_code != 400:
+                raise
+            return func.HttpResponse(
+                json.dumps({"error": "Invalid continuation token"}),
+                status_code=400,
+                mimetype="application/json"
+            )
 
         # Process stories to use direct blob URLs (no SAS tokens needed with managed identity)
         processed_stories = []
@@ -38,6 +61,8 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
                     # Create API URL for image proxy
                     blob_name = front_url.split("/")[-1]
                     cover_images["frontCover"]["url"] = f"/api/blob/{blob_name}?container=storyfairy-images"
+                # Small/medium derivatives for the story grid (missing until backfilled on older stories)
+                cover_images["frontCover"]["thumbnails"] = cover_images["frontCover"].get("thumbnails", {})
 
             processed_story = {
                 "id": story["id"],
@@ -49,7 +74,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
             processed_stories.append(processed_story)
 
         return func.HttpResponse(
-            json.dumps({"stories": processed_stories}),
+            json.dumps({"stories": processed_stories, "continuationToken": result["continuationToken"]}),
             status_code=200,
             mimetype="application/json"
         )
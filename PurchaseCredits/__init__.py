@@ -6,8 +6,7 @@ import stripe
 import azure.functions as func
 from ..shared.auth.decorator import require_auth
 from ..shared.services.credit_service import CreditService
-
-stripe.api_key = os.environ.get('REACT_APP_STRIPE_SECRET_KEY')
+from ..shared.services.config_service import get_config
 
 @require_auth
 async def main(req: func.HttpRequest) -> func.HttpResponse:
@@ -34,6 +33,8 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
               mimetype="application/json"
           )
       base_url = 'http://localhost:3000' if os.getenv('ENVT') == 'Development' else 'https://www.storyfairy.app'
+      config = await get_config()
+      stripe.api_key = config.stripe_secret_key
       # Create Stripe checkout session
       session = stripe.checkout.Session.create(
           payment_method_types=['card'],
@@ -6,9 +6,13 @@ import uuid
 import azure.functions as func
 from ..shared.auth.decorator import require_auth
 from ..shared.services.cosmos_service import CosmosService
-from ..GenerateStory.__init__ import generate_image_stable_diffusion, generate_image_flux_schnell, generate_image_flux_pro, generate_image_google_imagen, save_to_blob_storage, generate_sas_token
+from ..shared.services.client_pool import get_client_pool
+from ..shared.services.config_service import get_config
+from ..shared.services.image_providers import IMAGE_PROVIDERS, generate_image
+from ..shared.services.blob_transfer import store_generated_image, thumbnail_urls
+from ..GenerateStory.__init__ import save_to_blob_storage, generate_sas_token
 import asyncio
-from urllib.parse import urlparse
+from urllib.parse import unquote, urlparse
 import aiohttp
 from azure.storage.blob import BlobServiceClient, ContentSettings, generate_blob_sas, BlobSasPermissions, __version__
 import pytz
@@ -62,47 +66,47 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
                     mimetype="application/json"
                 )
 
+        config = await get_config()
+        os.environ["REPLICATE_API_TOKEN"] = config.replicate_token
+
          # Extract the existing blob name from the imageUrl
         image_url = story["images"][image_index]["imageUrl"]
         parsed_url = urlparse(image_url)
-        image_filename = os.path.basename(parsed_url.path);
+        image_filename = unquote(os.path.basename(parsed_url.path));
         logging.info(f"Extracting image filename: {image_filename} from image url: {image_url}")
-        # Generate new image using existing functions
-        if image_model == 'flux_schnell':
-            image_url, _ = await generate_image_flux_schnell(prompt)
-        elif image_model == 'flux_pro':
-            image_url, _ = await generate_image_flux_pro(prompt)
-        elif image_model == 'stable_diffusion_3':
-            image_url, _ = await generate_image_stable_diffusion(prompt, story["images"][image_index]["imageUrl"])
-        elif image_model == 'imagen_3':
-            image_url, _ = await generate_image_google_imagen(prompt, os.environ.get('GEMINI_API_KEY'))
-        else:
+        if image_model not in IMAGE_PROVIDERS:
             return func.HttpResponse(
                 json.dumps({"error": f"Invalid image model: {image_model}"}),
                 mimetype="application/json",
                 status_code=400
             )
 
-        if not image_url:
+        # Generate new image through the shared provider registry (and its limits)
+        image = await generate_image(
+            image_model, prompt, config, request_key=story_id,
+            reference_image_url=story["images"][image_index]["imageUrl"] if image_model == 'stable_diffusion_3' else None
+        )
+
+        if not image:
             return func.HttpResponse(
                 json.dumps({"error": "Failed to generate image"}),
                 status_code=500,
                 mimetype="application/json"
             )
-        connection_string = os.environ.get('STORAGE_CONNECTION_STRING')
-        logging.info(f"Generate Image URL: {image_url}")
+        connection_string = config.storage_conn
+        logging.info(f"Generate Image URL: {image.url}")
         
          # Save to Blob Storage
-        async with aiohttp.ClientSession() as session:
-             async with session.get(image_url) as response:
-                    image_data = await response.read()
-                    saved_url = save_to_blob_storage(
-                        image_data, 
-                        "image/jpeg",
-                        "storyfairy-images",
-                        image_filename,
-                        connection_string
-                    )
+        # Keep the blob name; only the extension follows the stored format
+        blob_service_client = get_client_pool().get_async_blob_service_client(connection_string)
+        stored = await store_generated_image(
+            image,
+            "storyfairy-images",
+            os.path.splitext(image_filename)[0],
+            connection_string,
+            blob_service_client=blob_service_client
+        )
+        saved_url = stored.url if stored else None
 
         if not saved_url:
                 return func.HttpResponse(
@@ -111,15 +115,25 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
                     mimetype="application/json"
                 )
         logging.info(f"Saved image to blob storage: {saved_url}")
+        if stored.blob_name != image_filename:
+            try:
+                await blob_service_client.get_blob_client("storyfairy-images", image_filename).delete_blob()
+            except Exception as e:
+                logging.warning(f"Could not delete previous image {image_filename}: {e}")
         
         parsed_url = urlparse(saved_url)
         blob_name = os.path.basename(parsed_url.path)
         image_url = f"/api/blob/{blob_name}"
         
-        image_url_without_sas = f"/api/blob/{blob_name}?container=storyfairy-images"
+        # The blob is overwritten in place and GetBlob responses are cached as immutable,
+        # so every regeneration gets a new version in its URLs
+        version = uuid.uuid4().hex[:12]
+        image_url_without_sas = f"/api/blob/{blob_name}?container=storyfairy-images&v={version}"
         
         #Update Cosmos DB
         story["images"][image_index]["imageUrl"] = image_url
+        story["images"][image_index]["version"] = version
+        story["images"][image_index]["thumbnails"] = thumbnail_urls(stored.thumbnails, version)
         await cosmos_service.update_story(story)
 
         return func.HttpResponse(
@@ -6,9 +6,8 @@ import stripe
 import azure.functions as func
 from ..shared.services.credit_service import CreditService
 from ..shared.services.cosmos_service import CosmosService
+from ..shared.services.config_service import get_config
 from datetime import datetime, timedelta
-stripe.api_key = os.environ.get('REACT_APP_STRIPE_SECRET_KEY')
-webhook_secret = os.environ.get('REACT_APP_STRIPE_WEBHOOK_SECRET')
 
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
@@ -18,9 +17,12 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
 
         logging.info(f"Received webhook with signature: {sig_header}")
 
+        config = await get_config()
+        stripe.api_key = config.stripe_secret_key
+
         try:
             event = stripe.Webhook.construct_event(
-                payload, sig_header, webhook_secret
+                payload, sig_header, config.stripe_webhook_secret
             )
             logging.info(f"Webhook event constructed successfully: {event['type']}")
         except ValueError as e:
@@ -7,8 +7,8 @@ import stripe
 from datetime import datetime, timedelta
 from ..shared.services.cosmos_service import CosmosService
 from ..shared.auth.decorator import require_auth
+from ..shared.services.config_service import get_config
 
-stripe.api_key = os.environ.get('REACT_APP_STRIPE_SECRET_KEY')
 #SUBSCRIPTION_PRICE_ID = os.environ.get('REACT_APP_STRIPE_SUBSCRIPTION_PRICE_ID')
 
 @require_auth
@@ -54,6 +54,8 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
         base_url = 'http://localhost:3000' if os.getenv('ENVT') == 'Development' else 'https://www.storyfairy.app'
+        config = await get_config()
+        stripe.api_key = config.stripe_secret_key
         # Create Stripe checkout session
         session = stripe.checkout.Session.create(
             mode='subscription',
@@ -0,0 +1,168 @@
+# api/benchmarks/auth_throughput.py
+"""
+Cost of AuthMiddleware.validate_token on its three paths.
+
+A local HTTP server stands in for the B2C JWKS endpoint and RS256 tokens are
+minted with the issuer/audience shape the middleware expects:
+
+  cold_key      new key store for every call: JWKS fetch + signature check
+  warm_key      keys already cached, token cache off: signature check only
+  cached_token  the same token again: served from the validated-token cache
+
+Validations per second and p50/p99 latency are written as JSON. With
+--baseline, throughput below (1 - tolerance) of the baseline fails the run.
+
+    python benchmarks/auth_throughput.py --iterations 2000 --output auth.json
+    python benchmarks/auth_throughput.py --baseline auth.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.auth.jwks import JWKSKeyStore, TokenCache  # noqa: E402
+from shared.auth.middleware import AuthMiddleware  # noqa: E402
+
+TENANT = "storyfairy"
+CLIENT_ID = "00000000-0000-0000-0000-000000000001"
+USER_FLOW = "B2C_1_Benchmark"
+TENANT_ID = "00000000-0000-0000-0000-000000000002"
+KID = "benchmark-key"
+
+
+def start_jwks_server(private_key) -> str:
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({"kid": KID, "use": "sig", "alg": "RS256"})
+    body = json.dumps({"keys": [jwk]}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; without this, delayed ACKs add ~40 ms per fetch
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/{TENANT}.onmicrosoft.com/discovery/v2.0/keys?p={USER_FLOW}"
+
+
+def mint_token(private_key, issuer: str, lifetime: int = 3600) -> str:
+    now = int(time.time())
+    claims = {
+        "sub": "benchmark-user",
+        "aud": CLIENT_ID,
+        "iss": issuer,
+        "iat": now,
+        "nbf": now,
+        "exp": now + lifetime,
+        "name": "Benchmark User",
+        "tfp": USER_FLOW,
+    }
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": KID})
+
+
+def measure(mode: str, iterations: int, validate) -> dict:
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        call_started = time.perf_counter()
+        validate(i)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "mode": mode,
+        "iterations": iterations,
+        "validations_per_second": round(iterations / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 4),
+        "p99_ms": round(latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000, 4),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 4),
+    }
+
+
+def run(iterations: int, cold_iterations: int) -> dict:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwks_uri = start_jwks_server(private_key)
+    middleware = AuthMiddleware(TENANT, CLIENT_ID, USER_FLOW, TENANT_ID, jwks_uri=jwks_uri)
+    token = mint_token(private_key, middleware.issuer)
+
+    def cold(_):
+        middleware._key_store = JWKSKeyStore(jwks_uri)
+        middleware._token_cache = TokenCache(max_entries=0)
+        middleware.validate_token(token)
+
+    def warm(_):
+        middleware.validate_token(token)
+
+    results = [measure("cold_key", cold_iterations, cold)]
+
+    middleware._key_store = JWKSKeyStore(jwks_uri)
+    middleware._token_cache = TokenCache(max_entries=0)
+    middleware.validate_token(token)
+    results.append(measure("warm_key", iterations, warm))
+
+    middleware._token_cache = TokenCache()
+    middleware.validate_token(token)
+    results.append(measure("cached_token", iterations, warm))
+
+    return {"benchmark": "auth_throughput", "python": sys.version.split()[0], "results": results}
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Modes whose throughput fell below (1 - tolerance) of the baseline"""
+    previous = {result["mode"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get(result["mode"])
+        if before and result["validations_per_second"] < before["validations_per_second"] * (1 - tolerance):
+            regressions.append({
+                "mode": result["mode"],
+                "baseline_per_second": before["validations_per_second"],
+                "current_per_second": result["validations_per_second"],
+            })
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000, help="validations for the warm and cached paths")
+    parser.add_argument("--cold-iterations", type=int, default=200, help="validations for the cold-key path")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed throughput drop versus the baseline")
+    args = parser.parse_args()
+
+    report = run(args.iterations, args.cold_iterations)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
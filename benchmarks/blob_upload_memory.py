@@ -0,0 +1,172 @@
+# api/benchmarks/blob_upload_memory.py
+"""
+Peak memory of moving generated images into blob storage.
+
+A local server stands in for the image provider (serving a noise PNG of the
+requested size) and a stand-in blob client accepts (and drops) the uploaded
+bytes. Each simulated request saves a story's worth of images concurrently,
+first with the previous pattern (`response.read()` then one `upload_blob`)
+and then through `store_generated_image`: spooled download, transcoding off
+the event loop and the staged-block upload. Peak traced memory is reported
+per request.
+
+    python benchmarks/blob_upload_memory.py --requests 4 --images 15 --image-mb 2
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from aiohttp import web
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.services.blob_transfer import BLOB_BLOCK_SIZE, BLOB_UPLOAD_MAX_INFLIGHT, store_generated_image  # noqa: E402
+from shared.services.client_pool import get_client_pool  # noqa: E402
+from shared.services.image_providers import GeneratedImage  # noqa: E402
+
+
+class StandInBlobClient:
+    """Accepts uploads like a block blob client, counting and dropping the bytes"""
+
+    def __init__(self, container: str, blob: str, latency: float):
+        self.url = f"https://standin.blob.core.windows.net/{container}/{blob}"
+        self.latency = latency
+        self.bytes_received = 0
+
+    async def _consume(self, data) -> None:
+        await asyncio.sleep(self.latency)
+        self.bytes_received += len(data)
+
+    async def upload_blob(self, data, **kwargs) -> None:
+        await self._consume(data)
+
+    async def stage_block(self, block_id: str, data: bytes, **kwargs) -> None:
+        await self._consume(data)
+
+    async def commit_block_list(self, block_list, **kwargs) -> None:
+        await asyncio.sleep(self.latency)
+
+
+class StandInBlobServiceClient:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def get_blob_client(self, container: str, blob: str) -> StandInBlobClient:
+        return StandInBlobClient(container, blob, self.latency)
+
+
+def noise_png(size_mb: float) -> bytes:
+    """Incompressible RGB noise, so the PNG is about `size_mb` and transcoding does real work"""
+    side = max(int((size_mb * 2 ** 20 / 3) ** 0.5), 16)
+    out = io.BytesIO()
+    Image.frombytes("RGB", (side, side), os.urandom(side * side * 3)).save(out, format="PNG", compress_level=1)
+    return out.getvalue()
+
+
+def start_image_server(image: bytes) -> str:
+    started = threading.Event()
+    state = {}
+
+    async def serve_image(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "image/png"})
+        response.content_length = len(image)
+        await response.prepare(request)
+        view = memoryview(image)
+        for offset in range(0, len(image), 64 * 1024):
+            await response.write(view[offset:offset + 64 * 1024])
+        await response.write_eof()
+        return response
+
+    def serve() -> None:
+        loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_get("/image/{index}", serve_image)
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        state["port"] = site._server.sockets[0].getsockname()[1]
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    started.wait()
+    return f"http://127.0.0.1:{state['port']}"
+
+
+async def buffered_save(image: GeneratedImage, blob_service_client, blob_name: str) -> None:
+    """The previous pattern: read the whole response, then upload it in one call"""
+    session = get_client_pool().get_http_session()
+    async with session.get(image.url) as response:
+        data = await response.read()
+    await blob_service_client.get_blob_client("storyfairy-images", blob_name).upload_blob(data)
+
+
+async def streamed_save(image: GeneratedImage, blob_service_client, blob_name: str) -> None:
+    stored = await store_generated_image(image, "storyfairy-images", os.path.splitext(blob_name)[0], "",
+                                         blob_service_client=blob_service_client, thumbnails=False)
+    if stored is None:
+        raise RuntimeError(f"Storing {blob_name} failed")
+
+
+async def measure(mode: str, save, base_url: str, requests: int, images: int, latency: float) -> dict:
+    blob_service_client = StandInBlobServiceClient(latency)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        save(GeneratedImage(prompt="", url=f"{base_url}/image/{i}"), blob_service_client, f"r{r}-image{i}.png")
+        for r in range(requests) for i in range(images)
+    ))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": mode,
+        "seconds": round(elapsed, 3),
+        "peak_mb": round(peak / 2 ** 20, 2),
+        "peak_mb_per_request": round(peak / requests / 2 ** 20, 2)
+    }
+
+
+async def run(requests: int, images: int, image_mb: float, latency: float) -> dict:
+    image = noise_png(image_mb)
+    base_url = start_image_server(image)
+    # Warm up the shared session so connection setup is not measured
+    await streamed_save(GeneratedImage(prompt="", url=f"{base_url}/image/0"), StandInBlobServiceClient(0), "warmup")
+
+    results = [
+        await measure("buffered", buffered_save, base_url, requests, images, latency),
+        await measure("streamed", streamed_save, base_url, requests, images, latency),
+    ]
+    await get_client_pool().aclose()
+    return {
+        "benchmark": "blob_upload_memory",
+        "requests": requests,
+        "images_per_request": images,
+        "image_mb": image_mb,
+        "block_size_mb": round(BLOB_BLOCK_SIZE / 2 ** 20, 2),
+        "max_inflight_blocks": BLOB_UPLOAD_MAX_INFLIGHT,
+        "results": results
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=4, help="concurrent story requests")
+    parser.add_argument("--images", type=int, default=15, help="images per request")
+    parser.add_argument("--image-mb", type=float, default=2.0, help="size of each image in MiB")
+    parser.add_argument("--latency", type=float, default=0.01, help="stand-in blob latency per call in seconds")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests, args.images, args.image_mb, args.latency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
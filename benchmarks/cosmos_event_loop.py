@@ -0,0 +1,170 @@
+# api/benchmarks/cosmos_event_loop.py
+"""
+Event-loop stall of story reads with the sync and async Cosmos clients.
+
+A local stand-in Cosmos endpoint (aiohttp, on its own thread) answers the
+account lookup and story point reads with a fixed per-request latency. The
+same batch of concurrent `get_story_by_id`-style reads is issued from one
+event loop in two ways:
+
+  sync   the previous CosmosService: a sync CosmosClient called from the
+         async function, so every round trip blocks the worker's loop
+  async  the current CosmosService on the pooled azure.cosmos.aio client
+
+While the batch runs a ticker coroutine wakes every --tick-ms and records how
+late it was woken. Reported per mode: wall time, reads per second, the
+longest single stall and the total time the loop was stalled.
+
+    python benchmarks/cosmos_event_loop.py --reads 200 --concurrency 20 --latency-ms 20
+"""
+import argparse
+import asyncio
+import base64
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+from aiohttp import web
+from azure.cosmos import CosmosClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Function modules use package-relative imports; load them the way the host does, under `__app__`
+app_package = types.ModuleType("__app__")
+app_package.__path__ = [ROOT]
+sys.modules["__app__"] = app_package
+
+cosmos_service = importlib.import_module("__app__.shared.services.cosmos_service")
+client_pool = importlib.import_module("__app__.shared.services.client_pool")
+
+USER_ID = "bench-user"
+
+
+def start_cosmos_standin(latency: float) -> str:
+    """Serve the minimum of the Cosmos REST API needed for point reads; returns the endpoint URL"""
+    state = {}
+
+    async def database_account(request):
+        endpoint = state["endpoint"]
+        return web.json_response({
+            "id": "standin",
+            "_rid": "standin",
+            "_self": "",
+            "media": "//media/",
+            "addresses": "//addresses/",
+            "_dbs": "//dbs/",
+            "writableLocations": [{"name": "Local", "databaseAccountEndpoint": endpoint}],
+            "readableLocations": [{"name": "Local", "databaseAccountEndpoint": endpoint}],
+            "enableMultipleWriteLocations": False,
+            "userConsistencyPolicy": {"defaultConsistencyLevel": "Session"},
+            "queryEngineConfiguration": "{}"
+        })
+
+    async def read_document(request):
+        await asyncio.sleep(latency)
+        story_id = request.match_info["doc"]
+        return web.json_response(
+            {"id": story_id, "userId": USER_ID, "title": f"Story {story_id}", "_etag": '"1"'},
+            headers={"x-ms-request-charge": "1", "x-ms-session-token": "0:1#1"}
+        )
+
+    app = web.Application()
+    app.router.add_get("/", database_account)
+    app.router.add_get("/dbs/{db}/colls/{coll}/docs/{doc}/", read_document)
+
+    ready = threading.Event()
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(app, access_log=None)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        state["endpoint"] = f"http://127.0.0.1:{port}/"
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return state["endpoint"]
+
+
+class BlockingStoryReader:
+    """The pre-async CosmosService read path: sync client inside a coroutine"""
+    def __init__(self, connection_string: str):
+        client = CosmosClient.from_connection_string(connection_string)
+        self.container = client.get_database_client(cosmos_service.DATABASE_NAME).get_container_client("UserStories")
+
+    async def get_story_by_id(self, story_id: str, user_id: str):
+        return self.container.read_item(item=story_id, partition_key=user_id)
+
+
+async def measure_stalls(reader, reads: int, concurrency: int, tick: float) -> dict:
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            expected = time.perf_counter() + tick
+            await asyncio.sleep(tick)
+            stalls.append(max(0.0, time.perf_counter() - expected))
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def read(i: int):
+        async with semaphore:
+            story = await reader.get_story_by_id(f"story-{i}", USER_ID)
+            assert story and story["id"] == f"story-{i}"
+
+    # One warm-up read so account discovery and connection setup are not measured
+    await reader.get_story_by_id("warmup", USER_ID)
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(tick)
+    started = time.perf_counter()
+    await asyncio.gather(*(read(i) for i in range(reads)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticker_task
+
+    return {
+        "reads": reads,
+        "seconds": round(elapsed, 3),
+        "reads_per_second": round(reads / elapsed, 1),
+        "max_stall_ms": round(max(stalls, default=0.0) * 1000, 1),
+        "total_stall_ms": round(sum(s for s in stalls if s > tick) * 1000, 1),
+        "ticks": len(stalls)
+    }
+
+
+async def run(reads: int, concurrency: int, latency: float, tick: float) -> dict:
+    endpoint = start_cosmos_standin(latency)
+    account_key = base64.b64encode(b"standin-account-key").decode()
+    connection_string = f"AccountEndpoint={endpoint};AccountKey={account_key};"
+
+    report = {"reads": reads, "concurrency": concurrency, "latency_ms": latency * 1000, "tick_ms": tick * 1000}
+    report["sync"] = await measure_stalls(BlockingStoryReader(connection_string), reads, concurrency, tick)
+
+    client = client_pool.get_client_pool().get_async_cosmos_client(connection_string)
+    report["async"] = await measure_stalls(cosmos_service.CosmosService(client=client), reads, concurrency, tick)
+    await client_pool.get_client_pool().aclose()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reads", type=int, default=200, help="story reads per mode")
+    parser.add_argument("--concurrency", type=int, default=20, help="reads in flight at once")
+    parser.add_argument("--latency-ms", type=float, default=20, help="stand-in latency per read")
+    parser.add_argument("--tick-ms", type=float, default=5, help="ticker interval used to detect stalls")
+    args = parser.parse_args()
+    report = asyncio.run(run(args.reads, args.concurrency, args.latency_ms / 1000, args.tick_ms / 1000))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
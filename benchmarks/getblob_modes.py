@@ -0,0 +1,157 @@
+# api/benchmarks/getblob_modes.py
+"""
+Worker throughput of GetBlob in proxy and redirect modes.
+
+A stand-in blob client (registered in the client pool in place of the real
+one) serves image bytes with a fixed per-download latency. The same batch of
+image requests is sent through GetBlob's `main` in each mode:
+
+  proxy        every request downloads and returns the bytes (hot cache off)
+  proxy-cached the hot-blob cache is warm, so bytes come from worker memory
+  redirect     GetBlob answers 302 to a cached, account-key signed SAS URL
+
+Requests per second, worker CPU time and body bytes returned are reported.
+
+    python benchmarks/getblob_modes.py --requests 2000 --blobs 50 --image-kb 300
+"""
+import argparse
+import asyncio
+import base64
+import importlib
+import json
+import os
+import sys
+import time
+import types
+from datetime import datetime, timezone
+
+import azure.functions as func
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Function modules use package-relative imports; load them the way the host does, under `__app__`
+app_package = types.ModuleType("__app__")
+app_package.__path__ = [ROOT]
+sys.modules["__app__"] = app_package
+
+getblob = importlib.import_module("__app__.GetBlob")
+blob_cache = importlib.import_module("__app__.shared.services.blob_cache")
+client_pool = importlib.import_module("__app__.shared.services.client_pool")
+
+ACCOUNT_NAME = "standin"
+CONTAINER = "storyfairy-images"
+
+
+class StandInDownload:
+    def __init__(self, data: bytes, offset: int):
+        self.data = data[offset:]
+        self.properties = types.SimpleNamespace(
+            etag='"0x1"',
+            last_modified=datetime(2024, 1, 1, tzinfo=timezone.utc),
+            content_range=f"bytes {offset}-{len(data) - 1}/{len(data)}",
+            content_settings=types.SimpleNamespace(content_type="image/webp")
+        )
+
+    def readall(self) -> bytes:
+        return self.data
+
+
+class StandInBlobClient:
+    def __init__(self, service: "StandInBlobServiceClient", blob_name: str):
+        self.service = service
+        self.blob_name = blob_name
+
+    def download_blob(self, offset: int = 0, length=None, **kwargs) -> StandInDownload:
+        # The proxy path uses the sync client, so the latency blocks the worker like a real download
+        time.sleep(self.service.latency)
+        self.service.downloads += 1
+        return StandInDownload(self.service.image, offset)
+
+
+class StandInBlobServiceClient:
+    def __init__(self, image: bytes, latency: float):
+        self.image = image
+        self.latency = latency
+        self.downloads = 0
+
+    def get_container_client(self, container: str):
+        return types.SimpleNamespace(get_blob_client=lambda name: StandInBlobClient(self, name))
+
+    def close(self) -> None:
+        pass
+
+
+async def measure(mode: str, requests: int, blobs: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+    body_bytes = 0
+
+    async def one(index: int) -> None:
+        nonlocal body_bytes
+        req = func.HttpRequest("GET", f"/api/blob/image{index % blobs}.webp", body=b"",
+                               params={"container": CONTAINER}, route_params={"blob_name": f"image{index % blobs}.webp"})
+        async with semaphore:
+            response = await getblob.main(req)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        body_bytes += len(response.get_body())
+
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 1),
+        "cpu_ms_per_request": round((time.process_time() - cpu_started) * 1000 / requests, 3),
+        "body_mb": round(body_bytes / 2 ** 20, 2),
+        "statuses": statuses
+    }
+
+
+async def run(requests: int, blobs: int, image_kb: int, latency: float, concurrency: int) -> dict:
+    os.environ.pop("KEY_VAULT_URI", None)
+    os.environ["ACCOUNT_NAME"] = ACCOUNT_NAME
+    os.environ["ACCOUNT_KEY"] = base64.b64encode(os.urandom(64)).decode()
+
+    service = StandInBlobServiceClient(os.urandom(image_kb * 1024), latency)
+    account_url = f"https://{ACCOUNT_NAME}.blob.core.windows.net"
+    client_pool.get_client_pool().register(client_pool._key("blob", account_url), service)
+
+    results = []
+    getblob.GETBLOB_MODE = "proxy"
+    blob_cache._blob_cache = blob_cache.BlobCache(max_item_bytes=0)
+    results.append(await measure("proxy", requests, blobs, concurrency))
+
+    blob_cache._blob_cache = blob_cache.BlobCache()
+    await measure("warmup", blobs, blobs, concurrency)
+    results.append(await measure("proxy-cached", requests, blobs, concurrency))
+
+    getblob.GETBLOB_MODE = "redirect"
+    results.append(await measure("redirect", requests, blobs, concurrency))
+
+    return {
+        "benchmark": "getblob_modes",
+        "requests": requests,
+        "distinct_blobs": blobs,
+        "image_kb": image_kb,
+        "download_latency_s": latency,
+        "concurrency": concurrency,
+        "storage_downloads": service.downloads,
+        "results": results
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="image requests per mode")
+    parser.add_argument("--blobs", type=int, default=50, help="distinct blobs requested")
+    parser.add_argument("--image-kb", type=int, default=300, help="size of each image in KiB")
+    parser.add_argument("--latency", type=float, default=0.005, help="stand-in download latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests, args.blobs, args.image_kb, args.latency, args.concurrency)),
+                     indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# api/benchmarks/llm_concurrency.py
+"""
+Concurrency benchmark for the LLM provider adapters.
+
+Starts a local fake OpenAI-compatible server that answers every chat
+completion after a fixed delay, then fires N story generations at it on one
+event loop: once through the async provider adapters and once through the
+previous pattern (synchronous SDK call inside an `async def`). With
+non-blocking adapters N parallel requests finish in roughly the time of one.
+
+    python -m benchmarks.llm_concurrency --requests 16 --delay 0.5
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+import openai
+from aiohttp import web
+
+from shared.services.client_pool import get_client_pool
+from shared.services.llm_providers import GrokProvider, OpenAIProvider
+
+STORY = json.dumps({"Title": "Benchmark", "sentences": ["Once upon a time.", "The end."]})
+
+
+def start_fake_llm_server(delay: float) -> str:
+    """Serve /v1/chat/completions from a background thread; returns the base url"""
+    started = threading.Event()
+    state = {}
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        body = await request.json()
+        await asyncio.sleep(delay)
+        return web.json_response({
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": STORY}
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        })
+
+    def serve() -> None:
+        loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", chat_completions)
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        state["port"] = site._server.sockets[0].getsockname()[1]
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    started.wait()
+    return f"http://127.0.0.1:{state['port']}/v1"
+
+
+async def blocking_completion(base_url: str, prompt: str) -> str:
+    """The previous implementation: a synchronous SDK call on the event loop"""
+    client = get_client_pool().get_openai_client("benchmark-key", base_url=base_url)
+    response = client.chat.completions.create(
+        model="gpt-4o-mini", messages=[{"role": "user", "content": prompt}]
+    )
+    return response.choices[0].message.content
+
+
+async def timed(label: str, calls) -> dict:
+    started = time.perf_counter()
+    results = await asyncio.gather(*calls)
+    elapsed = time.perf_counter() - started
+    return {"mode": label, "requests": len(results), "seconds": round(elapsed, 3)}
+
+
+async def run(requests: int, delay: float) -> dict:
+    base_url = start_fake_llm_server(delay)
+    providers = {
+        "openai": OpenAIProvider("benchmark-key", base_url=base_url),
+        "grok": GrokProvider("benchmark-key", base_url=base_url),
+    }
+
+    # Warm up connections so every mode starts from the same pool state
+    await providers["openai"].complete("warm up")
+    await blocking_completion(base_url, "warm up")
+
+    single = await timed("single", [providers["openai"].complete("story")])
+    results = [single]
+    for name, provider in providers.items():
+        results.append(await timed(f"async_{name}", [provider.complete(f"story {i}") for i in range(requests)]))
+    results.append(await timed("blocking_openai", [blocking_completion(base_url, f"story {i}") for i in range(requests)]))
+
+    await get_client_pool().aclose()
+    for result in results:
+        result["x_single"] = round(result["seconds"] / single["seconds"], 2)
+    return {
+        "benchmark": "llm_concurrency",
+        "server_delay_seconds": delay,
+        "results": results,
+        "client_pool": get_client_pool().stats()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=16, help="parallel requests per mode")
+    parser.add_argument("--delay", type=float, default=0.5, help="fake LLM latency in seconds")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests, args.delay)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
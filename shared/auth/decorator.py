@@ -5,7 +5,8 @@ import os
 from typing import Callable, TypeVar, cast
 from azure.functions import HttpRequest, HttpResponse
 from functools import wraps
-from .middleware import AuthMiddleware
+from .middleware import get_auth_middleware
+from ..services.cosmos_metrics import COSMOS_RU_HEADER, COSMOS_RU_HEADER_ENABLED, begin_request
 from azure.keyvault.secrets import SecretClient
 from azure.identity import DefaultAzureCredential
 
@@ -20,13 +21,17 @@ def get_secrets_from_keyvault(secret_name: str) -> str:
 
 def require_auth(func: T) -> T:
   """Decorator to require authentication for Function App endpoints"""
+  # Function folder name (e.g. "GetUserStories"), used to tag Cosmos metrics
+  function_name = func.__module__.rsplit(".", 1)[-1]
+
   @wraps(func)
   async def wrapper(req: HttpRequest, *args, **kwargs) -> HttpResponse:
+      cosmos_usage = begin_request(function_name)
       try:
           #logging.info(f"Logging the token from the request in decorator before extracting it in middleware: {req.headers.get('X-My-Auth-Token')}")
       
-          # Initialize AuthMiddleware here instead of importing
-          auth_middleware = AuthMiddleware(
+          # Worker-level middleware: JWKS keys and validated tokens are cached across requests
+          auth_middleware = get_auth_middleware(
               tenant="storyfairy",
               client_id="acbb77b8-2056-46eb-8026-8c6bcb9b73cd",
               user_flow="B2C_1_Storyfairy_SUSI",
@@ -48,7 +53,10 @@ def require_auth(func: T) -> T:
           claims = auth_middleware.validate_token(token)
           setattr(req, 'auth_claims', claims)
 
-          return await func(req, *args, **kwargs)
+          response = await func(req, *args, **kwargs)
+          if COSMOS_RU_HEADER_ENABLED and cosmos_usage.calls:
+              response.headers[COSMOS_RU_HEADER] = cosmos_usage.header_value()
+          return response
 
       except Exception as e:
           logging.error(f"Authentication error: {str(e)}")
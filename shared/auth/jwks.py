@@ -0,0 +1,146 @@
+# api/shared/auth/jwks.py
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import jwt
+from ..services.client_pool import get_client_pool
+
+# Signing keys are refreshed in the background once they are this old
+JWKS_REFRESH_SECONDS = float(os.environ.get("AUTH_JWKS_REFRESH_SECONDS", "3600"))
+# An unknown kid triggers a refetch at most this often, so bogus tokens cannot hammer the JWKS endpoint
+JWKS_MIN_REFRESH_SECONDS = float(os.environ.get("AUTH_JWKS_MIN_REFRESH_SECONDS", "30"))
+JWKS_TIMEOUT_SECONDS = float(os.environ.get("AUTH_JWKS_TIMEOUT_SECONDS", "5"))
+TOKEN_CACHE_SIZE = int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", "10000"))
+
+
+class JWKSKeyStore:
+    """
+    Signing keys of one JWKS endpoint, indexed by `kid`. Keys past the
+    refresh interval are still served while a background thread refetches
+    them; a `kid` that is not in the store (key rotation) triggers a
+    rate-limited synchronous refetch. A failed refresh keeps the old keys.
+    """
+
+    def __init__(self, jwks_uri: str, refresh_interval: float = JWKS_REFRESH_SECONDS,
+                 min_refresh_interval: float = JWKS_MIN_REFRESH_SECONDS):
+        self.jwks_uri = jwks_uri
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[str, Any] = {}
+        self._fetched_at = 0.0
+        self._attempted_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._stats = {"fetches": 0, "background_refreshes": 0, "unknown_kid_refreshes": 0, "errors": 0}
+
+    def get_signing_key(self, kid: Optional[str]) -> Any:
+        """The verification key for `kid`; raises jwt.PyJWKClientError when it cannot be found"""
+        if not self._keys:
+            self._refresh()
+        elif time.monotonic() - self._fetched_at >= self.refresh_interval:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._attempted_at >= self.min_refresh_interval:
+            self._stats["unknown_kid_refreshes"] += 1
+            self._refresh()
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.PyJWKClientError(f'Unable to find a signing key that matches: "{kid}"')
+        return key
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        self._stats["background_refreshes"] += 1
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self) -> None:
+        with self._lock:
+            self._attempted_at = time.monotonic()
+        try:
+            response = get_client_pool().get_requests_session().get(self.jwks_uri, timeout=JWKS_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            jwk_set = jwt.PyJWKSet.from_dict(response.json())
+            keys = {key.key_id: key.key for key in jwk_set.keys if key.public_key_use in (None, "sig")}
+            with self._lock:
+                self._keys = keys
+                self._fetched_at = time.monotonic()
+            self._stats["fetches"] += 1
+            logging.info(f"Fetched {len(keys)} signing keys from {self.jwks_uri}")
+        except Exception as e:
+            self._stats["errors"] += 1
+            logging.error(f"Error fetching JWKS from {self.jwks_uri}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "keys": len(self._keys)}
+
+
+class TokenCache:
+    """
+    Bounded LRU of already-validated tokens, keyed by the SHA-256 of the raw
+    token (the token itself is never kept). Entries expire at the token's
+    `exp`, so a cached token is never accepted after it would have failed
+    validation.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return dict(entry[0])
+            if entry is not None:
+                del self._entries[key]
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        expires_at = claims.get("exp")
+        if not isinstance(expires_at, (int, float)) or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[self._key(token)] = (dict(claims), float(expires_at))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {**self._stats, "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries)}
+
+
+_key_stores: Dict[str, JWKSKeyStore] = {}
+_key_stores_lock = threading.Lock()
+
+
+def get_jwks_key_store(jwks_uri: str) -> JWKSKeyStore:
+    """Return the worker-level key store for a JWKS endpoint"""
+    with _key_stores_lock:
+        store = _key_stores.get(jwks_uri)
+        if store is None:
+            store = JWKSKeyStore(jwks_uri)
+            _key_stores[jwks_uri] = store
+        return store
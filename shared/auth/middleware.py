@@ -1,13 +1,14 @@
 # api/shared/auth/middleware.py
 import jwt
-from jwt import PyJWKClient
 import logging
-from typing import Optional, Dict, Any
+import threading
+from typing import Optional, Dict, Any, Tuple
 from azure.functions import HttpRequest
+from .jwks import TokenCache, get_jwks_key_store
 
 class AuthMiddleware:
-  def __init__(self, tenant: str, client_id: str, user_flow: str, tenant_id: str):
-      """Initialize Auth Middleware"""
+  def __init__(self, tenant: str, client_id: str, user_flow: str, tenant_id: str, jwks_uri: Optional[str] = None):
+      """Initialize Auth Middleware; `jwks_uri` overrides the B2C keys endpoint (local stand-ins)"""
       self.tenant = tenant
       self.client_id = client_id
       self.user_flow = user_flow
@@ -16,13 +17,14 @@ class AuthMiddleware:
       #logging.info("Initializing Auth Middleware")
       
       # JWKS URL for key fetching
-      self.jwks_uri = f"https://{self.tenant}.b2clogin.com/{self.tenant}.onmicrosoft.com/discovery/v2.0/keys?p={self.user_flow}"
+      self.jwks_uri = jwks_uri or f"https://{self.tenant}.b2clogin.com/{self.tenant}.onmicrosoft.com/discovery/v2.0/keys?p={self.user_flow}"
 
       # Token Issuer
       self.issuer = f"https://{self.tenant}.b2clogin.com/{self.tenant_id}/v2.0/"
       
-      # Initialize PyJWKClient
-      self._jwks_client = PyJWKClient(self.jwks_uri)
+      # Worker-level signing keys (shared by every middleware for this endpoint) and validated tokens
+      self._key_store = get_jwks_key_store(self.jwks_uri)
+      self._token_cache = TokenCache()
 
       # Log initialization parameters
     #   logging.info("Auth middleware initialized with:")
@@ -54,21 +56,17 @@ class AuthMiddleware:
   def validate_token(self, token: str) -> Dict[str, Any]:
       """Validate JWT token and return claims if valid"""
       try:
-          #logging.info(f"Validating token: {token}")
-          # Decode the JWT header without verification to extract the 'kid' 
-          #unverified_header = jwt.get_unverified_header(token) 
-          #logging.info(f"Unverified JWT header: {unverified_header}")
+          # Tokens validated before (and not yet expired) skip the signature check
+          claims = self._token_cache.get(token)
+          if claims is not None:
+              return claims
 
-          # Fetch the signing key using the 'kid' from the header
-          signing_key = self._jwks_client.get_signing_key_from_jwt(token)
-          if signing_key is None: 
-             logging.error("Unable to find a signing key") 
-          else: 
-             #logging.info(f"Found the Signing key: {signing_key.key}")
-             #logging.info(f"Found the Signing key")
-            claims = jwt.decode(
+          # Look up the signing key by the 'kid' in the unverified JWT header
+          kid = jwt.get_unverified_header(token).get('kid')
+          signing_key = self._key_store.get_signing_key(kid)
+          claims = jwt.decode(
               token,
-              signing_key.key,
+              signing_key,
               algorithms=['RS256'],
               audience=self.client_id,
               issuer=self.issuer,
@@ -78,9 +76,7 @@ class AuthMiddleware:
                   'verify_exp': True
               }
           )
-          #logging.info(f"Expected issuer: {self.issuer}")
-          #logging.info(f"Token issuer: {claims.get('iss')}")
-          #logging.info(f"Token validated successfully with issuer: {self.issuer}")
+          self._token_cache.put(token, claims)
           return claims
 
       except jwt.ExpiredSignatureError:
@@ -91,4 +87,22 @@ class AuthMiddleware:
           raise
       except Exception as e:
           logging.error(f"Token validation failed: {str(e)}")
-          raise ValueError(f"Token validation failed: {str(e)}")
\ No newline at end of file
+          raise ValueError(f"Token validation failed: {str(e)}")
+
+  def stats(self) -> Dict[str, Any]:
+      return {"jwks": self._key_store.stats(), "tokens": self._token_cache.stats()}
+
+
+_middlewares: Dict[Tuple[str, str, str, str], AuthMiddleware] = {}
+_middlewares_lock = threading.Lock()
+
+
+def get_auth_middleware(tenant: str, client_id: str, user_flow: str, tenant_id: str) -> AuthMiddleware:
+  """Return the worker-level middleware for a B2C configuration, creating it on first use"""
+  key = (tenant, client_id, user_flow, tenant_id)
+  with _middlewares_lock:
+      middleware = _middlewares.get(key)
+      if middleware is None:
+          middleware = AuthMiddleware(tenant, client_id, user_flow, tenant_id)
+          _middlewares[key] = middleware
+      return middleware
@@ -0,0 +1,207 @@
+# api/shared/services/blob_cache.py
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+BLOB_CACHE_MEMORY_BYTES = int(os.environ.get("GETBLOB_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+# 0 disables the disk tier
+BLOB_CACHE_DISK_BYTES = int(os.environ.get("GETBLOB_CACHE_DISK_BYTES", "0"))
+BLOB_CACHE_DIR = os.environ.get("GETBLOB_CACHE_DIR", os.path.join(tempfile.gettempdir(), "storyfairy-blob-cache"))
+BLOB_CACHE_MAX_ITEM_BYTES = int(os.environ.get("GETBLOB_CACHE_MAX_ITEM_BYTES", str(4 * 1024 * 1024)))
+# Entries are served without any storage call for this long, then revalidated by ETag
+BLOB_CACHE_REVALIDATE_SECONDS = float(os.environ.get("GETBLOB_CACHE_REVALIDATE_SECONDS", "300"))
+
+
+@dataclass
+class CachedBlob:
+    data: Optional[bytes]
+    etag: str
+    last_modified: Optional[datetime]
+    content_type: Optional[str]
+    size: int
+    validated_at: float
+    path: Optional[str] = None
+
+
+class BlobCache:
+    """
+    Two-tier cache of whole blobs: a byte-budgeted in-memory LRU and an
+    optional size-capped directory on local disk. Blobs evicted from memory
+    move to disk when it is enabled; disk hits are promoted back to memory.
+    Entries record the blob ETag so they can be revalidated with a
+    conditional download once they are older than `revalidate_after`.
+    """
+
+    def __init__(self, memory_bytes: int = BLOB_CACHE_MEMORY_BYTES, disk_bytes: int = BLOB_CACHE_DISK_BYTES,
+                 disk_dir: str = BLOB_CACHE_DIR, max_item_bytes: int = BLOB_CACHE_MAX_ITEM_BYTES,
+                 revalidate_after: float = BLOB_CACHE_REVALIDATE_SECONDS):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        # Worker processes on a host share the base directory; each one owns a subdirectory
+        self.base_dir = disk_dir
+        self.disk_dir = os.path.join(disk_dir, f"worker-{os.getpid()}")
+        self.max_item_bytes = min(max_item_bytes, memory_bytes) if memory_bytes else max_item_bytes
+        self.revalidate_after = revalidate_after
+        self._memory: "OrderedDict[str, CachedBlob]" = OrderedDict()
+        self._disk: "OrderedDict[str, CachedBlob]" = OrderedDict()
+        self._memory_used = 0
+        self._disk_used = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "revalidated": 0,
+                       "replaced": 0, "memory_evictions": 0, "disk_evictions": 0}
+        if self.disk_bytes > 0:
+            self._reset_disk_dir()
+
+    async def get(self, key: str) -> Optional[CachedBlob]:
+        """Return the cached blob (with its bytes loaded) or None; counts hits and misses"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            self._stats["memory_hits"] += 1
+            return entry
+
+        entry = self._disk.get(key)
+        if entry is not None:
+            try:
+                data = await asyncio.to_thread(self._read_file, entry.path)
+            except OSError as e:
+                logging.warning(f"Blob cache could not read {entry.path}: {e}")
+                self._drop_disk(key)
+            else:
+                self._stats["disk_hits"] += 1
+                self._drop_disk(key)
+                promoted = CachedBlob(data, entry.etag, entry.last_modified, entry.content_type,
+                                      entry.size, entry.validated_at)
+                await self._put_memory(key, promoted)
+                return promoted
+
+        self._stats["misses"] += 1
+        return None
+
+    def is_fresh(self, entry: CachedBlob) -> bool:
+        return time.monotonic() - entry.validated_at < self.revalidate_after
+
+    def mark_validated(self, entry: CachedBlob) -> None:
+        """The storage ETag still matches (304 on revalidation)"""
+        entry.validated_at = time.monotonic()
+        self._stats["revalidated"] += 1
+
+    async def put(self, key: str, data: bytes, etag: str, last_modified: Optional[datetime],
+                  content_type: Optional[str]) -> Optional[CachedBlob]:
+        """Cache a whole blob, replacing any older copy; returns None when it is too large to cache"""
+        if key in self._memory or key in self._disk:
+            self._stats["replaced"] += 1
+            self.invalidate(key)
+        if len(data) > self.max_item_bytes:
+            return None
+        entry = CachedBlob(data, etag, last_modified, content_type, len(data), time.monotonic())
+        await self._put_memory(key, entry)
+        return entry
+
+    def invalidate(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_used -= entry.size
+        if key in self._disk:
+            self._drop_disk(key)
+
+    async def _put_memory(self, key: str, entry: CachedBlob) -> None:
+        self._memory[key] = entry
+        self._memory_used += entry.size
+        while self._memory_used > self.memory_bytes and self._memory:
+            evicted_key, evicted = self._memory.popitem(last=False)
+            self._memory_used -= evicted.size
+            self._stats["memory_evictions"] += 1
+            if self.disk_bytes > 0:
+                await self._put_disk(evicted_key, evicted)
+
+    async def _put_disk(self, key: str, entry: CachedBlob) -> None:
+        if entry.size > self.disk_bytes:
+            return
+        path = os.path.join(self.disk_dir, hashlib.sha256(key.encode()).hexdigest())
+        try:
+            await asyncio.to_thread(self._write_file, path, entry.data)
+        except OSError as e:
+            logging.warning(f"Blob cache could not write {path}: {e}")
+            return
+        self._disk[key] = CachedBlob(None, entry.etag, entry.last_modified, entry.content_type,
+                                     entry.size, entry.validated_at, path)
+        self._disk_used += entry.size
+        while self._disk_used > self.disk_bytes and self._disk:
+            evicted_key = next(iter(self._disk))
+            self._drop_disk(evicted_key)
+            self._stats["disk_evictions"] += 1
+
+    def _drop_disk(self, key: str) -> None:
+        entry = self._disk.pop(key, None)
+        if entry is None:
+            return
+        self._disk_used -= entry.size
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+    def _reset_disk_dir(self) -> None:
+        # The index lives in memory, so files left in this directory (by an earlier process
+        # with the same pid) or by workers that are no longer running are unreachable
+        shutil.rmtree(self.disk_dir, ignore_errors=True)
+        os.makedirs(self.disk_dir, exist_ok=True)
+        for name in os.listdir(self.base_dir):
+            if not name.startswith("worker-"):
+                continue
+            try:
+                pid = int(name[len("worker-"):])
+                os.kill(pid, 0)
+            except ValueError:
+                continue
+            except ProcessLookupError:
+                shutil.rmtree(os.path.join(self.base_dir, name), ignore_errors=True)
+            except OSError:
+                # Running under another user: leave it alone
+                continue
+
+    @staticmethod
+    def _write_file(path: str, data: bytes) -> None:
+        with open(path, "wb") as f:
+            f.write(data)
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+        lookups = hits + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_used,
+            "disk_items": len(self._disk),
+            "disk_bytes": self._disk_used,
+        }
+
+
+def blob_cache_key(container_name: str, blob_name: str, version: Optional[str] = None) -> str:
+    # `v` changes whenever an image is regenerated in place
+    return f"{container_name}/{blob_name}?v={version or ''}"
+
+
+_blob_cache: Optional[BlobCache] = None
+
+
+def get_blob_cache() -> BlobCache:
+    """Return the worker-level blob cache, creating it on first use"""
+    global _blob_cache
+    if _blob_cache is None:
+        _blob_cache = BlobCache()
+    return _blob_cache
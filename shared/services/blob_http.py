@@ -0,0 +1,98 @@
+# api/shared/services/blob_http.py
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, Mapping, Optional, Tuple
+
+# Blob names carry a uuid and overwritten blobs get a new `v` in their URL, so responses never change
+BLOB_CACHE_CONTROL = os.environ.get("GETBLOB_CACHE_CONTROL", "public, max-age=31536000, immutable")
+
+
+def http_date(value: Optional[datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def parse_http_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def if_none_match_tags(headers: Mapping[str, str]) -> List[str]:
+    """Entity tags from If-None-Match with weak prefixes removed (weak comparison)"""
+    value = headers.get("If-None-Match")
+    if not value:
+        return []
+    tags = [tag.strip() for tag in value.split(",") if tag.strip()]
+    return [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+def is_not_modified(headers: Mapping[str, str], etag: Optional[str], last_modified: Optional[datetime]) -> bool:
+    """RFC 7232 evaluation for GET: If-None-Match wins over If-Modified-Since"""
+    tags = if_none_match_tags(headers)
+    if tags:
+        return "*" in tags or (etag is not None and etag in tags)
+    since = parse_http_date(headers.get("If-Modified-Since"))
+    if since is None or last_modified is None:
+        return False
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0) <= since
+
+
+def cache_headers(etag: Optional[str], last_modified: Optional[datetime]) -> Dict[str, str]:
+    headers = {"Cache-Control": BLOB_CACHE_CONTROL}
+    if etag:
+        headers["ETag"] = etag
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+# Largest window GetBlob downloads at once; Range responses are capped at this size
+BLOB_MAX_RANGE_BYTES = int(os.environ.get("GETBLOB_MAX_RANGE_BYTES", str(8 * 1024 * 1024)))
+# Largest blob GetBlob returns whole (200) to a request without Range; larger ones get their first window as 206
+BLOB_MAX_BODY_BYTES = int(os.environ.get("GETBLOB_MAX_BODY_BYTES", str(64 * 1024 * 1024)))
+
+
+def parse_range(value: Optional[str]) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    """
+    Parse a single `bytes=` range into (start, end); a suffix range is
+    returned as (None, length). Multiple or malformed ranges return None, in
+    which case the header is ignored as RFC 7233 allows.
+    """
+    if not value or not value.startswith("bytes=") or "," in value:
+        return None
+    start, _, end = value[len("bytes="):].strip().partition("-")
+    try:
+        if not start:
+            return (None, int(end)) if end and int(end) > 0 else None
+        start_value = int(start)
+        end_value = int(end) if end else None
+    except ValueError:
+        return None
+    if start_value < 0 or (end_value is not None and end_value < start_value):
+        return None
+    return start_value, end_value
+
+
+def if_range_matches(headers: Mapping[str, str], etag: Optional[str], last_modified: Optional[datetime]) -> bool:
+    """False when If-Range names a different representation (the full body must be sent)"""
+    value = headers.get("If-Range")
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith("W/"):
+        return not value.startswith("W/") and value == etag
+    since = parse_http_date(value)
+    return since is not None and last_modified is not None and last_modified.replace(microsecond=0) <= since
+
+
+def content_range(start: int, end: int, size: int) -> str:
+    return f"bytes {start}-{end}/{size}"
@@ -0,0 +1,136 @@
+# api/shared/services/blob_sas.py
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import quote
+from azure.storage.blob import BlobSasPermissions, generate_blob_sas
+
+# proxy: GetBlob streams the bytes; redirect: GetBlob answers 302 to a read SAS URL
+GETBLOB_MODE = os.environ.get("GETBLOB_MODE", "proxy")
+# Containers GetBlob may redirect to a SAS. GetBlob is anonymous (image tags cannot send the auth header)
+# and these blobs are uuid-named images it already proxies to anyone holding the name, so a read SAS on
+# that one blob grants nothing more. Story text (storyfairy-stories) carries no owner in its blob name,
+# so its ownership cannot be checked here and it never leaves the proxy path.
+SAS_REDIRECT_CONTAINERS = ("storyfairy-images", "storyfairy-derivatives")
+BLOB_SAS_TTL_SECONDS = int(os.environ.get("GETBLOB_SAS_TTL_SECONDS", "300"))
+# Cached URLs (and delegation keys) are replaced this long before they expire
+BLOB_SAS_REFRESH_MARGIN_SECONDS = int(os.environ.get("GETBLOB_SAS_REFRESH_MARGIN_SECONDS", "60"))
+BLOB_SAS_CACHE_SIZE = int(os.environ.get("GETBLOB_SAS_CACHE_SIZE", "10000"))
+# Lifetime of a user delegation key; every SAS signed with it must expire before it does
+USER_DELEGATION_KEY_TTL_SECONDS = int(os.environ.get("GETBLOB_DELEGATION_KEY_TTL_SECONDS", "3600"))
+# Allows for clock skew between the worker and storage
+SAS_START_SKEW = timedelta(minutes=5)
+
+
+class BlobSasSigner:
+    """
+    Issues short-lived read SAS URLs for blobs and caches them until shortly
+    before expiry. With an account key the SAS is signed locally; without
+    one (managed identity) a user delegation key is fetched from the blob
+    service, cached, and used to sign user-delegation SAS tokens.
+    """
+
+    def __init__(self, account_name: str, account_key: Optional[str] = None, blob_service_client: Any = None,
+                 ttl: int = BLOB_SAS_TTL_SECONDS, refresh_margin: int = BLOB_SAS_REFRESH_MARGIN_SECONDS,
+                 max_entries: int = BLOB_SAS_CACHE_SIZE):
+        if not account_key and blob_service_client is None:
+            raise ValueError("Either account_key or blob_service_client is required to sign blob URLs")
+        self.account_name = account_name
+        self.account_key = account_key
+        self.blob_service_client = blob_service_client
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self._urls: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._delegation_key: Any = None
+        self._delegation_key_expiry: Optional[datetime] = None
+        self._delegation_lock = asyncio.Lock()
+        self._stats = {"hits": 0, "signed": 0, "delegation_keys": 0, "errors": 0}
+
+    async def signed_url(self, container_name: str, blob_name: str) -> Optional[str]:
+        """A read SAS URL for the blob, or None when signing fails (callers fall back to proxying)"""
+        key = (container_name, blob_name)
+        cached = self._urls.get(key)
+        if cached is not None and time.time() < cached[1] - self.refresh_margin:
+            self._urls.move_to_end(key)
+            self._stats["hits"] += 1
+            return cached[0]
+
+        try:
+            url, expires_at = await self._sign(container_name, blob_name)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logging.error(f"Error signing SAS URL for {container_name}/{blob_name}: {e}")
+            return None
+
+        self._urls[key] = (url, expires_at)
+        self._urls.move_to_end(key)
+        while len(self._urls) > self.max_entries:
+            self._urls.popitem(last=False)
+        self._stats["signed"] += 1
+        return url
+
+    def seconds_valid(self, container_name: str, blob_name: str) -> int:
+        """How long a cached URL may still be handed out (used for the redirect's max-age)"""
+        cached = self._urls.get((container_name, blob_name))
+        if cached is None:
+            return 0
+        return max(int(cached[1] - self.refresh_margin - time.time()), 0)
+
+    async def _sign(self, container_name: str, blob_name: str) -> Tuple[str, float]:
+        now = datetime.now(timezone.utc)
+        expiry = now + timedelta(seconds=self.ttl)
+        credentials: Dict[str, Any] = {}
+        if self.account_key:
+            credentials["account_key"] = self.account_key
+        else:
+            delegation_key, key_expiry = await self._get_delegation_key(now)
+            expiry = min(expiry, key_expiry)
+            credentials["user_delegation_key"] = delegation_key
+
+        sas_token = generate_blob_sas(
+            account_name=self.account_name,
+            container_name=container_name,
+            blob_name=blob_name,
+            permission=BlobSasPermissions(read=True),
+            start=now - SAS_START_SKEW,
+            expiry=expiry,
+            **credentials
+        )
+        url = f"https://{self.account_name}.blob.core.windows.net/{container_name}/{quote(blob_name)}?{sas_token}"
+        return url, expiry.timestamp()
+
+    async def _get_delegation_key(self, now: datetime) -> Tuple[Any, datetime]:
+        margin = timedelta(seconds=self.ttl + self.refresh_margin)
+        async with self._delegation_lock:
+            if self._delegation_key is None or self._delegation_key_expiry - margin <= now:
+                expiry = now + timedelta(seconds=max(USER_DELEGATION_KEY_TTL_SECONDS, self.ttl * 2))
+                self._delegation_key = await asyncio.to_thread(
+                    self.blob_service_client.get_user_delegation_key, now - SAS_START_SKEW, expiry
+                )
+                self._delegation_key_expiry = expiry
+                self._stats["delegation_keys"] += 1
+            return self._delegation_key, self._delegation_key_expiry
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["signed"]
+        return {**self._stats, "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "cached_urls": len(self._urls)}
+
+
+_signers: Dict[Tuple[str, bool], BlobSasSigner] = {}
+
+
+def get_blob_sas_signer(account_name: str, account_key: Optional[str] = None,
+                        blob_service_client: Any = None) -> BlobSasSigner:
+    """Return the worker-level signer for the account, creating it on first use"""
+    key = (account_name, bool(account_key))
+    signer = _signers.get(key)
+    if signer is None or signer.account_key != account_key:
+        signer = BlobSasSigner(account_name, account_key, blob_service_client)
+        _signers[key] = signer
+    return signer
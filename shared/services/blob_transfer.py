@@ -0,0 +1,341 @@
+# api/shared/services/blob_transfer.py
+import asyncio
+import base64
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlparse
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import ContentSettings
+from .client_pool import get_client_pool
+from .image_providers import GeneratedImage
+from .image_processing import (IMAGE_FORMATS, THUMBNAIL_SIZES, derivative_blob_name, output_format, process_image,
+                               resize_image,
+                               render_thumbnails, sniff_format, spooled_file)
+
+# Staged block size; kept well below a typical image so streaming actually bounds memory
+BLOB_BLOCK_SIZE = int(os.environ.get("BLOB_UPLOAD_BLOCK_SIZE", str(256 * 1024)))
+# Blocks uploading at once per blob; buffered bytes stay below (max_inflight + 1) * block size
+BLOB_UPLOAD_MAX_INFLIGHT = int(os.environ.get("BLOB_UPLOAD_MAX_INFLIGHT", "4"))
+# Read size from the provider response
+READ_CHUNK_SIZE = 64 * 1024
+
+# Thumbnails and other derived renditions of story images
+DERIVATIVES_CONTAINER = "storyfairy-derivatives"
+
+# On-demand derivatives known to exist on this worker, and the ones being rendered right now
+_known_derivatives: Set[str] = set()
+_pending_derivatives: Dict[str, "asyncio.Task"] = {}
+MAX_KNOWN_DERIVATIVES = 50000
+
+
+def _block_id(index: int) -> str:
+    # Block ids must all have the same length within a blob
+    return base64.b64encode(f"block-{index:08d}".encode()).decode()
+
+
+async def upload_stream(chunks: AsyncIterator[bytes], blob_client, content_type: str,
+                        block_size: int = BLOB_BLOCK_SIZE,
+                        max_inflight: int = BLOB_UPLOAD_MAX_INFLIGHT,
+                        metadata: Optional[Dict[str, str]] = None) -> int:
+    """
+    Upload an async byte stream as a block blob with bounded buffering.
+
+    Full blocks are staged as they fill up (at most `max_inflight` at a time)
+    and committed at the end. A stream shorter than one block is written with
+    a single Put Blob instead. Returns the number of bytes uploaded.
+    """
+    content_settings = ContentSettings(content_type=content_type)
+    pending: List[bytes] = []
+    pending_size = 0
+    block_ids: List[str] = []
+    inflight: Set[asyncio.Task] = set()
+    total = 0
+
+    def take(size: int) -> bytes:
+        # Join the pending chunks once; the remainder stays pending
+        nonlocal pending, pending_size
+        data = b"".join(pending)
+        block, rest = data[:size], data[size:]
+        pending = [rest] if rest else []
+        pending_size = len(rest)
+        return block
+
+    def stage(data: bytes) -> None:
+        block_id = _block_id(len(block_ids))
+        block_ids.append(block_id)
+        inflight.add(asyncio.create_task(blob_client.stage_block(block_id, data)))
+
+    async def wait_for_slot(limit: int) -> None:
+        while len(inflight) > limit:
+            done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+            inflight.difference_update(done)
+            for task in done:
+                task.result()
+
+    try:
+        async for chunk in chunks:
+            pending.append(chunk)
+            pending_size += len(chunk)
+            total += len(chunk)
+            while pending_size >= block_size:
+                await wait_for_slot(max_inflight - 1)
+                stage(take(block_size))
+
+        if not block_ids:
+            await blob_client.upload_blob(take(pending_size), blob_type="BlockBlob", overwrite=True,
+                                          content_settings=content_settings, metadata=metadata)
+            return total
+
+        if pending_size:
+            stage(take(pending_size))
+        await wait_for_slot(0)
+        await blob_client.commit_block_list(block_ids, content_settings=content_settings, metadata=metadata)
+        return total
+    finally:
+        for task in inflight:
+            task.cancel()
+        if inflight:
+            await asyncio.gather(*inflight, return_exceptions=True)
+
+
+@dataclass
+class StoredImage:
+    blob_name: str
+    url: str
+    content_type: str
+    size: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+    # Thumbnail size name -> blob name in DERIVATIVES_CONTAINER
+    thumbnails: Dict[str, str] = field(default_factory=dict)
+
+
+def blob_proxy_url(blob_name: Optional[str], container_name: str = DERIVATIVES_CONTAINER,
+                   version: Optional[str] = None) -> Optional[str]:
+    """
+    URL of a blob behind the GetBlob proxy. GetBlob responses are cached as
+    immutable, so a blob that is overwritten in place needs a new `version`.
+    """
+    if not blob_name:
+        return None
+    url = f"/api/blob/{quote(blob_name)}?container={container_name}"
+    return f"{url}&v={version}" if version else url
+
+
+def parse_blob_url(url: Optional[str], default_container: str = "storyfairy-images"
+                   ) -> Optional[Tuple[str, str, Optional[str]]]:
+    """(container, blob name, version) from a storage blob URL or a GetBlob proxy URL"""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.path.startswith("/api/blob/"):
+        params = parse_qs(parsed.query)
+        container_name = params.get("container", [default_container])[0]
+        return container_name, unquote(parsed.path[len("/api/blob/"):]), params.get("v", [None])[0]
+    container_name, _, blob_name = parsed.path.lstrip("/").partition("/")
+    if not blob_name:
+        return None
+    return container_name, unquote(blob_name), None
+
+
+def thumbnail_urls(thumbnails: Optional[Dict[str, str]], version: Optional[str] = None) -> Dict[str, str]:
+    """Derivative blob names (as stored on stories) -> GetBlob URLs by size"""
+    return {name: blob_proxy_url(blob_name, version=version) for name, blob_name in (thumbnails or {}).items()}
+
+
+async def _iter_file(f: BinaryIO, chunk_size: int = BLOB_BLOCK_SIZE) -> AsyncIterator[bytes]:
+    f.seek(0)
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _image_chunks(image: GeneratedImage) -> AsyncIterator[bytes]:
+    if image.data is not None:
+        yield image.data
+        return
+    session = get_client_pool().get_http_session()
+    async with session.get(image.url) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+            yield chunk
+
+
+async def store_thumbnails(source: BinaryIO, blob_name: str, service_client) -> Dict[str, str]:
+    """Render and upload the thumbnail derivatives of an image; returns size name -> blob name"""
+    thumbnails = await asyncio.to_thread(render_thumbnails, source)
+    names = {}
+    try:
+        uploads = []
+        for size_name, thumbnail in thumbnails.items():
+            names[size_name] = derivative_blob_name(blob_name, THUMBNAIL_SIZES[size_name], thumbnail.extension)
+            uploads.append(upload_stream(
+                _iter_file(thumbnail.file),
+                service_client.get_blob_client(DERIVATIVES_CONTAINER, names[size_name]),
+                thumbnail.content_type,
+                metadata=thumbnail.metadata
+            ))
+        await asyncio.gather(*uploads)
+    finally:
+        for thumbnail in thumbnails.values():
+            thumbnail.file.close()
+    return names
+
+
+async def store_generated_image(image: GeneratedImage, container_name: str, blob_stem: str,
+                                connection_string: str, blob_service_client=None,
+                                thumbnails: bool = True) -> Optional[StoredImage]:
+    """
+    Save a generated image as `<blob_stem><extension>` with its real content
+    type, plus its thumbnail derivatives. The image is spooled (memory, then
+    disk) and transcoded off the event loop to IMAGE_OUTPUT_FORMAT; with
+    "original" it is streamed through untouched and only its format is
+    sniffed. Returns None on failure; a failed thumbnail leaves `thumbnails`
+    empty.
+    """
+    service_client = blob_service_client or get_client_pool().get_async_blob_service_client(connection_string)
+    source = spooled_file()
+    processed = None
+    try:
+        if output_format() == "original":
+            chunks = _image_chunks(image)
+            head = await chunks.__anext__()
+            fmt = sniff_format(head)
+            _, content_type, extension = IMAGE_FORMATS.get(fmt, (None, image.content_type, ""))
+            blob_name = f"{blob_stem}{extension}"
+
+            async def replay() -> AsyncIterator[bytes]:
+                # Keep a spooled copy for the thumbnails while streaming
+                source.write(head)
+                yield head
+                async for chunk in chunks:
+                    source.write(chunk)
+                    yield chunk
+
+            blob_client = service_client.get_blob_client(container_name, blob_name)
+            size = await upload_stream(replay(), blob_client, content_type, metadata={"sourceformat": fmt or "unknown"})
+            stored = StoredImage(blob_name, blob_client.url, content_type, size)
+        else:
+            async for chunk in _image_chunks(image):
+                source.write(chunk)
+            processed = await asyncio.to_thread(process_image, source, image.content_type)
+            blob_name = f"{blob_stem}{processed.extension}"
+            blob_client = service_client.get_blob_client(container_name, blob_name)
+            await upload_stream(_iter_file(processed.file), blob_client, processed.content_type,
+                                metadata=processed.metadata)
+            stored = StoredImage(blob_name, blob_client.url, processed.content_type, processed.size,
+                                 processed.width, processed.height)
+        logging.info(f"Image {blob_name} ({stored.content_type}, {stored.size} bytes) saved to container: {container_name}")
+    except Exception as e:
+        logging.error(f"Error saving image {blob_stem} to blob storage: {e}")
+        source.close()
+        return None
+    finally:
+        if processed is not None and processed.file is not source:
+            processed.file.close()
+
+    try:
+        if thumbnails:
+            stored.thumbnails = await store_thumbnails(source, stored.blob_name, service_client)
+    except Exception as e:
+        logging.warning(f"Error creating thumbnails for {stored.blob_name}: {e}")
+    finally:
+        source.close()
+    return stored
+
+
+def delete_derivatives(service_client, blob_name: str) -> int:
+    """
+    Delete every derivative of a source image (thumbnails and on-demand
+    sizes are all named `<stem>_...`); returns how many were deleted.
+    `service_client` is the sync pooled client, so run this off the loop.
+    """
+    container_client = service_client.get_container_client(DERIVATIVES_CONTAINER)
+    deleted = 0
+    for blob in container_client.list_blobs(name_starts_with=f"{os.path.splitext(blob_name)[0]}_"):
+        try:
+            container_client.delete_blob(blob.name)
+            deleted += 1
+        except ResourceNotFoundError:
+            pass
+    return deleted
+
+
+def resized_blob_name(blob_name: str, width: int, fmt: str, source_etag: str) -> str:
+    """Derivative name for `?w=&fmt=`, keyed on the source ETag so a replaced source gets new derivatives"""
+    version = source_etag.strip('"')
+    stem = f"{os.path.splitext(blob_name)[0]}_{version}"
+    return derivative_blob_name(stem, width, IMAGE_FORMATS[fmt][2])
+
+
+async def ensure_resized_derivative(service_client, container_name: str, blob_name: str, width: int,
+                                    fmt: str) -> Optional[str]:
+    """
+    Name of the resized derivative of a blob in the derivatives container,
+    rendering and uploading it on first use. The name comes from the source
+    blob's ETag (one properties read per call), never from the caller, so
+    each source version has at most one derivative per width and format.
+    `service_client` is the sync pooled client; storage calls and Pillow
+    work run off the event loop. Concurrent first requests share one
+    render. Returns None when the source blob does not exist.
+    """
+    source_client = service_client.get_blob_client(container_name, blob_name)
+    try:
+        source_etag = (await asyncio.to_thread(source_client.get_blob_properties)).etag
+    except ResourceNotFoundError:
+        return None
+    name = resized_blob_name(blob_name, width, fmt, source_etag)
+    if name in _known_derivatives:
+        return name
+    task = _pending_derivatives.get(name)
+    if task is None:
+        task = asyncio.get_running_loop().create_task(
+            _create_resized_derivative(service_client, container_name, blob_name, source_etag, name, width, fmt)
+        )
+        _pending_derivatives[name] = task
+        task.add_done_callback(lambda _: _pending_derivatives.pop(name, None))
+    if not await asyncio.shield(task):
+        return None
+    if len(_known_derivatives) >= MAX_KNOWN_DERIVATIVES:
+        _known_derivatives.clear()
+    _known_derivatives.add(name)
+    return name
+
+
+async def _create_resized_derivative(service_client, container_name: str, blob_name: str, source_etag: str,
+                                     derivative_name: str, width: int, fmt: str) -> bool:
+    derivative_client = service_client.get_blob_client(DERIVATIVES_CONTAINER, derivative_name)
+    if await asyncio.to_thread(derivative_client.exists):
+        return True
+
+    def download() -> None:
+        # Render exactly the version the name was derived from; a source replaced meanwhile fails the read
+        service_client.get_blob_client(container_name, blob_name).download_blob(
+            etag=source_etag, match_condition=MatchConditions.IfNotModified
+        ).readinto(source)
+
+    source = spooled_file()
+    try:
+        try:
+            await asyncio.to_thread(download)
+        except ResourceNotFoundError:
+            return False
+        resized = await asyncio.to_thread(resize_image, source, width, fmt)
+        try:
+            resized.file.seek(0)
+            await asyncio.to_thread(
+                derivative_client.upload_blob, resized.file, length=resized.size, overwrite=True,
+                content_settings=ContentSettings(content_type=resized.content_type),
+                metadata={**resized.metadata, "source": quote(f"{container_name}/{blob_name}")}
+            )
+        finally:
+            resized.file.close()
+        logging.info(f"Created derivative {derivative_name} ({resized.width}x{resized.height}, {resized.size} bytes)")
+        return True
+    finally:
+        source.close()
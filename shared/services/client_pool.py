@@ -0,0 +1,348 @@
+# api/shared/services/client_pool.py
+import asyncio
+import atexit
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import aiohttp
+import httpx
+import openai
+import replicate
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.ai.contentsafety import ContentSafetyClient
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import AioHttpTransport, RequestsTransport
+from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
+from azure.identity import DefaultAzureCredential
+from azure.keyvault.secrets import SecretClient
+from azure.storage.blob import BlobServiceClient
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+from .cosmos_metrics import record_response
+
+# Upper bound of kept-alive connections per host and in total for each transport
+MAX_CONNECTIONS = int(os.environ.get("CLIENT_POOL_MAX_CONNECTIONS", "32"))
+MAX_HOSTS = int(os.environ.get("CLIENT_POOL_MAX_HOSTS", "16"))
+KEEPALIVE_SECONDS = float(os.environ.get("CLIENT_POOL_KEEPALIVE_SECONDS", "60"))
+
+
+def _key(*parts: Optional[str]) -> str:
+    """Build a registry key without keeping secrets (keys, connection strings) in plain text"""
+    digest = hashlib.sha256("|".join(p or "" for p in parts).encode()).hexdigest()[:16]
+    return f"{parts[0]}:{digest}"
+
+
+class ClientPool:
+    """
+    Worker-level registry of outbound clients, created lazily and reused across
+    invocations and function modules. Every transport keeps a bounded pool of
+    keep-alive connections; `stats()` reports how many clients and connections
+    were opened versus reused.
+    """
+
+    def __init__(self, max_connections: int = MAX_CONNECTIONS, max_hosts: int = MAX_HOSTS,
+                 keepalive_timeout: float = KEEPALIVE_SECONDS):
+        self.max_connections = max_connections
+        self.max_hosts = max_hosts
+        self.keepalive_timeout = keepalive_timeout
+
+        self._lock = threading.RLock()
+        self._clients: Dict[str, Any] = {}
+        self._closers: Dict[str, Callable[[], Any]] = {}
+        self._async_closers: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self._requests_session: Optional[requests.Session] = None
+        self._http_session: Optional[aiohttp.ClientSession] = None
+        self._http_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self._counters = {
+            "clients_opened": 0,
+            "clients_reused": 0,
+            "http_connections_opened": 0,
+            "http_connections_reused": 0,
+            "httpx_requests": 0,
+            "httpx_connections_opened": 0,
+        }
+
+    # -- generic registry -------------------------------------------------
+
+    def get_or_create(self, key: str, factory: Callable[[], Any],
+                      closer: Optional[Callable[[Any], Any]] = None,
+                      async_closer: Optional[Callable[[Any], Awaitable[Any]]] = None) -> Any:
+        """Return the client registered under `key`, creating it with `factory` on first use"""
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._counters["clients_reused"] += 1
+                return client
+            client = factory()
+            self._clients[key] = client
+            if closer is not None:
+                self._closers[key] = lambda: closer(client)
+            if async_closer is not None:
+                self._async_closers[key] = lambda: async_closer(client)
+            self._counters["clients_opened"] += 1
+            logging.info(f"Client pool opened new client: {key}")
+            return client
+
+    def register(self, key: str, client: Any, closer: Optional[Callable[[Any], Any]] = None) -> None:
+        """Register (or replace) a client under `key`, e.g. a local stand-in"""
+        with self._lock:
+            self._clients[key] = client
+            if closer is not None:
+                self._closers[key] = lambda: closer(client)
+            else:
+                self._closers.pop(key, None)
+            self._async_closers.pop(key, None)
+
+    # -- shared transports ------------------------------------------------
+
+    def get_requests_session(self) -> requests.Session:
+        """Keep-alive session shared by every synchronous Azure SDK client"""
+        with self._lock:
+            if self._requests_session is None:
+                session = requests.Session()
+                # The Azure pipeline runs its own retry policy, so urllib3 retries stay disabled
+                adapter = HTTPAdapter(
+                    pool_connections=self.max_hosts,
+                    pool_maxsize=self.max_connections,
+                    pool_block=True,
+                    max_retries=Retry(total=False, redirect=False, raise_on_status=False)
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._requests_session = session
+            return self._requests_session
+
+    def _azure_transport(self) -> RequestsTransport:
+        return RequestsTransport(session=self.get_requests_session(), session_owner=False)
+
+    def get_http_session(self) -> aiohttp.ClientSession:
+        """Shared aiohttp session for downloads (image provider URLs etc.)"""
+        loop = asyncio.get_running_loop()
+        if (self._http_session is None or self._http_session.closed
+                or self._http_session_loop is not loop):
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(self._on_connection_created)
+            trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._http_session = aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+            self._http_session_loop = loop
+            self._counters["clients_opened"] += 1
+        else:
+            self._counters["clients_reused"] += 1
+        return self._http_session
+
+    async def _on_connection_created(self, session, ctx, params) -> None:
+        self._counters["http_connections_opened"] += 1
+
+    async def _on_connection_reused(self, session, ctx, params) -> None:
+        self._counters["http_connections_reused"] += 1
+
+    def _httpx_client(self) -> httpx.Client:
+        def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                self._counters["httpx_connections_opened"] += 1
+
+        def on_request(request: httpx.Request) -> None:
+            self._counters["httpx_requests"] += 1
+            request.extensions["trace"] = trace
+
+        return httpx.Client(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_timeout
+            ),
+            timeout=httpx.Timeout(600.0, connect=10.0),
+            event_hooks={"request": [on_request]}
+        )
+
+    def _httpx_async_client(self) -> httpx.AsyncClient:
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                self._counters["httpx_connections_opened"] += 1
+
+        async def on_request(request: httpx.Request) -> None:
+            self._counters["httpx_requests"] += 1
+            request.extensions["trace"] = trace
+
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_timeout
+            ),
+            timeout=httpx.Timeout(600.0, connect=10.0),
+            event_hooks={"request": [on_request]}
+        )
+
+    # -- typed accessors --------------------------------------------------
+
+    def get_credential(self) -> DefaultAzureCredential:
+        """Single managed identity credential; its token cache is shared by every client"""
+        return self.get_or_create("credential:default", DefaultAzureCredential, lambda c: c.close())
+
+    def get_blob_service_client(self, connection_string: Optional[str] = None,
+                                account_url: Optional[str] = None) -> BlobServiceClient:
+        """Blob service client authenticated by connection string or, without one, by managed identity"""
+        if connection_string:
+            return self.get_or_create(
+                _key("blob", connection_string),
+                lambda: BlobServiceClient.from_connection_string(
+                    connection_string, transport=self._azure_transport()
+                ),
+                lambda c: c.close()
+            )
+        if not account_url:
+            raise ValueError("Either connection_string or account_url is required")
+        return self.get_or_create(
+            _key("blob", account_url),
+            lambda: BlobServiceClient(
+                account_url, credential=self.get_credential(), transport=self._azure_transport()
+            ),
+            lambda c: c.close()
+        )
+
+    def get_async_blob_service_client(self, connection_string: str) -> AsyncBlobServiceClient:
+        """Async blob service client on the shared aiohttp session of the running loop"""
+        loop = asyncio.get_running_loop()
+        return self.get_or_create(
+            _key("blob-async", connection_string, str(id(loop))),
+            lambda: AsyncBlobServiceClient.from_connection_string(
+                connection_string,
+                transport=AioHttpTransport(session=self.get_http_session(), session_owner=False)
+            ),
+            async_closer=lambda c: c.close()
+        )
+
+    def get_async_cosmos_client(self, connection_string: str) -> AsyncCosmosClient:
+        """Async Cosmos client on the shared aiohttp session of the running loop"""
+        loop = asyncio.get_running_loop()
+        return self.get_or_create(
+            _key("cosmos-async", connection_string, str(id(loop))),
+            lambda: AsyncCosmosClient.from_connection_string(
+                connection_string,
+                transport=AioHttpTransport(session=self.get_http_session(), session_owner=False),
+                raw_response_hook=record_response
+            ),
+            async_closer=lambda c: c.close()
+        )
+
+    def get_secret_client(self, vault_url: str) -> SecretClient:
+        return self.get_or_create(
+            _key("keyvault", vault_url),
+            lambda: SecretClient(vault_url=vault_url, credential=self.get_credential(),
+                                 transport=self._azure_transport()),
+            lambda c: c.close()
+        )
+
+    def get_content_safety_client(self, endpoint: str, key: str) -> ContentSafetyClient:
+        return self.get_or_create(
+            _key("contentsafety", endpoint, key),
+            lambda: ContentSafetyClient(endpoint, AzureKeyCredential(key), transport=self._azure_transport()),
+            lambda c: c.close()
+        )
+
+    def get_openai_client(self, api_key: str, base_url: Optional[str] = None) -> openai.OpenAI:
+        """OpenAI (or OpenAI-compatible, e.g. Grok) client keyed by api key and base url"""
+        return self.get_or_create(
+            _key("openai", api_key, base_url),
+            lambda: openai.OpenAI(api_key=api_key, base_url=base_url, http_client=self._httpx_client()),
+            lambda c: c.close()
+        )
+
+    def get_async_openai_client(self, api_key: str, base_url: Optional[str] = None) -> openai.AsyncOpenAI:
+        """Non-blocking counterpart of `get_openai_client` for use on the event loop"""
+        return self.get_or_create(
+            _key("openai-async", api_key, base_url),
+            lambda: openai.AsyncOpenAI(api_key=api_key, base_url=base_url,
+                                       http_client=self._httpx_async_client()),
+            async_closer=lambda c: c.close()
+        )
+
+    def get_replicate_client(self, api_token: str) -> replicate.Client:
+        """Replicate client; its lazily built httpx clients keep their connections alive"""
+        return self.get_or_create(_key("replicate", api_token), lambda: replicate.Client(api_token=api_token))
+
+    # -- metrics and teardown ---------------------------------------------
+
+    def stats(self) -> Dict[str, int]:
+        """Counters of opened versus reused clients and connections"""
+        stats = dict(self._counters)
+        opened = requests_total = 0
+        if self._requests_session is not None:
+            for adapter in set(self._requests_session.adapters.values()):
+                pools = getattr(adapter, "poolmanager", None)
+                if pools is None:
+                    continue
+                for key in list(pools.pools.keys()):
+                    pool = pools.pools.get(key)
+                    if pool is not None:
+                        opened += pool.num_connections
+                        requests_total += pool.num_requests
+        stats["azure_connections_opened"] = opened
+        stats["azure_connections_reused"] = max(requests_total - opened, 0)
+        stats["httpx_connections_reused"] = max(
+            stats["httpx_requests"] - stats["httpx_connections_opened"], 0
+        )
+        stats["clients"] = len(self._clients)
+        return stats
+
+    def close(self) -> None:
+        """Close synchronous clients and the shared keep-alive session"""
+        with self._lock:
+            closers = list(self._closers.items())
+            self._clients.clear()
+            self._closers.clear()
+            self._async_closers.clear()
+            session, self._requests_session = self._requests_session, None
+        for key, closer in closers:
+            try:
+                closer()
+            except Exception as e:
+                logging.warning(f"Error closing pooled client {key}: {e}")
+        if session is not None:
+            session.close()
+
+    async def aclose(self) -> None:
+        """Teardown hook: close every pooled client including the aiohttp session"""
+        with self._lock:
+            async_closers = list(self._async_closers.items())
+        for key, closer in async_closers:
+            try:
+                await closer()
+            except Exception as e:
+                logging.warning(f"Error closing pooled client {key}: {e}")
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+        self._http_session = None
+        self._http_session_loop = None
+        self.close()
+
+
+_client_pool: Optional[ClientPool] = None
+_client_pool_lock = threading.Lock()
+
+
+def get_client_pool() -> ClientPool:
+    """Return the worker-level client pool, creating it on first use"""
+    global _client_pool
+    if _client_pool is None:
+        with _client_pool_lock:
+            if _client_pool is None:
+                _client_pool = ClientPool()
+    return _client_pool
+
+
+@atexit.register
+def _close_client_pool() -> None:
+    if _client_pool is not None:
+        _client_pool.close()
@@ -0,0 +1,169 @@
+# api/shared/services/config_service.py
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+from azure.core.exceptions import ResourceNotFoundError
+from .client_pool import get_client_pool
+
+CONFIG_TTL_SECONDS = float(os.environ.get("CONFIG_CACHE_TTL_SECONDS", "300"))
+# Fraction of the TTL after which a hit also starts a background refresh
+CONFIG_REFRESH_AHEAD = float(os.environ.get("CONFIG_CACHE_REFRESH_AHEAD", "0.8"))
+
+
+@dataclass
+class Config:
+    openai_key: str
+    gemini_key: str
+    replicate_token: str
+    storage_conn: str
+    account_key: str
+    account_name: str
+    grok_key: str
+    b2c_client_id: str
+    b2c_tenant: str
+    b2c_user_flow: str
+    b2c_tenant_id: str
+    content_moderator_key: str
+    content_moderator_endpoint: str
+    stripe_secret_key: Optional[str] = None
+    stripe_webhook_secret: Optional[str] = None
+
+
+# Config field -> (Key Vault secret name, environment variable)
+CONFIG_SOURCES = {
+    "openai_key": ("openai-api-key", "OPENAI_API_KEY"),
+    "gemini_key": ("gemini-api-key", "GEMINI_API_KEY"),
+    "replicate_token": ("replicate-api-token", "REPLICATE_API_TOKEN"),
+    "storage_conn": ("storage-connection-string", "STORAGE_CONNECTION_STRING"),
+    "account_key": ("account-key", "ACCOUNT_KEY"),
+    "account_name": ("account-name", "ACCOUNT_NAME"),
+    "grok_key": ("grok-api-key", "GROK_API_KEY"),
+    "b2c_client_id": ("b2c-client-id", "REACT_APP_B2C_CLIENT_ID"),
+    "b2c_tenant": ("b2c-tenant", "REACT_APP_B2C_TENANT"),
+    "b2c_user_flow": ("b2c-user-flow", "REACT_APP_B2C_USER_FLOW"),
+    "b2c_tenant_id": ("b2c-tenant-id", "REACT_APP_B2C_TENANT_ID"),
+    "content_moderator_key": ("azure-content-moderator-key", "AZURE_CONTENT_MODERATOR_KEY"),
+    "content_moderator_endpoint": ("azure-content-moderator-endpoint", "AZURE_CONTENT_MODERATOR_ENDPOINT"),
+    "stripe_secret_key": ("stripe-secret-key", "REACT_APP_STRIPE_SECRET_KEY"),
+    "stripe_webhook_secret": ("stripe-webhook-secret", "REACT_APP_STRIPE_WEBHOOK_SECRET"),
+}
+
+# Secrets that may be absent from Key Vault; these fall back to the environment
+OPTIONAL_SECRETS = {"stripe_secret_key", "stripe_webhook_secret"}
+
+
+def _get_vault_secret(client, field: str) -> Optional[str]:
+    secret_name, env_name = CONFIG_SOURCES[field]
+    try:
+        return client.get_secret(secret_name).value
+    except ResourceNotFoundError:
+        if field not in OPTIONAL_SECRETS:
+            raise
+        return os.environ.get(env_name)
+
+
+async def load_config() -> Config:
+    """Get secrets from Key Vault or environment variables"""
+    key_vault_uri = os.environ.get("KEY_VAULT_URI")
+    if key_vault_uri:
+        client = get_client_pool().get_secret_client(key_vault_uri)
+        values = await asyncio.gather(
+            *(asyncio.to_thread(_get_vault_secret, client, field) for field in CONFIG_SOURCES)
+        )
+        logging.info("Secrets successfully fetched from Key Vault")
+        return Config(**dict(zip(CONFIG_SOURCES, values)))
+
+    # Fallback to environment variables
+    logging.warning("Key Vault URI not found. Falling back to environment variables.")
+    values = {field: os.environ.get(env_name) for field, (_, env_name) in CONFIG_SOURCES.items()}
+    missing = [CONFIG_SOURCES[field][1] for field, value in values.items()
+               if value is None and field not in OPTIONAL_SECRETS]
+    if missing:
+        # Fail the load (nothing is cached) rather than hand out a config with empty secrets
+        logging.error(f"Missing configuration environment variables: {', '.join(missing)}")
+        raise KeyError(f"Missing configuration environment variables: {', '.join(missing)}")
+    return Config(**values)
+
+
+class ConfigCache:
+    """
+    TTL cache around an async loader. Concurrent misses share a single fetch,
+    hits past the refresh-ahead point trigger a background refresh, and a
+    failed refresh keeps serving the last good value.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[Any]], ttl: float = CONFIG_TTL_SECONDS,
+                 refresh_ahead: float = CONFIG_REFRESH_AHEAD):
+        self._loader = loader
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self._value: Any = None
+        self._loaded_at = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "background_refreshes": 0, "errors": 0}
+
+    async def get(self) -> Any:
+        age = time.monotonic() - self._loaded_at
+        if self._value is not None and age < self.ttl:
+            self._stats["hits"] += 1
+            if age >= self.ttl * self.refresh_ahead and not self._refreshing():
+                self._stats["background_refreshes"] += 1
+                self._start_refresh()
+            return self._value
+
+        self._stats["misses"] += 1
+        try:
+            return await asyncio.shield(self._start_refresh())
+        except Exception:
+            if self._value is None:
+                raise
+            logging.warning("Config refresh failed; serving the previously loaded config")
+            return self._value
+
+    def invalidate(self) -> None:
+        """Force the next `get` to load a fresh value"""
+        self._loaded_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {**self._stats, "hit_rate": self._stats["hits"] / lookups if lookups else 0.0}
+
+    def _refreshing(self) -> bool:
+        return self._inflight is not None and not self._inflight.done()
+
+    def _start_refresh(self) -> asyncio.Task:
+        # Single flight: every caller awaits the same in-flight load
+        loop = asyncio.get_running_loop()
+        if not self._refreshing() or self._inflight.get_loop() is not loop:
+            self._inflight = loop.create_task(self._load())
+            # Background refreshes have no awaiter; mark their failures as retrieved
+            self._inflight.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return self._inflight
+
+    async def _load(self) -> Any:
+        try:
+            value = await self._loader()
+        except Exception as e:
+            self._stats["errors"] += 1
+            logging.error(f"Error loading config: {e}")
+            raise
+        self._value = value
+        self._loaded_at = time.monotonic()
+        self._stats["loads"] += 1
+        logging.info(f"Config cache refreshed: {self.stats()}")
+        return value
+
+
+_config_cache = ConfigCache(load_config)
+
+
+async def get_config() -> Config:
+    """Return the worker-level cached config, loading it on first use or after expiry"""
+    return await _config_cache.get()
+
+
+def get_config_cache() -> ConfigCache:
+    return _config_cache
@@ -0,0 +1,207 @@
+# api/shared/services/cosmos_metrics.py
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+# Non-production responses carry a per-request RU summary (unset ENVT counts as production)
+COSMOS_RU_HEADER_ENABLED = os.environ.get("ENVT", "Production") != "Production"
+COSMOS_RU_HEADER = "X-Cosmos-Request-Charge"
+# "false" turns off the per-call metric log lines (worker aggregates in `stats()` are kept)
+COSMOS_METRICS_LOG = os.environ.get("COSMOS_METRICS_LOG", "true").lower() == "true"
+
+T = TypeVar("T", bound=Callable[..., Awaitable[Any]])
+
+
+@dataclass
+class CosmosCall:
+    """One CosmosService operation and the Cosmos round trips made for it"""
+    operation: str
+    function: str
+    parent: Optional["CosmosCall"] = None
+    request_charge: float = 0.0
+    round_trips: int = 0
+    item_count: int = 0
+    cross_partition: bool = False
+    throttled: int = 0
+
+    def add_response(self, request_charge: float, item_count: int, cross_partition: bool, throttled: bool) -> None:
+        self.request_charge += request_charge
+        self.round_trips += 1
+        self.item_count += item_count
+        self.cross_partition = self.cross_partition or cross_partition
+        self.throttled += int(throttled)
+
+    def absorb(self, call: "CosmosCall") -> None:
+        """Fold a nested operation (e.g. get_user inside update_user_credits) into this one"""
+        self.request_charge += call.request_charge
+        self.round_trips += call.round_trips
+        self.item_count += call.item_count
+        self.cross_partition = self.cross_partition or call.cross_partition
+        self.throttled += call.throttled
+
+
+@dataclass
+class RequestUsage:
+    """Cosmos usage of one function invocation, summed over its top-level operations"""
+    function: str
+    request_charge: float = 0.0
+    calls: int = 0
+    duration_ms: float = 0.0
+    operations: Dict[str, float] = field(default_factory=dict)
+
+    def add(self, call: CosmosCall, duration_ms: float) -> None:
+        self.request_charge += call.request_charge
+        self.calls += 1
+        self.duration_ms += duration_ms
+        self.operations[call.operation] = self.operations.get(call.operation, 0.0) + call.request_charge
+
+    def header_value(self) -> str:
+        parts = [f"total={self.request_charge:.2f}", f"calls={self.calls}", f"ms={self.duration_ms:.0f}"]
+        parts.extend(f"{name}={charge:.2f}" for name, charge in self.operations.items())
+        return "; ".join(parts)
+
+
+_function_name: ContextVar[str] = ContextVar("cosmos_function_name", default="unknown")
+_request_usage: ContextVar[Optional[RequestUsage]] = ContextVar("cosmos_request_usage", default=None)
+_current_call: ContextVar[Optional[CosmosCall]] = ContextVar("cosmos_current_call", default=None)
+
+
+class CosmosMetrics:
+    """Worker-level aggregates of Cosmos operations per (function, operation)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, call: CosmosCall, duration_ms: float, status: str) -> None:
+        key = f"{call.function}.{call.operation}"
+        with self._lock:
+            totals = self._totals.setdefault(key, {
+                "calls": 0, "errors": 0, "request_charge": 0.0, "duration_ms": 0.0,
+                "max_duration_ms": 0.0, "items": 0, "cross_partition": 0, "throttled": 0
+            })
+            totals["calls"] += 1
+            totals["errors"] += int(status != "ok")
+            totals["request_charge"] += call.request_charge
+            totals["duration_ms"] += duration_ms
+            totals["max_duration_ms"] = max(totals["max_duration_ms"], duration_ms)
+            totals["items"] += call.item_count
+            totals["cross_partition"] += int(call.cross_partition)
+            totals["throttled"] += call.throttled
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Totals per `function.operation`, most expensive (total RU) first"""
+        with self._lock:
+            rows = {key: dict(totals) for key, totals in self._totals.items()}
+        for totals in rows.values():
+            totals["request_charge"] = round(totals["request_charge"], 2)
+            totals["avg_request_charge"] = round(totals["request_charge"] / totals["calls"], 2)
+            totals["avg_duration_ms"] = round(totals["duration_ms"] / totals["calls"], 1)
+            totals["duration_ms"] = round(totals["duration_ms"], 1)
+            totals["max_duration_ms"] = round(totals["max_duration_ms"], 1)
+        return dict(sorted(rows.items(), key=lambda row: row[1]["request_charge"], reverse=True))
+
+
+_cosmos_metrics = CosmosMetrics()
+
+
+def get_cosmos_metrics() -> CosmosMetrics:
+    return _cosmos_metrics
+
+
+def begin_request(function_name: str) -> RequestUsage:
+    """Tag Cosmos calls made by the rest of this invocation with the function name"""
+    usage = RequestUsage(function_name)
+    _function_name.set(function_name)
+    _request_usage.set(usage)
+    return usage
+
+
+def current_request_charge() -> float:
+    """RU charged so far to the CosmosService operation in progress in this task (0 outside one)"""
+    call = _current_call.get()
+    return call.request_charge if call is not None else 0.0
+
+
+def record_response(pipeline_response) -> None:
+    """
+    `raw_response_hook` of the Cosmos client: runs for every HTTP response
+    (query pages and retries included) in the context of the calling task,
+    and charges it to the CosmosService operation in progress.
+    """
+    call = _current_call.get()
+    if call is None:
+        return
+    try:
+        request_headers = pipeline_response.http_request.headers
+        response = pipeline_response.http_response
+        headers = response.headers
+        request_charge = float(headers.get("x-ms-request-charge") or 0)
+        if "x-ms-item-count" in headers:
+            item_count = int(headers["x-ms-item-count"])
+        else:
+            item_count = int(200 <= response.status_code < 300 and "/docs/" in pipeline_response.http_request.url)
+        is_query = request_headers.get("x-ms-documentdb-isquery") == "true"
+        cross_partition = is_query and "x-ms-documentdb-partitionkey" not in request_headers
+        call.add_response(request_charge, item_count, cross_partition, response.status_code == 429)
+    except Exception as e:
+        logging.warning(f"Could not record Cosmos response metrics: {e}")
+
+
+def cosmos_operation(func: T) -> T:
+    """
+    Decorator for CosmosService methods: measures latency and collects the
+    request charge, item count and cross-partition flag of the responses,
+    then logs one metric line and updates the worker aggregates.
+    """
+    operation = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        parent = _current_call.get()
+        call = CosmosCall(operation, _function_name.get(), parent)
+        token = _current_call.set(call)
+        status = "ok"
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            _current_call.reset(token)
+            _finish(call, duration_ms, status)
+
+    return wrapper  # type: ignore[return-value]
+
+
+def _finish(call: CosmosCall, duration_ms: float, status: str) -> None:
+    get_cosmos_metrics().record(call, duration_ms, status)
+    if call.parent is not None:
+        call.parent.absorb(call)
+    else:
+        usage = _request_usage.get()
+        if usage is not None:
+            usage.add(call, duration_ms)
+    if COSMOS_METRICS_LOG:
+        metric = {
+            "function": call.function,
+            "operation": call.operation,
+            "parent": call.parent.operation if call.parent else None,
+            "status": status,
+            "durationMs": round(duration_ms, 1),
+            "requestCharge": round(call.request_charge, 2),
+            "roundTrips": call.round_trips,
+            "itemCount": call.item_count,
+            "crossPartition": call.cross_partition,
+            "throttled": call.throttled
+        }
+        logging.info(f"CosmosMetric {json.dumps(metric)}")
+
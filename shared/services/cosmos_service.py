@@ -1,97 +1,285 @@
 from typing import Optional, List, Dict, Any
+import base64
 import logging
 import os
 from datetime import datetime
-from azure.cosmos import CosmosClient, PartitionKey
+from azure.core import MatchConditions
+from azure.cosmos import PartitionKey
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceNotFoundError
 from ..models.user import User
 from ..models.credit_transaction import CreditTransaction
 from ..models.story import Story
+from .client_pool import get_client_pool
+from .cosmos_metrics import cosmos_operation, current_request_charge
+from .user_cache import get_user_cache
+
+DATABASE_NAME = "StoryFairyDB"
+
+# Type of the story generation job documents stored next to stories in UserStories
+JOB_DOCUMENT_TYPE = "storyJob"
+
+# Partition key path of the Users container, read once per worker ("/id" allows point reads)
+_users_partition_path: Optional[str] = None
+
+# Overridable so a copy partitioned by /user_id can be switched to (tools/provision_credit_transactions.py)
+CREDIT_TRANSACTIONS_CONTAINER = os.environ.get("CREDIT_TRANSACTIONS_CONTAINER", "CreditTransactions")
+# Partition key path of the transactions container, read once per worker ("/user_id" keeps history single-partition)
+_transactions_partition_path: Optional[str] = None
+
+# Transaction history filters on user_id and sorts by created_at; the composite index serves both
+CREDIT_TRANSACTIONS_INDEXING_POLICY = {
+    "indexingMode": "consistent",
+    "automatic": True,
+    "includedPaths": [{"path": "/*"}],
+    "excludedPaths": [{"path": "/description/?"}, {"path": "/\"_etag\"/?"}],
+    "compositeIndexes": [
+        [
+            {"path": "/user_id", "order": "ascending"},
+            {"path": "/created_at", "order": "descending"}
+        ]
+    ]
+}
+TRANSACTION_HISTORY_FIELDS = ("id", "amount", "type", "description", "reference", "created_at")
+
+STORY_SUMMARIES_CONTAINER = "StorySummaries"
+# Writes always maintain the summary index, but story lists only read it once this is "true";
+# enable it after tools/rebuild_story_summaries.py has finished, since a partial index hides stories
+STORY_SUMMARIES_READ = os.environ.get("STORY_SUMMARIES_READ", "false").lower() == "true"
+
+
+def story_summary(story: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The StorySummaries document for a story: only what the story list
+    shows, without story text or image prompts. Partitioned by userId.
+    """
+    cover_images = {}
+    for cover_type, cover in (story.get("coverImages") or {}).items():
+        if cover:
+            cover_images[cover_type] = {key: cover[key] for key in ("url", "thumbnails", "version") if cover.get(key)}
+    return {
+        "id": story["id"],
+        "userId": story["userId"],
+        "title": story.get("title"),
+        "createdAt": story.get("createdAt"),
+        "coverImages": cover_images,
+        "metadata": story.get("metadata", {})
+    }
+
+
+def _encode_continuation_token(token: Optional[str]) -> Optional[str]:
+    """Cosmos continuation tokens are JSON; clients get them as URL-safe base64"""
+    if not token:
+        return None
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip("=")
+
+
+def _decode_continuation_token(token: Optional[str]) -> Optional[str]:
+    if not token:
+        return None
+    try:
+        decoded = base64.b64decode(token + "=" * (-len(token) % 4), altchars=b"-_", validate=True).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid continuation token")
+    if not decoded:
+        raise ValueError("Invalid continuation token")
+    return decoded
+
+
+# Database and container proxies per pooled client
+_container_handles: Dict[int, Dict[str, Any]] = {}
+
+
+def _get_container_handles(client) -> Dict[str, Any]:
+    handles = _container_handles.get(id(client))
+    if handles is None or handles["client"] is not client:
+        database = client.get_database_client(DATABASE_NAME)
+        handles = {
+            "client": client,
+            "database": database,
+            "user_container": database.get_container_client('Users'),
+            "transaction_container": database.get_container_client(CREDIT_TRANSACTIONS_CONTAINER),
+            "stories_container": database.get_container_client("UserStories"),
+            "summaries_container": database.get_container_client(STORY_SUMMARIES_CONTAINER),
+        }
+        _container_handles[id(client)] = handles
+    return handles
+
 
 class CosmosService:
-    def __init__(self):
-      #logging.info(f"Initializing CosmosService")
+    def __init__(self, client=None):
+      # The async client (and its connections) is shared by every invocation on the worker
       connection_string = os.environ.get('COSMOS_DB_CONNECTION_STRING')
-      #logging.info(f"Connection String: {connection_string}")
-      self.client = CosmosClient.from_connection_string(connection_string)
-      self.database = self.client.get_database_client('StoryFairyDB')
-      self.user_container = self.database.get_container_client('Users')
-      self.transaction_container = self.database.get_container_client('CreditTransactions')
-      self.stories_container = self.database.get_container_client("UserStories")
+      self.client = client or get_client_pool().get_async_cosmos_client(connection_string)
+      handles = _get_container_handles(self.client)
+      self.database = handles["database"]
+      self.user_container = handles["user_container"]
+      self.transaction_container = handles["transaction_container"]
+      self.stories_container = handles["stories_container"]
+      self.summaries_container = handles["summaries_container"]
 
       #logging.info("initialised cosmos service")
 
-#   async def get_user(self, user_id: str) -> Optional[User]:
-#       try:
-#           response = self.user_container.read_item(
-#               item=user_id,
-#               partition_key=user_id              
-#           )
-#           logging.info(f"Response: {response}")
-#           return User(**response)
-#       except Exception as e:
-#           logging.error(f"Error getting user: {str(e)}") 
-#           if getattr(e, 'status_code', None) == 404:
-#               return None
-#           raise e
-    async def get_user(self, user_id: str) -> Optional[User]:
-        try:
-            logging.info(f"Getting user with ID: {user_id}")
+    async def _users_point_readable(self) -> bool:
+        global _users_partition_path
+        if _users_partition_path is None:
+            try:
+                _users_partition_path = (await self.user_container.read())["partitionKey"]["paths"][0]
+            except Exception as e:
+                logging.warning(f"Could not read the Users partition key; falling back to queries: {e}")
+                return False
+            logging.info(f"Users container partition key: {_users_partition_path}")
+        return _users_partition_path == "/id"
+
+    async def _transactions_partitioned_by_user(self) -> bool:
+        global _transactions_partition_path
+        if _transactions_partition_path is None:
+            try:
+                _transactions_partition_path = (await self.transaction_container.read())["partitionKey"]["paths"][0]
+            except Exception as e:
+                logging.warning(f"Could not read the {CREDIT_TRANSACTIONS_CONTAINER} partition key: {e}")
+                return False
+            if _transactions_partition_path != "/user_id":
+                logging.warning(f"{CREDIT_TRANSACTIONS_CONTAINER} is partitioned by {_transactions_partition_path}; "
+                                "transaction history queries fan out across partitions")
+        return _transactions_partition_path == "/user_id"
+
+    async def _read_user_document(self, user_id: str, revalidate: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Point read of a user document (the Users partition key is the id)
+        behind the worker-level user cache. `revalidate` skips the TTL and
+        always checks the ETag, for read-modify-write callers.
+        """
+        cache = get_user_cache()
+        cached = cache.get(user_id)
+        if cached is not None and not revalidate and cache.is_fresh(cached):
+            cache.record("hits")
+            return cached.document
+
+        point_readable = await self._users_point_readable()
+        # The client is shared by concurrent invocations, so the charge comes from this task's call record
+        charge_before = current_request_charge()
+        if not point_readable:
             query = "SELECT * FROM c WHERE c.id = @userId"
             parameters = [{"name": "@userId", "value": user_id}]
-
-            results = list(self.user_container.query_items(
+            results = [item async for item in self.user_container.query_items(
                 query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
+                parameters=parameters
+            )]
+            cache.record("queries", current_request_charge() - charge_before)
+            document = results[0] if results else None
+        else:
+            conditions = {}
+            if cached is not None and cached.etag:
+                conditions = {"etag": cached.etag, "match_condition": MatchConditions.IfModified}
+            try:
+                document = await self.user_container.read_item(item=user_id, partition_key=user_id, **conditions)
+            except CosmosResourceNotFoundError:
+                document = None
+            cache.record("point_reads", current_request_charge() - charge_before)
+            if cached is not None and conditions and document is not None and not document:
+                # 304 Not Modified: the cached copy is current
+                cache.mark_validated(cached)
+                return cached.document
 
-            if not results:
-                return None
+        cache.record("misses" if cached is None else "refreshed")
+        if document is None:
+            cache.invalidate(user_id)
+            return None
+        cache.put(user_id, document)
+        if cached is None:
+            logging.info(f"User cache: {cache.stats()}")
+        return document
 
-            return User(**results[0])
+    @cosmos_operation
+    async def get_user(self, user_id: str, revalidate: bool = False) -> Optional[User]:
+        try:
+            logging.info(f"Getting user with ID: {user_id}")
+            document = await self._read_user_document(user_id, revalidate)
+            if document is None:
+                return None
+            return User(**document)
         except Exception as e:
             logging.error(f"Error getting user: {str(e)}")
-        raise e
+            raise
 
+    @cosmos_operation
     async def create_user(self, user: User) -> User:
-        response = self.user_container.create_item(body=user.dict())
+        response = await self.user_container.create_item(body=user.dict())
+        get_user_cache().put(user.id, response)
         return User(**response)
   
+    @cosmos_operation
     async def update_user(self, user: User) -> User:
-        response = self.user_container.replace_item(
-            item=user.id,
-            body=user.dict()
-        )
+        try:
+            response = await self.user_container.replace_item(
+                item=user.id,
+                body=user.dict()
+            )
+        except Exception:
+            get_user_cache().invalidate(user.id)
+            raise
+        get_user_cache().put(user.id, response)
         return User(**response)
 
+    @cosmos_operation
     async def update_user_credits(self, user_id: str, credits: int) -> User:
-        user = await self.get_user(user_id)
+        user = await self.get_user(user_id, revalidate=True)
         if not user:
             raise ValueError("User not found")
 
         user.credits = credits
-        response = self.user_container.replace_item(
-            item=user_id,
-            body=user.dict()
-        )
-        return User(**response)
+        return await self.update_user(user)
 
+    @cosmos_operation
     async def create_transaction(self, transaction: CreditTransaction) -> CreditTransaction:
-        response = self.transaction_container.create_item(body=transaction.dict())
+        response = await self.transaction_container.create_item(body=transaction.dict())
         return CreditTransaction(**response)
 
-    async def get_user_transactions(self, user_id: str) -> List[CreditTransaction]:
-        query = "SELECT * FROM c WHERE c.userId = @userId ORDER BY c.createdAt DESC"
+    @cosmos_operation
+    async def get_user_transactions(self, user_id: str, page_size: int = 20,
+                                    continuation_token: Optional[str] = None,
+                                    created_from: Optional[str] = None,
+                                    created_to: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get one page of a user's credit transactions (newest first), optionally
+        limited to created_from <= created_at < created_to (ISO timestamps),
+        plus an opaque token for the next page (None on the last page). Only
+        TRANSACTION_HISTORY_FIELDS are returned. Raises ValueError for a
+        malformed token.
+        """
+        fields = ", ".join(f"c.{name}" for name in TRANSACTION_HISTORY_FIELDS)
+        query = f"SELECT {fields} FROM c WHERE c.user_id = @userId"
         parameters = [{"name": "@userId", "value": user_id}]
+        if created_from:
+            query += " AND c.created_at >= @createdFrom"
+            parameters.append({"name": "@createdFrom", "value": created_from})
+        if created_to:
+            query += " AND c.created_at < @createdTo"
+            parameters.append({"name": "@createdTo", "value": created_to})
+        # Ordering by the filtered property too lets the (user_id, created_at) composite index serve the sort
+        query += " ORDER BY c.user_id ASC, c.created_at DESC"
 
-        results = self.transaction_container.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        )
+        options = {"max_item_count": page_size}
+        if await self._transactions_partitioned_by_user():
+            options["partition_key"] = user_id
+
+        try:
+            query_response = self.transaction_container.query_items(query=query, parameters=parameters, **options)
+            pager = query_response.by_page(_decode_continuation_token(continuation_token))
+            items = []
+            async for page in pager:
+                items = [item async for item in page]
+                break
+        except Exception as e:
+            logging.error(f"Error fetching credit transactions from Cosmos DB: {e}")
+            raise
 
-        return [CreditTransaction(**item) for item in results]
+        return {
+            "transactions": [{name: item.get(name) for name in TRANSACTION_HISTORY_FIELDS} for item in items],
+            "continuationToken": _encode_continuation_token(pager.continuation_token)
+        }
   
+    @cosmos_operation
     async def create_story(self, story_data: Dict[str, Any]) -> str:
         """
         Create a new story document in Cosmos DB
@@ -121,112 +309,174 @@ class CosmosService:
                 }
             }
 
-            created_item = self.stories_container.create_item(body=story_doc)
+            created_item = await self.stories_container.create_item(body=story_doc)
+            await self._upsert_story_summary(created_item)
             return created_item['id']
         except Exception as e:
             logging.error(f"Error creating story in Cosmos DB: {e}")
             raise
 
-    async def get_user_stories(self, user_id: str, page_size: int = 10) -> Dict[str, Any]:
-        """
-        Get paginated stories for a specific user
-        """
+    async def _upsert_story_summary(self, story: Dict[str, Any]) -> None:
+        # Best effort: the story itself is already saved, and tools/rebuild_story_summaries.py repairs the index
         try:
-            query = """
-                SELECT * FROM c 
-                WHERE c.userId = @userId 
-                ORDER BY c.createdAt DESC
-            """
+            await self.summaries_container.upsert_item(body=story_summary(story))
+        except Exception as e:
+            logging.warning(f"Could not update the summary of story {story.get('id')}: {e}")
 
-            parameters = [{"name": "@userId", "value": user_id}]
+    async def _delete_story_summary(self, story_id: str, user_id: str) -> None:
+        try:
+            await self.summaries_container.delete_item(item=story_id, partition_key=user_id)
+        except CosmosResourceNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"Could not delete the summary of story {story_id}: {e}")
 
-            query_response = self.stories_container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True,
-                max_item_count=page_size
-            )
+    async def _query_story_page(self, container, user_id: str, page_size: int,
+                          continuation_token: Optional[str]) -> Dict[str, Any]:
+        query = """
+            SELECT c.id, c.title, c.createdAt, c.coverImages, c.metadata FROM c 
+            WHERE c.userId = @userId 
+            AND (NOT IS_DEFINED(c.type) OR c.type != 'storyJob')
+            ORDER BY c.createdAt DESC
+        """
 
-            items = list(query_response)
+        parameters = [{"name": "@userId", "value": user_id}]
 
-            return {
-                "stories": items
-            }
+        query_response = container.query_items(
+            query=query,
+            parameters=parameters,
+            partition_key=user_id,
+            max_item_count=page_size
+        )
+
+        pager = query_response.by_page(_decode_continuation_token(continuation_token))
+        items = []
+        async for page in pager:
+            items = [item async for item in page]
+            break
+
+        return {
+            "stories": items,
+            "continuationToken": _encode_continuation_token(pager.continuation_token)
+        }
+
+    @cosmos_operation
+    async def get_user_stories(self, user_id: str, page_size: int = 10,
+                               continuation_token: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get one page of a user's stories (newest first), plus an opaque token
+        for the next page (None on the last page). Reads the StorySummaries
+        index when STORY_SUMMARIES_READ is enabled, otherwise (or when the
+        index container does not exist) a projection over UserStories.
+        Raises ValueError for a malformed token.
+        """
+        try:
+            if STORY_SUMMARIES_READ:
+                try:
+                    return await self._query_story_page(self.summaries_container, user_id, page_size, continuation_token)
+                except CosmosResourceNotFoundError:
+                    logging.warning(f"{STORY_SUMMARIES_CONTAINER} container not found; listing from UserStories")
+            return await self._query_story_page(self.stories_container, user_id, page_size, continuation_token)
         except Exception as e:
             logging.error(f"Error fetching user stories from Cosmos DB: {e}")
             raise
 
-    async def delete_story(self, story_id: str, user_id: str) -> bool:  
+    async def _read_story_document(self, document_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Point read in the user's partition (UserStories is partitioned by userId)"""
+        try:
+            document = await self.stories_container.read_item(item=document_id, partition_key=user_id)
+        except CosmosResourceNotFoundError:
+            return None
+        return document if document.get("userId") == user_id else None
+
+    @cosmos_operation
+    async def delete_story(self, story_id: str, user_id: str, etag: Optional[str] = None) -> bool:  
         """  
-        Delete a story document from Cosmos DB  
-        Returns True if successful, False otherwise  
+        Delete a story document from Cosmos DB in a single call. The
+        partition key limits the delete to the user's own documents; with
+        `etag` it only succeeds if the story is unchanged since it was read
+        (raises CosmosAccessConditionFailedError otherwise).
+        Returns True if deleted, False if there was no such story
         """  
         try:  
-            # First verify the story belongs to the user  
-            query = """  
-            SELECT * FROM c   
-            WHERE c.id = @id AND c.userId = @userId  
-            """  
-            parameters = [  
-                {"name": "@id", "value": story_id},  
-                {"name": "@userId", "value": user_id}  
-            ]  
-
-            result = list(self.stories_container.query_items(  
-                query=query,  
-                parameters=parameters,  
-                enable_cross_partition_query=True  
-            ))  
-
-            if not result:  
-                return False  
-
-            # Delete the story with properly formatted partition key  
-            self.stories_container.delete_item(  
+            conditions = {"etag": etag, "match_condition": MatchConditions.IfNotModified} if etag else {}
+            await self.stories_container.delete_item(  
                 item=story_id,   
-                partition_key=user_id  # Format partition key as a list  
+                partition_key=user_id,
+                **conditions
             )  
+            await self._delete_story_summary(story_id, user_id)
             return True  
+        except CosmosResourceNotFoundError:
+            return False
+        except CosmosAccessConditionFailedError:
+            logging.warning(f"Story {story_id} changed since it was read; not deleted")
+            raise
         except Exception as e:  
             logging.error(f"Error deleting story from Cosmos DB: {e}")  
             raise  
 
+    @cosmos_operation
     async def get_story_by_id(self, story_id: str, user_id: str) -> Optional[Dict[str, Any]]:
         """
         Get a specific story by ID and verify it belongs to the user
         """
         try:
-            query = """
-                SELECT * FROM c 
-                WHERE c.id = @id AND c.userId = @userId
-            """
-            parameters = [
-                {"name": "@id", "value": story_id},
-                {"name": "@userId", "value": user_id}
-            ]
-
-            result = list(self.stories_container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-
-            return result[0] if result else None
+            story = await self._read_story_document(story_id, user_id)
+            if story is None or story.get("type") == JOB_DOCUMENT_TYPE:
+                return None
+            return story
         except Exception as e:
             logging.error(f"Error fetching story from Cosmos DB: {e}")
             raise
 
+    @cosmos_operation
     async def update_story(self, story: Dict[str, Any]) -> str:  
             """  
             Update a story document in Cosmos DB by replacing it.  
             Returns the updated story's ID.  
             """  
             try:
-                response = self.stories_container.replace_item(
+                response = await self.stories_container.replace_item(
                     item=story["id"],
                     body=story
                 )
+                await self._upsert_story_summary(response)
                 return response["id"]
             except Exception as e:
                 logging.error(f"Error updating story in Cosmos DB: {e}")
-                raise
\ No newline at end of file
+                raise
+
+    @cosmos_operation
+    async def create_story_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Create an asynchronous story generation job. Jobs live in the
+        UserStories container next to the stories they produce.
+        """
+        try:
+            return await self.stories_container.create_item(body=job)
+        except Exception as e:
+            logging.error(f"Error creating story job in Cosmos DB: {e}")
+            raise
+
+    @cosmos_operation
+    async def get_story_job(self, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a story generation job and verify it belongs to the user
+        """
+        try:
+            job = await self._read_story_document(job_id, user_id)
+            if job is None or job.get("type") != JOB_DOCUMENT_TYPE:
+                return None
+            return job
+        except Exception as e:
+            logging.error(f"Error fetching story job from Cosmos DB: {e}")
+            raise
+
+    @cosmos_operation
+    async def update_story_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return await self.stories_container.upsert_item(body=job)
+        except Exception as e:
+            logging.error(f"Error updating story job in Cosmos DB: {e}")
+            raise
@@ -1,7 +1,7 @@
 from datetime import datetime
 import uuid
 import logging
-from typing import List, Optional
+from typing import Any, Dict, Optional
 from .cosmos_service import CosmosService
 from ..models.user import User
 from ..models.credit_transaction import CreditTransaction
@@ -31,7 +31,8 @@ class CreditService:
         return user.credits
 
     async def deduct_credits(self, user_id: str, amount: int, description: str) -> int:
-        user = await self.cosmos_service.get_user(user_id)
+        # Balance changes start from the current document, not a cached copy
+        user = await self.cosmos_service.get_user(user_id, revalidate=True)
         if not user:
             raise ValueError('User not found')
         if user.credits < amount:
@@ -53,7 +54,8 @@ class CreditService:
         return new_balance
 
     async def add_credits(self, user_id: str, amount: int, description: str, reference: Optional[str] = None) -> int:
-        user = await self.cosmos_service.get_user(user_id)
+        # Balance changes start from the current document, not a cached copy
+        user = await self.cosmos_service.get_user(user_id, revalidate=True)
         if not user:
             raise ValueError('User not found')
 
@@ -73,6 +75,11 @@ class CreditService:
 
         return new_balance
     
-    async def get_user_transactions(self, user_id: str) -> List[CreditTransaction]:
-        """Get user's transaction history"""
-        return await self.cosmos_service.get_user_transactions(user_id)
\ No newline at end of file
+    async def get_user_transactions(self, user_id: str, page_size: int = 20,
+                                    continuation_token: Optional[str] = None,
+                                    created_from: Optional[str] = None,
+                                    created_to: Optional[str] = None) -> Dict[str, Any]:
+        """Get one page of the user's transaction history, newest first"""
+        return await self.cosmos_service.get_user_transactions(
+            user_id, page_size, continuation_token, created_from, created_to
+        )
\ No newline at end of file
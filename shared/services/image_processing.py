@@ -0,0 +1,205 @@
+# api/shared/services/image_processing.py
+import logging
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Dict, List, Optional
+from PIL import Image, UnidentifiedImageError, features
+
+try:
+    import pillow_avif  # noqa: F401  (registers the AVIF codec on older Pillow builds)
+except ImportError:
+    pillow_avif = None
+
+# webp, avif, jpeg, png or "original" to store provider bytes untouched
+IMAGE_OUTPUT_FORMAT = os.environ.get("IMAGE_OUTPUT_FORMAT", "webp").lower()
+IMAGE_OUTPUT_QUALITY = int(os.environ.get("IMAGE_OUTPUT_QUALITY", "80"))
+# Images up to this size stay in memory while being processed; larger ones spill to disk
+IMAGE_SPOOL_MAX_MEMORY = int(os.environ.get("IMAGE_SPOOL_MAX_MEMORY", str(2 * 1024 * 1024)))
+
+# Thumbnail derivatives: size name -> width in pixels ("small:160,medium:480")
+THUMBNAIL_SIZES = {
+    name: int(width)
+    for name, width in (item.split(":") for item in
+                        os.environ.get("IMAGE_THUMBNAIL_SIZES", "small:160,medium:480").split(",") if item)
+}
+
+# Widths GetBlob may resize to (`?w=`); a whitelist keeps the number of derivatives per image bounded
+RESIZE_WIDTHS = sorted({
+    int(width) for width in os.environ.get("IMAGE_RESIZE_WIDTHS", "160,320,480,640,800,1024").split(",") if width
+} | set(THUMBNAIL_SIZES.values()))
+
+# format -> (Pillow format, content type, extension)
+IMAGE_FORMATS = {
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "avif": ("AVIF", "image/avif", ".avif"),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+    "png": ("PNG", "image/png", ".png"),
+    "gif": ("GIF", "image/gif", ".gif"),
+}
+
+
+@dataclass
+class ProcessedImage:
+    file: BinaryIO
+    format: str
+    content_type: str
+    extension: str
+    size: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+    metadata: Dict[str, str] = field(default_factory=dict)
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Image format from the leading magic bytes, or None if unrecognised"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "avif"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    return None
+
+
+def spooled_file() -> SpooledTemporaryFile:
+    return SpooledTemporaryFile(max_size=IMAGE_SPOOL_MAX_MEMORY)
+
+
+def _avif_supported() -> bool:
+    if pillow_avif is not None:
+        return True
+    return "avif" in features.modules and bool(features.check_module("avif"))
+
+
+def resolve_output_format(fmt: str) -> str:
+    """Validate a configured output format, falling back to webp when the codec is unavailable"""
+    if fmt == "avif" and not _avif_supported():
+        logging.warning("AVIF encoding is not available in this Pillow build; using webp")
+        return "webp"
+    if fmt != "original" and fmt not in IMAGE_FORMATS:
+        logging.warning(f"Unknown IMAGE_OUTPUT_FORMAT {fmt}; using webp")
+        return "webp"
+    return fmt
+
+
+_output_format = resolve_output_format(IMAGE_OUTPUT_FORMAT)
+
+
+def output_format() -> str:
+    return _output_format
+
+
+def resize_formats() -> List[str]:
+    """Formats GetBlob may encode resized derivatives in (`?fmt=`)"""
+    formats = ["webp", "jpeg", "png"]
+    if _avif_supported():
+        formats.append("avif")
+    return formats
+
+
+def _file_size(f: BinaryIO) -> int:
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(0)
+    return size
+
+
+def process_image(source: BinaryIO, fallback_content_type: str = "application/octet-stream") -> ProcessedImage:
+    """
+    Sniff the real format of `source` and re-encode it to the configured
+    output format and quality, also when it already is in that format (e.g.
+    webp at full quality). Keeps the original bytes when re-encoding does not
+    make the file smaller or when the bytes are not a readable image.
+    Blocking (CPU bound); call it off the event loop.
+    """
+    source_size = _file_size(source)
+    try:
+        with Image.open(source) as img:
+            source_format = (img.format or "").lower()
+            width, height = img.size
+            target = output_format()
+            metadata = {
+                "sourceformat": source_format,
+                "width": str(width),
+                "height": str(height),
+            }
+
+            if target != "original":
+                pil_format, content_type, extension = IMAGE_FORMATS[target]
+                has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+                if target == "jpeg":
+                    frame = img.convert("RGB")
+                else:
+                    frame = img.convert("RGBA" if has_alpha else "RGB")
+
+                encoded = spooled_file()
+                frame.save(encoded, format=pil_format, quality=IMAGE_OUTPUT_QUALITY, method=4)
+                encoded_size = _file_size(encoded)
+                if encoded_size < source_size:
+                    metadata["quality"] = str(IMAGE_OUTPUT_QUALITY)
+                    logging.info(f"Transcoded {source_format} ({source_size} bytes) to {target} ({encoded_size} bytes)")
+                    return ProcessedImage(encoded, target, content_type, extension, encoded_size,
+                                          width, height, metadata)
+                encoded.close()
+
+        # "original", or re-encoding did not make it smaller: keep the provider bytes
+        source.seek(0)
+        _, content_type, extension = IMAGE_FORMATS.get(
+            "jpeg" if source_format == "jpg" else source_format,
+            (None, fallback_content_type, "")
+        )
+        return ProcessedImage(source, source_format, content_type, extension, source_size, width, height, metadata)
+
+    except UnidentifiedImageError:
+        logging.warning("Could not identify the generated image format; storing it unchanged")
+        source.seek(0)
+        extension = mimetypes.guess_extension(fallback_content_type) or ""
+        return ProcessedImage(source, "unknown", fallback_content_type, extension, source_size)
+
+
+def derivative_blob_name(blob_name: str, width: int, extension: str) -> str:
+    """`story_x-image1.webp` -> `story_x-image1_w160.webp`"""
+    return f"{os.path.splitext(blob_name)[0]}_w{width}{extension}"
+
+
+def render_thumbnails(source: BinaryIO, sizes: Optional[Dict[str, int]] = None,
+                      fmt: Optional[str] = None) -> Dict[str, ProcessedImage]:
+    """
+    Downscale `source` once per configured width (aspect ratio kept, never
+    upscaled) and encode each in `fmt` (default: the output format).
+    Blocking; call it off the event loop.
+    """
+    sizes = sizes or THUMBNAIL_SIZES
+    target = fmt or output_format()
+    if target == "original":
+        target = "webp"
+    pil_format, content_type, extension = IMAGE_FORMATS[target]
+    thumbnails = {}
+    source.seek(0)
+    with Image.open(source) as img:
+        img.draft("RGB", (max(sizes.values()), max(sizes.values())))
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        base = img.convert("RGBA" if has_alpha and target != "jpeg" else "RGB")
+        # Largest first, so every smaller size is resampled from the previous one
+        for name, width in sorted(sizes.items(), key=lambda item: -item[1]):
+            frame = base.copy()
+            frame.thumbnail((width, width * 4), Image.LANCZOS)
+            encoded = spooled_file()
+            frame.save(encoded, format=pil_format, quality=IMAGE_OUTPUT_QUALITY, method=4)
+            thumbnails[name] = ProcessedImage(
+                encoded, target, content_type, extension, _file_size(encoded),
+                frame.width, frame.height, {"derivative": name, "width": str(frame.width), "height": str(frame.height)}
+            )
+            base = frame
+    return thumbnails
+
+
+def resize_image(source: BinaryIO, width: int, fmt: Optional[str] = None) -> ProcessedImage:
+    """A single downscaled rendition of `source`; blocking, like `render_thumbnails`"""
+    return render_thumbnails(source, {f"w{width}": width}, fmt)[f"w{width}"]
@@ -0,0 +1,314 @@
+# api/shared/services/image_providers.py
+import asyncio
+import base64
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional
+from .client_pool import get_client_pool
+from .config_service import Config
+
+IMAGEN_ENDPOINT = "https://generativelanguage.googleapis.com/v1beta/models/{model}:predict"
+
+# Defaults per limiter; override with IMAGE_PROVIDER_<NAME>_CONCURRENCY / _RPS / _BURST
+LIMITER_DEFAULTS = {
+    "replicate": {"concurrency": 4, "rps": 2.0, "burst": 4},
+    "imagen": {"concurrency": 2, "rps": 0.5, "burst": 2},
+}
+
+
+@dataclass
+class GeneratedImage:
+    """Provider output: either a URL to download or the image bytes themselves"""
+    prompt: str
+    url: Optional[str] = None
+    data: Optional[bytes] = None
+    content_type: str = "image/png"
+
+    async def read(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        session = get_client_pool().get_http_session()
+        async with session.get(self.url) as response:
+            response.raise_for_status()
+            return await response.read()
+
+
+class ProviderLimiter:
+    """
+    Concurrency cap plus token-bucket rate limit for one provider quota.
+
+    Waiters are queued per request key (one story, one regeneration) and
+    slots are handed out round-robin across keys, so a saga story with 17
+    images cannot starve a short story that arrives right after it.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, rate_per_second: float, burst: int):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_per_second = rate_per_second
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._active = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queue_depth = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats = {"acquired": 0, "rate_limited": 0, "max_queue_depth": 0,
+                       "total_wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    @asynccontextmanager
+    async def slot(self, request_key: str = "default"):
+        """Wait for a slot under this limiter; released when the block exits"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(request_key, deque()).append(waiter)
+        self._queue_depth += 1
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queue_depth)
+        enqueued_at = time.monotonic()
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            self._forget(request_key, waiter)
+            raise
+
+        waited = time.monotonic() - enqueued_at
+        self._stats["acquired"] += 1
+        self._stats["total_wait_seconds"] += waited
+        self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        if waited > 1:
+            logging.info(f"Image provider {self.name} queued a request for {waited:.2f}s")
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _forget(self, request_key: str, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(request_key)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queue_depth -= 1
+            if not queue:
+                del self._queues[request_key]
+        elif waiter.done() and not waiter.cancelled():
+            # Granted a slot but cancelled before using it
+            self._release()
+
+    def _release(self) -> None:
+        self._active -= 1
+        self._dispatch()
+
+    def _take_token(self) -> bool:
+        if self.rate_per_second <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_second)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrency and self._queues:
+            if not self._take_token():
+                loop = asyncio.get_running_loop()
+                if self._timer is None or self._timer_loop is not loop:
+                    self._stats["rate_limited"] += 1
+                    delay = (1 - self._tokens) / self.rate_per_second
+                    self._timer = loop.call_later(delay, self._on_timer)
+                    self._timer_loop = loop
+                return
+            # Round robin: serve the oldest waiter of the next request key
+            request_key, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            self._queue_depth -= 1
+            if queue:
+                self._queues[request_key] = queue
+            if waiter.done():
+                self._tokens += 1
+                continue
+            self._active += 1
+            waiter.set_result(None)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        acquired = self._stats["acquired"]
+        return {
+            **self._stats,
+            "active": self._active,
+            "queue_depth": self._queue_depth,
+            "waiting_requests": len(self._queues),
+            "avg_wait_seconds": self._stats["total_wait_seconds"] / acquired if acquired else 0.0,
+        }
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+
+
+def get_limiter(name: str) -> ProviderLimiter:
+    limiter = _limiters.get(name)
+    if limiter is None:
+        defaults = LIMITER_DEFAULTS.get(name, {"concurrency": 4, "rps": 0.0, "burst": 1})
+        prefix = f"IMAGE_PROVIDER_{name.upper()}"
+        limiter = ProviderLimiter(
+            name,
+            max_concurrency=int(os.environ.get(f"{prefix}_CONCURRENCY", defaults["concurrency"])),
+            rate_per_second=float(os.environ.get(f"{prefix}_RPS", defaults["rps"])),
+            burst=int(os.environ.get(f"{prefix}_BURST", defaults["burst"]))
+        )
+        _limiters[name] = limiter
+    return limiter
+
+
+class ImageProvider(ABC):
+    """One image model; `generate` returns None when the provider produced nothing"""
+    name = "base"
+    limiter_name = "default"
+
+    @abstractmethod
+    async def generate(self, prompt: str, config: Config,
+                       reference_image_url: Optional[str] = None) -> Optional[GeneratedImage]:
+        ...
+
+
+class ReplicateImageProvider(ImageProvider):
+    """Replicate model; every Replicate model shares the account-wide limiter"""
+    limiter_name = "replicate"
+
+    def __init__(self, name: str, model: str, build_input: Callable[[str, Optional[str]], Dict[str, Any]]):
+        self.name = name
+        self.model = model
+        self.build_input = build_input
+
+    async def generate(self, prompt: str, config: Config,
+                       reference_image_url: Optional[str] = None) -> Optional[GeneratedImage]:
+        client = get_client_pool().get_replicate_client(config.replicate_token)
+        output = await client.async_run(self.model, input=self.build_input(prompt, reference_image_url))
+        if isinstance(output, (list, tuple)):
+            output = output[0] if output else None
+        if not output:
+            return None
+        logging.info(f"Generated image ({self.name}): {output}")
+        return GeneratedImage(prompt=prompt, url=str(output))
+
+
+class ImagenProvider(ImageProvider):
+    """Google Imagen 3 through the Gemini API predict endpoint (returns inline image bytes)"""
+    name = "imagen_3"
+    limiter_name = "imagen"
+    model = "imagen-3.0-generate-002"
+
+    async def generate(self, prompt: str, config: Config,
+                       reference_image_url: Optional[str] = None) -> Optional[GeneratedImage]:
+        session = get_client_pool().get_http_session()
+        body = {
+            "instances": [{"prompt": prompt}],
+            "parameters": {
+                "sampleCount": 1,
+                "aspectRatio": "1:1",
+                "personGeneration": "allow_adult",
+                "safetySetting": "block_only_high"
+            }
+        }
+        async with session.post(IMAGEN_ENDPOINT.format(model=self.model),
+                                params={"key": config.gemini_key}, json=body) as response:
+            response.raise_for_status()
+            result = await response.json()
+        predictions = result.get("predictions") or []
+        if not predictions or "bytesBase64Encoded" not in predictions[0]:
+            logging.warning(f"Imagen returned no image for prompt: {prompt}")
+            return None
+        prediction = predictions[0]
+        return GeneratedImage(
+            prompt=prompt,
+            data=base64.b64decode(prediction["bytesBase64Encoded"]),
+            content_type=prediction.get("mimeType", "image/png")
+        )
+
+
+def _stable_diffusion_input(prompt: str, reference_image_url: Optional[str]) -> Dict[str, Any]:
+    input_params = {
+        "cfg": 7,
+        "steps": 28,
+        "prompt": prompt,
+        "aspect_ratio": "1:1",
+        "output_quality": 100,
+        "negative_prompt": "ugly, blurry, distorted, text, watermark, extra limbs, extra body parts",
+        "prompt_strength": 0.85,
+        "scheduler": "K_EULER_ANCESTRAL",
+        "width": 768,
+        "height": 768
+    }
+    if reference_image_url:
+        input_params["image"] = reference_image_url
+    return input_params
+
+
+def _flux_schnell_input(prompt: str, reference_image_url: Optional[str]) -> Dict[str, Any]:
+    return {
+        "prompt": prompt,
+        "aspect_ratio": "1:1",
+        "go_fast": False,
+        "megapixels": "1",
+        "num_outputs": 1,
+        "output_quality": 100,
+        "num_inference_steps": 4,
+        "seed": 12022023
+    }
+
+
+def _flux_pro_input(prompt: str, reference_image_url: Optional[str]) -> Dict[str, Any]:
+    return {
+        "prompt": prompt,
+        "aspect_ratio": "1:1",
+        "output_format": "webp",
+        "output_quality": 100,
+        "safety_tolerance": 1,
+        "prompt_upsampling": False
+    }
+
+
+IMAGE_PROVIDERS: Dict[str, ImageProvider] = {}
+
+
+def register_image_provider(provider: ImageProvider) -> None:
+    IMAGE_PROVIDERS[provider.name] = provider
+
+
+register_image_provider(ReplicateImageProvider("flux_schnell", "black-forest-labs/flux-schnell", _flux_schnell_input))
+register_image_provider(ReplicateImageProvider("flux_pro", "black-forest-labs/flux-1.1-pro", _flux_pro_input))
+register_image_provider(ReplicateImageProvider("stable_diffusion_3", "stability-ai/stable-diffusion-3", _stable_diffusion_input))
+register_image_provider(ImagenProvider())
+
+
+def get_image_provider(name: str) -> ImageProvider:
+    try:
+        return IMAGE_PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f"Invalid image model: {name}")
+
+
+async def generate_image(image_model: str, prompt: str, config: Config, request_key: str = "default",
+                         reference_image_url: Optional[str] = None) -> Optional[GeneratedImage]:
+    """Generate one image under the provider's concurrency and rate limits; None on failure"""
+    provider = get_image_provider(image_model)
+    async with get_limiter(provider.limiter_name).slot(request_key):
+        try:
+            return await provider.generate(prompt, config, reference_image_url)
+        except Exception as e:
+            logging.error(f"{provider.name} error: {e}")
+            return None
+
+
+def image_provider_stats() -> Dict[str, Dict[str, Any]]:
+    """Queue depth, wait time and throttling counters per limiter"""
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
@@ -0,0 +1,96 @@
+# api/shared/services/llm_providers.py
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Type
+from google import generativeai as genai
+from .client_pool import get_client_pool
+
+GROK_BASE_URL = "https://api.x.ai/v1"
+
+_gemini_lock = threading.Lock()
+_gemini_api_key: Optional[str] = None
+
+
+def configure_gemini(api_key: str) -> None:
+    """
+    `genai.configure` drops the SDK's cached clients (and their channels), so
+    only reconfigure when the key actually changes.
+    """
+    global _gemini_api_key
+    with _gemini_lock:
+        if api_key != _gemini_api_key:
+            genai.configure(api_key=api_key)
+            _gemini_api_key = api_key
+
+
+class LLMProvider(ABC):
+    """Text completion against one LLM backend without blocking the event loop"""
+    name = "base"
+    default_model = ""
+
+    def __init__(self, api_key: str, model: Optional[str] = None):
+        self.api_key = api_key
+        self.model = model or self.default_model
+
+    @abstractmethod
+    async def complete(self, prompt: str, system: Optional[str] = None,
+                       max_tokens: Optional[int] = None) -> str:
+        ...
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+    default_model = "gpt-4o-mini"
+    base_url: Optional[str] = None
+
+    def __init__(self, api_key: str, model: Optional[str] = None, base_url: Optional[str] = None):
+        super().__init__(api_key, model)
+        self.base_url = base_url or self.base_url
+
+    async def complete(self, prompt: str, system: Optional[str] = None,
+                       max_tokens: Optional[int] = None) -> str:
+        client = get_client_pool().get_async_openai_client(self.api_key, base_url=self.base_url)
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
+        kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+        response = await client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+        return response.choices[0].message.content
+
+
+class GrokProvider(OpenAIProvider):
+    """Grok exposes an OpenAI-compatible API"""
+    name = "grok"
+    default_model = "grok-beta"
+    base_url = GROK_BASE_URL
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+    default_model = "gemini-2.0-flash-exp"
+
+    async def complete(self, prompt: str, system: Optional[str] = None,
+                       max_tokens: Optional[int] = None) -> str:
+        configure_gemini(self.api_key)
+        model = genai.GenerativeModel(self.model, system_instruction=system)
+        generation_config = {"max_output_tokens": max_tokens} if max_tokens else None
+        response = await model.generate_content_async(prompt, generation_config=generation_config)
+        return response.text
+
+
+LLM_PROVIDERS: Dict[str, Type[LLMProvider]] = {
+    OpenAIProvider.name: OpenAIProvider,
+    GrokProvider.name: GrokProvider,
+    GeminiProvider.name: GeminiProvider,
+}
+
+
+def get_llm_provider(name: str, api_key: str, model: Optional[str] = None) -> LLMProvider:
+    try:
+        provider_cls = LLM_PROVIDERS[name]
+    except KeyError:
+        logging.error(f"Unknown LLM provider: {name}")
+        raise ValueError(f"Unknown LLM provider: {name}")
+    return provider_cls(api_key, model)
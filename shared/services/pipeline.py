@@ -0,0 +1,125 @@
+# api/shared/services/pipeline.py
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+
+class StageError(Exception):
+    """Raised by a stage to abort the pipeline with a client-facing message"""
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+@dataclass
+class Stage:
+    """A pipeline step; `func` is called with the results of `deps` as keyword arguments"""
+    name: str
+    func: Callable[..., Awaitable[Any]]
+    deps: Tuple[str, ...] = field(default_factory=tuple)
+
+
+@dataclass
+class StageTiming:
+    start: float
+    end: Optional[float] = None
+    status: str = "running"
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else self.start) - self.start
+
+
+class StagePipeline:
+    """
+    Runs a small DAG of async stages. Every stage starts as soon as all of its
+    dependencies have produced a result, so the end-to-end latency is the
+    critical path rather than the sum of the stages. The first failing stage
+    cancels everything still in flight and its exception is re-raised.
+    """
+
+    def __init__(self, stages: Iterable[Stage], name: str = "pipeline",
+                 on_stage: Optional[Callable[[str, str], Any]] = None):
+        self.name = name
+        self.stages = list(stages)
+        self.on_stage = on_stage
+        self.timings: Dict[str, StageTiming] = {}
+        self.total_duration = 0.0
+
+    async def run(self, **inputs: Any) -> Dict[str, Any]:
+        """Run every stage and return a mapping of stage name (and input name) to result"""
+        results: Dict[str, Any] = dict(inputs)
+        pending = {stage.name: stage for stage in self.stages}
+        running: Dict[asyncio.Task, str] = {}
+        started_at = time.perf_counter()
+        self.timings = {}
+
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if all(dep in results for dep in stage.deps):
+                        del pending[name]
+                        kwargs = {dep: results[dep] for dep in stage.deps}
+                        task = asyncio.create_task(self._run_stage(stage, kwargs, started_at))
+                        running[task] = name
+
+                if not running:
+                    raise ValueError(f"Unsatisfiable stage dependencies in {self.name}: {sorted(pending)}")
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    results[name] = task.result()
+        finally:
+            for task, name in running.items():
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+            for name in pending:
+                self.timings.setdefault(name, StageTiming(start=0.0, end=0.0, status="skipped"))
+            self.total_duration = time.perf_counter() - started_at
+            logging.info(f"{self.name} timings: {self.describe_timings()}")
+
+        return results
+
+    async def _run_stage(self, stage: Stage, kwargs: Dict[str, Any], started_at: float) -> Any:
+        timing = StageTiming(start=time.perf_counter() - started_at)
+        self.timings[stage.name] = timing
+        self._report(stage.name, timing.status)
+        try:
+            result = await stage.func(**kwargs)
+            timing.status = "ok"
+            return result
+        except asyncio.CancelledError:
+            timing.status = "cancelled"
+            raise
+        except Exception:
+            timing.status = "failed"
+            raise
+        finally:
+            timing.end = time.perf_counter() - started_at
+            self._report(stage.name, timing.status)
+
+    def _report(self, name: str, status: str) -> None:
+        if self.on_stage is None:
+            return
+        try:
+            self.on_stage(name, status)
+        except Exception as e:
+            logging.warning(f"Stage listener failed for {name}: {e}")
+
+    def describe_timings(self) -> str:
+        parts = [
+            f"{name}={timing.duration:.2f}s@{timing.start:.2f}s({timing.status})"
+            for name, timing in self.timings.items()
+        ]
+        return f"total={self.total_duration:.2f}s " + " ".join(parts)
+
+    def server_timing_header(self) -> str:
+        """Per-stage durations in `Server-Timing` header format (milliseconds)"""
+        entries = [f"{name};dur={timing.duration * 1000:.0f}" for name, timing in self.timings.items()]
+        entries.append(f"total;dur={self.total_duration * 1000:.0f}")
+        return ", ".join(entries)
@@ -0,0 +1,55 @@
+# api/shared/services/story_events.py
+import time
+from typing import Any, Callable, Dict, List
+
+
+class StoryEventStream:
+    """
+    Ordered log of story generation events (title, sentences, images, ...).
+
+    Events are numbered in emission order and pushed to listeners (e.g. the
+    job tracker). While the stream is held (until moderation has passed)
+    content events are buffered and released together.
+    """
+
+    def __init__(self, held: bool = False):
+        self.events: List[Dict[str, Any]] = []
+        self._buffer: List[Dict[str, Any]] = []
+        self._held = held
+        self._closed = False
+        self._started_at = time.perf_counter()
+        self._listeners: List[Callable[[Dict[str, Any]], Any]] = []
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], Any]) -> None:
+        self._listeners.append(listener)
+
+    def emit(self, event: str, data: Any = None) -> None:
+        if self._closed:
+            return
+        record = {
+            "event": event,
+            "data": data,
+            "elapsedMs": round((time.perf_counter() - self._started_at) * 1000)
+        }
+        if self._held:
+            self._buffer.append(record)
+        else:
+            self._publish(record)
+
+    def release(self, discard: bool = False) -> None:
+        """Stop holding events and publish (or, with `discard`, drop) everything buffered so far"""
+        self._held = False
+        buffered, self._buffer = self._buffer, []
+        if discard:
+            return
+        for record in buffered:
+            self._publish(record)
+
+    def close(self) -> None:
+        self._closed = True
+
+    def _publish(self, record: Dict[str, Any]) -> None:
+        record["seq"] = len(self.events)
+        self.events.append(record)
+        for listener in self._listeners:
+            listener(record)
@@ -0,0 +1,146 @@
+# api/shared/services/story_jobs.py
+import asyncio
+import json
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+import azure.functions as func
+from .cosmos_service import JOB_DOCUMENT_TYPE, CosmosService
+
+STORY_JOB_QUEUE_NAME = "story-jobs"
+# queue (Azure Storage queue output binding) or inprocess
+STORY_JOB_QUEUE = os.environ.get("STORY_JOB_QUEUE", "queue")
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class JobQueue(ABC):
+    """Transport for story job messages ({"jobId", "userId"})"""
+    @abstractmethod
+    async def enqueue(self, message: Dict[str, Any]) -> None:
+        ...
+
+
+class BindingJobQueue(JobQueue):
+    """Azure Storage queue via the function's `jobQueue` output binding"""
+    def __init__(self, binding: func.Out):
+        self.binding = binding
+
+    async def enqueue(self, message: Dict[str, Any]) -> None:
+        self.binding.set(json.dumps(message))
+
+
+class InProcessJobQueue(JobQueue):
+    """Runs jobs as background tasks on the current worker (local development)"""
+    def __init__(self, handler: JobHandler):
+        self.handler = handler
+        self._tasks = set()
+
+    async def enqueue(self, message: Dict[str, Any]) -> None:
+        task = asyncio.get_running_loop().create_task(self.handler(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+def get_job_queue(binding: Optional[func.Out] = None, handler: Optional[JobHandler] = None) -> JobQueue:
+    if STORY_JOB_QUEUE == "inprocess":
+        if handler is None:
+            raise ValueError("The in-process job queue requires a job handler")
+        return InProcessJobQueue(handler)
+    if binding is None:
+        raise ValueError("The queue job backend requires the jobQueue output binding")
+    return BindingJobQueue(binding)
+
+
+def new_job(user_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    now = datetime.utcnow().isoformat()
+    return {
+        "id": str(uuid.uuid4()),
+        "userId": user_id,
+        "type": JOB_DOCUMENT_TYPE,
+        "status": "queued",
+        "request": request,
+        "stages": {},
+        "result": {"images": []},
+        "storyId": None,
+        "error": None,
+        "createdAt": now,
+        "updatedAt": now
+    }
+
+
+def job_status_response(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "jobId": job["id"],
+        "status": job["status"],
+        "stages": job.get("stages", {}),
+        "result": job.get("result", {}),
+        "storyId": job.get("storyId"),
+        "error": job.get("error"),
+        "createdAt": job.get("createdAt"),
+        "updatedAt": job.get("updatedAt")
+    }
+
+
+class JobTracker:
+    """
+    Mirrors pipeline progress (stage status and published story events) onto
+    the job document. Writes are serialised and coalesced, so a burst of
+    image events results in at most one pending upsert.
+    """
+
+    def __init__(self, job: Dict[str, Any], cosmos_service: Optional[CosmosService] = None):
+        self.job = job
+        self.cosmos_service = cosmos_service or CosmosService()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    def on_stage(self, name: str, status: str) -> None:
+        self.job["stages"][name] = status
+        self._schedule_flush()
+
+    def on_event(self, event: Dict[str, Any]) -> None:
+        result = self.job["result"]
+        data = event.get("data") or {}
+        name = event["event"]
+        if name == "title":
+            result["title"] = data.get("title")
+        elif name == "sentences":
+            result["sentences"] = data.get("sentences")
+        elif name == "simplified":
+            result["storyText"] = data.get("storyText")
+        elif name == "image":
+            result["images"].append(data)
+        elif name == "covers":
+            result["coverImages"] = data
+        elif name == "story":
+            self.job["storyId"] = data.get("id")
+        self._schedule_flush()
+
+    async def finish(self, status: str, error: Optional[str] = None) -> None:
+        self.job["status"] = status
+        self.job["error"] = error
+        await self.flush()
+
+    async def flush(self) -> None:
+        if self._flush_task is not None:
+            await asyncio.shield(self._flush_task)
+        self._dirty = True
+        await self._write()
+
+    def _schedule_flush(self) -> None:
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._write())
+
+    async def _write(self) -> None:
+        while self._dirty:
+            self._dirty = False
+            self.job["updatedAt"] = datetime.utcnow().isoformat()
+            try:
+                await self.cosmos_service.update_story_job(dict(self.job))
+            except Exception as e:
+                logging.error(f"Error saving progress of story job {self.job['id']}: {e}")
@@ -0,0 +1,79 @@
+# api/shared/services/user_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+# User documents are served from the worker cache for this long, then revalidated by ETag
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", "15"))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "5000"))
+
+
+@dataclass
+class CachedUser:
+    document: Dict[str, Any]
+    etag: Optional[str]
+    validated_at: float
+
+
+class UserCache:
+    """
+    Per-worker read-through cache of user documents. Entries younger than the
+    TTL are served without a Cosmos call; older ones are revalidated with a
+    conditional point read (If-None-Match on the document ETag). Writes made
+    through CosmosService replace or drop the entry. Also accumulates the RU
+    charge of user reads so the savings are visible.
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL_SECONDS, max_entries: int = USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedUser]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "revalidated": 0, "refreshed": 0, "invalidations": 0,
+                       "point_reads": 0, "queries": 0, "request_charge": 0.0}
+
+    def get(self, user_id: str) -> Optional[CachedUser]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+            return entry
+
+    def is_fresh(self, entry: CachedUser) -> bool:
+        return time.monotonic() - entry.validated_at < self.ttl
+
+    def put(self, user_id: str, document: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[user_id] = CachedUser(dict(document), document.get("_etag"), time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def mark_validated(self, entry: CachedUser) -> None:
+        entry.validated_at = time.monotonic()
+        self.record("revalidated")
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def record(self, counter: str, request_charge: float = 0.0) -> None:
+        with self._lock:
+            self._stats[counter] += 1
+            self._stats["request_charge"] += request_charge
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = sum(self._stats[name] for name in ("hits", "misses", "revalidated", "refreshed"))
+        return {**self._stats, "request_charge": round(self._stats["request_charge"], 2),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0, "entries": len(self._entries)}
+
+
+_user_cache = UserCache()
+
+
+def get_user_cache() -> UserCache:
+    return _user_cache
@@ -0,0 +1,122 @@
+# api/tools/backfill_thumbnails.py
+"""
+Backfill thumbnail derivatives for stories saved before thumbnails existed.
+
+For every story image and cover without `thumbnails`, downloads the stored
+image, renders the small/medium derivatives into the derivatives container
+and records their URLs on the story document. Uses the same settings as the
+function app (COSMOS_DB_CONNECTION_STRING, KEY_VAULT_URI or the storage
+environment variables).
+
+    python tools/backfill_thumbnails.py [--user-id ID] [--limit N] [--concurrency 4] [--dry-run]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from urllib.parse import unquote, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.services.blob_transfer import store_thumbnails, thumbnail_urls  # noqa: E402
+from shared.services.client_pool import get_client_pool  # noqa: E402
+from shared.services.config_service import get_config  # noqa: E402
+from shared.services.cosmos_service import CosmosService  # noqa: E402
+from shared.services.image_processing import spooled_file  # noqa: E402
+
+IMAGE_CONTAINER_NAME = "storyfairy-images"
+
+
+def blob_name_from_url(url: str) -> str:
+    return unquote(os.path.basename(urlparse(url).path))
+
+
+def pending_images(story):
+    """(entry, url key) for every image and cover of a story that has no thumbnails yet"""
+    for image in story.get("images") or []:
+        if image and image.get("imageUrl") and not image.get("thumbnails"):
+            yield image, "imageUrl"
+    for cover in (story.get("coverImages") or {}).values():
+        if cover and cover.get("url") and not cover.get("thumbnails"):
+            yield cover, "url"
+
+
+async def backfill_image(entry, url_key, service_client, dry_run: bool) -> bool:
+    blob_name = blob_name_from_url(entry[url_key])
+    if dry_run:
+        logging.info(f"Would create thumbnails for {blob_name}")
+        return True
+    source = spooled_file()
+    try:
+        downloader = await service_client.get_blob_client(IMAGE_CONTAINER_NAME, blob_name).download_blob()
+        async for chunk in downloader.chunks():
+            source.write(chunk)
+        entry["thumbnails"] = thumbnail_urls(await store_thumbnails(source, blob_name, service_client))
+        return True
+    except Exception as e:
+        logging.error(f"Error creating thumbnails for {blob_name}: {e}")
+        return False
+    finally:
+        source.close()
+
+
+async def run(user_id, limit, concurrency: int, dry_run: bool) -> dict:
+    config = await get_config()
+    cosmos_service = CosmosService()
+    service_client = get_client_pool().get_async_blob_service_client(config.storage_conn)
+    summary = {"stories": 0, "stories_updated": 0, "images": 0, "failed": 0, "dry_run": dry_run}
+
+    query = "SELECT * FROM c WHERE (NOT IS_DEFINED(c.type) OR c.type != 'storyJob')"
+    parameters = []
+    if user_id:
+        query += " AND c.userId = @userId"
+        parameters.append({"name": "@userId", "value": user_id})
+    stories = cosmos_service.stories_container.query_items(
+        query=query, parameters=parameters, max_item_count=max(concurrency * 2, 10)
+    )
+
+    async def backfill_story(story) -> None:
+        pending = list(pending_images(story))
+        if not pending:
+            return
+        results = await asyncio.gather(*(
+            backfill_image(entry, url_key, service_client, dry_run) for entry, url_key in pending
+        ))
+        summary["images"] += sum(results)
+        summary["failed"] += len(results) - sum(results)
+        if any(results) and not dry_run:
+            await cosmos_service.update_story(story)
+            summary["stories_updated"] += 1
+
+    # At most `concurrency` stories are held at once; the query is only read further as they finish
+    in_flight = set()
+    async for story in stories:
+        if limit is not None and summary["stories"] >= limit:
+            break
+        summary["stories"] += 1
+        in_flight.add(asyncio.create_task(backfill_story(story)))
+        if len(in_flight) >= concurrency:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    await get_client_pool().aclose()
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", help="only backfill this user's stories")
+    parser.add_argument("--limit", type=int, help="maximum number of stories to scan")
+    parser.add_argument("--concurrency", type=int, default=4, help="stories processed at once")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be backfilled")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(asyncio.run(run(args.user_id, args.limit, args.concurrency, args.dry_run)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# api/tools/provision_credit_transactions.py
+"""
+Provision the credit transactions container for paged transaction history.
+
+Creates the container partitioned by /user_id with the composite
+(user_id ASC, created_at DESC) index, or applies that indexing policy to the
+existing container. The partition key of an existing container cannot be
+changed; if it is not /user_id, pass --copy-to NAME to create a correctly
+partitioned container and stream every transaction into it, then set
+CREDIT_TRANSACTIONS_CONTAINER=NAME on the function app. Uses
+COSMOS_DB_CONNECTION_STRING like the function app.
+
+    python tools/provision_credit_transactions.py [--copy-to NAME] [--page-size 100] [--dry-run]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+from azure.cosmos import PartitionKey
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.services.client_pool import get_client_pool  # noqa: E402
+from shared.services.cosmos_service import (  # noqa: E402
+    CREDIT_TRANSACTIONS_CONTAINER, CREDIT_TRANSACTIONS_INDEXING_POLICY, CosmosService
+)
+
+PARTITION_KEY_PATH = "/user_id"
+
+
+async def ensure_container(database, name: str, dry_run: bool, summary: dict):
+    """Create the container, or bring the indexing policy of an existing one up to date"""
+    try:
+        properties = await database.get_container_client(name).read()
+    except CosmosResourceNotFoundError:
+        summary["created"] = not dry_run
+        if dry_run:
+            return None
+        return await database.create_container(
+            id=name,
+            partition_key=PartitionKey(path=PARTITION_KEY_PATH),
+            indexing_policy=CREDIT_TRANSACTIONS_INDEXING_POLICY
+        )
+
+    partition_path = properties["partitionKey"]["paths"][0]
+    summary["partition_key"] = partition_path
+    composite = properties.get("indexingPolicy", {}).get("compositeIndexes", [])
+    if composite != CREDIT_TRANSACTIONS_INDEXING_POLICY["compositeIndexes"] and not dry_run:
+        # Index transformation runs in the background on the service; queries keep working meanwhile
+        await database.replace_container(
+            name,
+            partition_key=PartitionKey(path=partition_path),
+            indexing_policy=CREDIT_TRANSACTIONS_INDEXING_POLICY
+        )
+        summary["indexing_policy_updated"] = True
+    return database.get_container_client(name)
+
+
+async def copy_transactions(source, target, page_size: int, dry_run: bool, summary: dict) -> None:
+    pages = source.query_items(query="SELECT * FROM c", max_item_count=page_size).by_page()
+    async for page in pages:
+        async for item in page:
+            summary["copied"] += 1
+            if dry_run:
+                continue
+            document = {key: value for key, value in item.items() if not key.startswith("_")}
+            try:
+                await target.upsert_item(body=document)
+            except Exception as e:
+                summary["failed"] += 1
+                logging.error(f"Error copying transaction {item.get('id')}: {e}")
+            if summary["copied"] % 1000 == 0:
+                logging.info(f"Copied {summary['copied']} transactions")
+
+
+async def run(copy_to, page_size: int, dry_run: bool) -> dict:
+    cosmos_service = CosmosService()
+    summary = {"container": CREDIT_TRANSACTIONS_CONTAINER, "created": False, "indexing_policy_updated": False,
+               "partition_key": PARTITION_KEY_PATH, "copied": 0, "failed": 0, "dry_run": dry_run}
+    try:
+        await ensure_container(cosmos_service.database, CREDIT_TRANSACTIONS_CONTAINER, dry_run, summary)
+        if summary["partition_key"] != PARTITION_KEY_PATH and not copy_to:
+            logging.warning(f"{CREDIT_TRANSACTIONS_CONTAINER} is partitioned by {summary['partition_key']}; "
+                            f"use --copy-to to migrate into a container partitioned by {PARTITION_KEY_PATH}")
+
+        if copy_to:
+            target_summary = {"created": False, "indexing_policy_updated": False, "partition_key": PARTITION_KEY_PATH}
+            target = await ensure_container(cosmos_service.database, copy_to, dry_run, target_summary)
+            if target_summary["partition_key"] != PARTITION_KEY_PATH:
+                raise ValueError(f"{copy_to} exists and is partitioned by {target_summary['partition_key']}")
+            summary["copy_to"] = {"container": copy_to, **target_summary}
+            await copy_transactions(cosmos_service.transaction_container, target, page_size, dry_run, summary)
+    finally:
+        await get_client_pool().aclose()
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copy-to", help="copy every transaction into this container (partitioned by /user_id)")
+    parser.add_argument("--page-size", type=int, default=100, help="documents fetched per page when copying")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(asyncio.run(run(args.copy_to, args.page_size, args.dry_run)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# api/tools/rebuild_story_summaries.py
+"""
+Rebuild the StorySummaries index from UserStories.
+
+Creates the container (partition key /userId) if needed, then streams every
+story document page by page and upserts its summary, so the full documents
+are never held in memory together. With --prune, summaries whose story no
+longer exists are deleted afterwards (this keeps every story id in memory;
+summaries not seen in the scan are checked with a point read first).
+Uses COSMOS_DB_CONNECTION_STRING like the function app.
+
+Story lists keep reading UserStories until STORY_SUMMARIES_READ=true is set
+on the function app; set it only after this has completed without failures.
+
+    python tools/rebuild_story_summaries.py [--user-id ID] [--page-size 100] [--prune] [--dry-run]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+from azure.cosmos import PartitionKey
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.services.client_pool import get_client_pool  # noqa: E402
+from shared.services.cosmos_service import STORY_SUMMARIES_CONTAINER, CosmosService, story_summary  # noqa: E402
+
+
+async def iter_documents(container, query: str, parameters: list, page_size: int):
+    """Yield query results one page at a time instead of materialising them"""
+    pages = container.query_items(query=query, parameters=parameters, max_item_count=page_size).by_page()
+    async for page in pages:
+        async for item in page:
+            yield item
+
+
+async def run(user_id, page_size: int, prune: bool, dry_run: bool) -> dict:
+    cosmos_service = CosmosService()
+    summary = {"stories": 0, "upserted": 0, "failed": 0, "pruned": 0, "dry_run": dry_run}
+    if not dry_run:
+        cosmos_service.summaries_container = await cosmos_service.database.create_container_if_not_exists(
+            id=STORY_SUMMARIES_CONTAINER, partition_key=PartitionKey(path="/userId")
+        )
+
+    query = "SELECT * FROM c WHERE (NOT IS_DEFINED(c.type) OR c.type != 'storyJob')"
+    parameters = []
+    if user_id:
+        query += " AND c.userId = @userId"
+        parameters.append({"name": "@userId", "value": user_id})
+
+    story_keys = set()
+    async for story in iter_documents(cosmos_service.stories_container, query, parameters, page_size):
+        summary["stories"] += 1
+        story_keys.add((story["id"], story["userId"]))
+        if dry_run:
+            continue
+        try:
+            await cosmos_service.summaries_container.upsert_item(body=story_summary(story))
+            summary["upserted"] += 1
+        except Exception as e:
+            summary["failed"] += 1
+            logging.error(f"Error writing the summary of story {story.get('id')}: {e}")
+        if summary["stories"] % 1000 == 0:
+            logging.info(f"Processed {summary['stories']} stories")
+
+    if prune:
+        summary_query = "SELECT c.id, c.userId FROM c" + (" WHERE c.userId = @userId" if user_id else "")
+        async for item in iter_documents(cosmos_service.summaries_container, summary_query, parameters, page_size):
+            if (item["id"], item["userId"]) in story_keys:
+                continue
+            # Stories created since the scan above are not in story_keys; only a missing story is pruned
+            try:
+                await cosmos_service.stories_container.read_item(item=item["id"], partition_key=item["userId"])
+                continue
+            except CosmosResourceNotFoundError:
+                pass
+            summary["pruned"] += 1
+            if not dry_run:
+                try:
+                    await cosmos_service.summaries_container.delete_item(item=item["id"], partition_key=item["userId"])
+                except CosmosResourceNotFoundError:
+                    pass
+    await get_client_pool().aclose()
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", help="only rebuild this user's summaries")
+    parser.add_argument("--page-size", type=int, default=100, help="documents fetched per page")
+    parser.add_argument("--prune", action="store_true", help="delete summaries of stories that no longer exist")
+    parser.add_argument("--dry-run", action="store_true", help="count what would be written without writing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(asyncio.run(run(args.user_id, args.page_size, args.prune, args.dry_run)), indent=2))
+
+
+if __name__ == "__main__":
+    main()